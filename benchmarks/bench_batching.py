@@ -0,0 +1,85 @@
+"""Packets and bytes saved by server-side message batching.
+
+Replays a burst of room messages through the unbatched path and through
+MessageBatcher, encoding exactly what the server would put on the wire
+(Socket.IO EVENT packets) for every recipient.
+
+    python benchmarks/bench_batching.py --recipients 50 --messages 500 --window-ms 10 --rate 2000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from socketio import packet
+from server.encryption import generate_aes_key, encrypt_aes_raw
+from server.envelope import pack_envelope, KIND_ROOM
+from server.batching import MessageBatcher, CODECS, available_codec
+
+SAMPLE_TEXTS = ["hey", "anyone around?", "deploy is done, check the dashboard :tada:",
+                "lunch in 10", "I pushed the fix for the upload bug, please review"]
+
+
+def wire_size(event, data):
+    # Binary payloads go out as a placeholder packet plus one attachment each
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return sum(len(part) for part in encoded)
+
+
+def run(recipients, messages, window_ms, rate, codec):
+    keys = [generate_aes_key() for _ in range(recipients)]
+    envelopes = [pack_envelope(KIND_ROOM, i + 1, 1700000000000 + i, 'alice', 'Global', SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)])
+                 for i in range(messages)]
+
+    # Unbatched: one packet per message per recipient
+    plain_packets = plain_bytes = 0
+    for envelope in envelopes:
+        for key in keys:
+            plain_packets += 1
+            plain_bytes += wire_size('incoming_global_message', {'envelope': encrypt_aes_raw(key, envelope)})
+
+    # Batched: messages arriving within one window share a packet
+    sent = {'packets': 0, 'bytes': 0}
+
+    def deliver(sid, payload, used_codec, count, tags):
+        sent['packets'] += 1
+        sent['bytes'] += wire_size('incoming_global_message',
+                                   {'batch': encrypt_aes_raw(keys[sid], payload), 'codec': used_codec, 'count': count})
+
+    batcher = MessageBatcher(deliver, spawn=lambda *a: None, sleep=lambda s: None, window_ms=window_ms, codec=codec)
+    per_window = max(1, int(rate * window_ms / 1000))
+    for start in range(0, messages, per_window):
+        for envelope in envelopes[start:start + per_window]:
+            for sid in range(recipients):
+                batcher.add(sid, envelope)
+        for sid in range(recipients):
+            batcher.flush(sid)
+
+    return plain_packets, plain_bytes, sent['packets'], sent['bytes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--window-ms', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=2000, help="messages/sec arriving at the server")
+    args = parser.parse_args()
+
+    print(f"{args.messages} messages x {args.recipients} recipients, {args.window_ms}ms window, {args.rate:.0f} msg/s")
+    print(f"{'codec':<6} {'packets':>10} {'bytes':>12} {'packets saved':>14} {'bytes saved':>12}")
+    for codec in CODECS:
+        if available_codec(codec) != codec:
+            print(f"{codec:<6} (not installed)")
+            continue
+        plain_packets, plain_bytes, packets, size = run(args.recipients, args.messages, args.window_ms, args.rate, codec)
+        if codec == CODECS[0]:
+            print(f"{'off':<6} {plain_packets:>10} {plain_bytes:>12} {'-':>14} {'-':>12}")
+        print(f"{codec:<6} {packets:>10} {size:>12} {1 - packets / plain_packets:>13.1%} {1 - size / plain_bytes:>11.1%}")
+
+
+if __name__ == '__main__':
+    main()
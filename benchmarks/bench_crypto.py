@@ -0,0 +1,188 @@
+"""Throughput of server/encryption.py, with a baseline to catch regressions.
+
+Measures each primitive the chat path uses across payload sizes and key
+types: AES-CBC on raw bytes and with the base64 layer used for text, the
+base64 layer on its own, and RSA-OAEP key wrapping for each key size. Every
+case runs with 1..N threads, so the table doubles as a thread-scaling curve.
+Numbers are ops/sec and MB/s in total and per thread (per core when threads
+do not exceed cores).
+
+    python benchmarks/bench_crypto.py                        # print the table
+    python benchmarks/bench_crypto.py --save baseline.json   # record a baseline
+    python benchmarks/bench_crypto.py --compare benchmarks/baselines/crypto.json --threshold 0.15
+
+--compare exits with status 1 if any case is slower than the baseline by more
+than the threshold, so it can gate crypto changes in CI. Baselines are only
+comparable on the same machine: record one from the parent commit first.
+Baselines are not committed, and --compare refuses (status 2) a baseline whose
+CPU count, platform or Python version differ from this machine's unless
+--any-machine is given.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+from server.encryption import (encrypt_aes, decrypt_aes, encrypt_aes_raw, decrypt_aes_raw,
+                               encrypt_rsa, decrypt_rsa, generate_aes_key)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "crypto.json")
+PAYLOAD_SIZES = {'64B': 64, '1KB': 1024, '48KB': 49152, '1MB': 1024 * 1024}  # 48KB is one upload chunk
+AES_KEYS = {'aes128': 16, 'aes256': 32}    # generate_aes_key() makes 256-bit keys
+RSA_KEYS = (2048, 3072, 4096)              # The server key is 2048-bit
+THREADS = (1, 2, 4)
+THRESHOLD = 0.15                           # Allowed slowdown before --compare fails
+
+
+def aes_cases():
+    for key_name, key_size in AES_KEYS.items():
+        key = os.urandom(key_size)
+        for size_name, size in PAYLOAD_SIZES.items():
+            data = os.urandom(size)
+            text = base64.b64encode(data[:size * 3 // 4]).decode()[:size]  # Text messages are str
+            raw = encrypt_aes_raw(key, data)
+            wrapped = encrypt_aes(key, text)
+            yield f"encrypt_aes_raw/{key_name}/{size_name}", size, lambda k=key, d=data: encrypt_aes_raw(k, d)
+            yield f"decrypt_aes_raw/{key_name}/{size_name}", size, lambda k=key, r=raw: decrypt_aes_raw(k, r)
+            yield f"encrypt_aes/{key_name}/{size_name}", size, lambda k=key, t=text: encrypt_aes(k, t)
+            yield f"decrypt_aes/{key_name}/{size_name}", size, lambda k=key, w=wrapped: decrypt_aes(k, w)
+
+
+def base64_cases():
+    for size_name, size in PAYLOAD_SIZES.items():
+        data = os.urandom(size)
+        encoded = base64.b64encode(data)
+        yield f"b64encode/-/{size_name}", size, lambda d=data: base64.b64encode(d)
+        yield f"b64decode/-/{size_name}", size, lambda e=encoded: base64.b64decode(e)
+
+
+def rsa_cases():
+    session_key = generate_aes_key()  # RSA only ever wraps a 32-byte AES key
+    for bits in RSA_KEYS:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+        public_key = private_key.public_key()
+        wrapped = encrypt_rsa(public_key, session_key)
+        yield f"encrypt_rsa/rsa{bits}/32B", 32, lambda p=public_key: encrypt_rsa(p, session_key)
+        yield f"decrypt_rsa/rsa{bits}/32B", 32, lambda p=private_key, w=wrapped: decrypt_rsa(p, w)
+
+
+def measure(op, threads, seconds):
+    """Total ops/sec with `threads` threads calling op in a loop for `seconds`."""
+    counts = [0] * threads
+    start_gate = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(index):
+        start_gate.wait()
+        done = 0
+        while not stop.is_set():
+            op()
+            done += 1
+        counts[index] = done
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_gate.wait()
+    started = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def run(cases, threads, seconds, repeat):
+    """{case/tN: {'ops', 'mbps', 'per_thread_ops'}}, best of `repeat` runs to damp noise."""
+    results = {}
+    for name, size, op in cases:
+        op()  # Warm up (and fail early on a broken primitive)
+        for count in threads:
+            ops = max(measure(op, count, seconds) for _ in range(repeat))
+            results[f"{name}/t{count}"] = {'ops': round(ops, 1), 'mbps': round(ops * size / 1e6, 2),
+                                           'per_thread_ops': round(ops / count, 1)}
+            print(f"{name:<32} {count:>3} {ops:>12,.0f} {ops / count:>12,.0f} {ops * size / 1e6:>10.1f}", flush=True)
+    return results
+
+
+def machine_info():
+    return {'cpus': os.cpu_count(), 'python': platform.python_version(), 'platform': platform.platform()}
+
+
+def machine_mismatch(baseline):
+    """Fields of the baseline's machine that differ from this one, as (field, baseline value, current value)."""
+    recorded = baseline.get('machine', {})
+    return [(key, recorded.get(key), value) for key, value in machine_info().items() if recorded.get(key) != value]
+
+
+def compare(results, baseline, threshold):
+    """Cases slower than the baseline by more than threshold, as (case, baseline ops, ops, change)."""
+    regressions = []
+    for case, old in baseline['results'].items():
+        new = results.get(case)
+        if new is None:
+            continue
+        change = new['ops'] / old['ops'] - 1
+        if change < -threshold:
+            regressions.append((case, old['ops'], new['ops'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=list(THREADS))
+    parser.add_argument("--seconds", type=float, default=0.3, help="measuring time per case and thread count")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run cases whose name contains this, e.g. decrypt_aes or rsa2048")
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", nargs="?", const=BASELINE_PATH,
+                        help=f"fail on regressions against a baseline (default {os.path.relpath(BASELINE_PATH)})")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--any-machine", action="store_true",
+                        help="compare against a baseline recorded on a different machine, with a warning")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        if not os.path.isfile(args.compare):
+            sys.exit(f"No baseline at {args.compare}: record one with --save on this machine first")
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        mismatch = machine_mismatch(baseline)
+        for key, recorded, current in mismatch:
+            print(f"WARNING: baseline {key} is {recorded!r}, this machine has {current!r}")
+        if mismatch and not args.any_machine:
+            print("Baseline was recorded on another machine; re-record it with --save, or pass --any-machine")
+            sys.exit(2)
+
+    cases = [case for group in (aes_cases(), base64_cases(), rsa_cases()) for case in group
+             if not args.only or args.only in case[0]]
+    print(f"{os.cpu_count()} CPUs, {args.seconds}s x best of {args.repeat} per point\n")
+    print(f"{'case':<32} {'thr':>3} {'ops/s':>12} {'ops/s/thr':>12} {'MB/s':>10}")
+    results = run(cases, args.threads, args.seconds, args.repeat)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({'machine': machine_info(), 'seconds': args.seconds, 'results': results}, f, indent=1, sort_keys=True)
+        print(f"\nSaved {len(results)} results to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\nCompared {len(set(results) & set(baseline['results']))} cases against {args.compare}")
+        for case, old, new, change in regressions:
+            print(f"  REGRESSION {case}: {old:,.0f} -> {new:,.0f} ops/s ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"  No case slower than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""End-to-end file transfer throughput: upload, then download, through the real protocol.
+
+Each client joins like the GUI does (exchange_key, user_joined), uploads a
+file of random bytes with start_upload / upload_chunk / finish_upload, waits
+for the server's file notice, then downloads it back with download_request
+into a DownloadWriter (the client's save_file_stream path) and checks the
+hash. With several clients all uploads run at once, then all downloads.
+
+    python benchmarks/bench_file_transfer.py --sizes 1MB 64MB 512MB --clients 1 4
+    python benchmarks/bench_file_transfer.py --sizes 2GB --clients 1
+
+Reported per phase: aggregate MB/s (file bytes / wall time), time to first
+byte (upload: start_upload accepted; download: first chunk received), server
+CPU seconds and utilisation, the server's peak RSS, and the utilisation of
+the benchmark process running the clients.
+
+The server runs in a child process (same ChatServer, same code path) so its
+CPU and memory are measured apart from the clients'; reading them needs
+Linux /proc. The per-session upload limits (upload_chunk events/sec and the
+2 MB/s byte bucket) would otherwise cap every run at the limit rather than
+the pipeline, so they are lifted unless --production-limits is given. Clients
+keep a bounded send window instead of the GUI's fixed bandwidth pacing.
+"""
+import argparse
+import base64
+import hashlib
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'client'))
+
+from bench_transport import free_port
+from server.transport import CHUNK_SIZE
+
+SIZES = ("1MB", "16MB", "64MB")
+CLIENTS = (1, 4)
+SEND_WINDOW = 8            # Packets a client may have queued before it waits; pongs queue behind them
+PHASE_TIMEOUT = 3600       # Seconds before a transfer is declared stuck
+UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+# --- Server side (child process) ---
+def serve(port, workdir, production_limits):
+    from logs.db_logger import configure
+    configure(db_path=os.path.join(workdir, "bench_logs.db"), batch_size=100)  # Keep the real log clean
+    import eventlet
+    import eventlet.wsgi
+    import server.server
+    from server.quotas import UploadQuotas
+
+    rate_limits = None
+    if not production_limits:
+        server.server.UPLOAD_RATE = server.server.UPLOAD_BURST = 1 << 40
+        from server.ratelimit import EVENT_LIMITS
+        rate_limits = dict(EVENT_LIMITS, upload_chunk=(1e9, 1e9), download_request=(1e9, 1e9))
+    chat = server.server.ChatServer(inbox_path=":memory:", snapshot_path=os.path.join(workdir, "snapshot.json"),
+                                    upload_folder=os.path.join(workdir, "uploads"),
+                                    private_key_path=os.path.join(workdir, "private_key.pem"),
+                                    rate_limits=rate_limits)
+    chat.quotas = UploadQuotas(chat.upload_folder, max_file_size=1 << 40, user_quota=1 << 40,
+                               global_quota=1 << 40, min_free_disk=0)
+    eventlet.wsgi.server(eventlet.listen(('127.0.0.1', port)), chat.app, log_output=False)
+
+
+def start_server(workdir, production_limits):
+    shutil.copy(os.path.join(ROOT, "server", "private_key.pem"), workdir)
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONWARNINGS="ignore")
+    args = [sys.executable, os.path.abspath(__file__), "--serve", str(port), workdir]
+    if production_limits:
+        args.append("--production-limits")
+    child = subprocess.Popen(args, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import socket
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return child, port
+        except OSError:
+            time.sleep(0.05)
+    child.kill()
+    raise RuntimeError("server did not start")
+
+
+def process_cpu(pid):
+    """User + system CPU seconds of a process, or None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss(pid):
+    """Peak resident set size in MB (VmHWM), or None off Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# --- Client side ---
+class BenchClient:
+    """A headless client speaking the GUI's join, upload and download protocol."""
+
+    def __init__(self, url, username, public_key, chunk_size=CHUNK_SIZE):
+        import socketio
+        from server.encryption import encrypt_rsa, generate_aes_key
+
+        self.username = username
+        self.chunk_size = chunk_size
+        self.notices = {}          # file_id -> Event set when the server announces the finished upload
+        self.failures = {}         # transfer_id -> reason
+        self.downloads = {}        # transfer_id -> {'writer', 'first_byte'}
+        self.lock = threading.Lock()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('incoming_global_file', self.on_file_notice)
+        self.sio.on('upload_aborted', lambda data: self.fail(data.get('transfer_id'), data.get('reason')))
+        self.sio.on('retry_sending', lambda data: self.fail(data.get('transfer_id'), 'hash_mismatch'))
+        self.sio.on('incoming_file_chunk', self.on_chunk)
+        self.sio.on('finish_download', self.on_finish_download)
+        self.sio.on('disconnect', self.on_disconnect)
+
+        self.sio.connect(url, transports=['websocket'], wait_timeout=10)
+        encrypted = base64.b64encode(encrypt_rsa(public_key, generate_aes_key())).decode()
+        self.sio.call('exchange_key', {'encrypted_aes': encrypted})
+        reply = self.sio.call('user_joined', {'username': username}) or {}
+        if reply.get('status') != 'ok':
+            raise RuntimeError(f"join failed: {reply}")
+
+    def notice(self, file_id):
+        with self.lock:
+            return self.notices.setdefault(file_id, threading.Event())
+
+    def on_file_notice(self, data):
+        self.notice(data.get('file_id', '')).set()
+
+    def fail(self, transfer_id, reason):
+        self.failures[transfer_id] = reason
+        self.notice(transfer_id).set()
+
+    def on_disconnect(self, *args):
+        # Fail whatever is in flight instead of waiting for the phase timeout
+        with self.lock:
+            pending = [file_id for file_id, event in self.notices.items() if not event.is_set()]
+        for file_id in pending:
+            self.fail(file_id, 'disconnected')
+        for download in list(self.downloads.values()):
+            download['writer'].abort()
+
+    def upload(self, path, transfer_id, ready=None):
+        """Send a file; returns time to the start_upload ack in seconds.
+
+        ready (a Barrier) holds the chunks back until every client's upload was
+        admitted: one busy WebSocket can starve another's start_upload for long.
+        """
+        start = time.perf_counter()
+        reply = self.sio.call('start_upload', {'transfer_id': transfer_id, 'filename': os.path.basename(path),
+                                               'filesize': os.path.getsize(path), 'sender': self.username,
+                                               'recipient': 'Global'}, timeout=30) or {}
+        if reply.get('status') != 'ok':
+            raise RuntimeError(f"upload refused: {reply.get('reason')}")
+        ttfb = time.perf_counter() - start
+        self.notice(transfer_id)  # Registered now, so a disconnect can fail it
+        if ready is not None:
+            ready.wait()
+
+        digest = hashlib.sha256()
+        outgoing = self.sio.eio.queue
+        with open(path, "rb") as file:
+            while True:
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    break
+                while outgoing.qsize() > SEND_WINDOW:
+                    time.sleep(0.0005)
+                self.sio.emit('upload_chunk', {'transfer_id': transfer_id, 'compressed': False,
+                                               'chunk_data': base64.b64encode(chunk).decode()})
+                digest.update(chunk)
+        self.sio.emit('finish_upload', {'transfer_id': transfer_id, 'filename': os.path.basename(path),
+                                        'sender': self.username, 'recipient': 'Global',
+                                        'hash_file': digest.hexdigest(), 'time': ''})
+        if not self.notice(transfer_id).wait(PHASE_TIMEOUT) or transfer_id in self.failures:
+            raise RuntimeError(f"upload failed: {self.failures.get(transfer_id, 'timeout')}")
+        return ttfb
+
+    def on_chunk(self, data):
+        download = self.downloads.get(data.get('transfer_id', ''))
+        if download:
+            if download['first_byte'] is None:
+                download['first_byte'] = time.perf_counter()
+            download['writer'].put_chunk(data.get('offset', 0), base64.b64decode(data['chunk_data']),
+                                         data.get('filesize', 0))
+
+    def on_finish_download(self, data):
+        download = self.downloads.get(data.get('transfer_id', ''))
+        if download:
+            download['writer'].finish(data.get('hash_file', ''), data.get('filesize'))
+
+    def download(self, file_id, filename, save_path):
+        """Fetch a stored file through DownloadWriter; returns time to first chunk in seconds."""
+        from download_writer import DownloadWriter, QUEUE_CHUNKS
+        from transfer_manager import new_transfer_id
+
+        transfer_id = new_transfer_id()
+        ack = lambda written: self.sio.emit('download_ack', {'transfer_id': transfer_id, 'offset': written})
+        writer = DownloadWriter(filename, save_path, file_id=file_id, on_progress=ack)
+        download = self.downloads[transfer_id] = {'writer': writer, 'first_byte': None}
+        start = time.perf_counter()
+        self.sio.emit('download_request', {'file_id': file_id, 'filename': filename,
+                                           'transfer_id': transfer_id, 'offset': 0, 'window': QUEUE_CHUNKS})
+        ok = download['writer'].run()
+        self.downloads.pop(transfer_id, None)
+        if not ok:
+            raise RuntimeError("download failed verification")
+        return download['first_byte'] - start
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def make_file(path, size):
+    with open(path, "wb") as f:
+        remaining = size
+        block = os.urandom(min(size, 4 * 1024 * 1024))  # Random, so nothing compresses
+        while remaining:
+            f.write(block[:remaining])
+            remaining -= min(remaining, len(block))
+
+
+def phase(clients, work):
+    """Run work(index, client) on every client at once. Returns (wall seconds, per-client results)."""
+    results, errors = [None] * len(clients), []
+
+    def run(index, client):
+        try:
+            results[index] = work(index, client)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, c)) for i, c in enumerate(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return time.perf_counter() - start, results
+
+
+def measure(pid, clients, work, total_bytes):
+    cpu_before, client_before = process_cpu(pid), time.process_time()
+    wall, ttfbs = phase(clients, work)
+    cpu_after, client_cpu = process_cpu(pid), time.process_time() - client_before
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {'mbps': total_bytes / wall / 1e6, 'ttfb_ms': statistics.median(ttfbs) * 1000, 'cpu': cpu,
+            'cpu_pct': cpu / wall * 100 if cpu is not None else None, 'rss': peak_rss(pid), 'wall': wall,
+            'client_pct': client_cpu / wall * 100}
+
+
+def run(size, count, production_limits):
+    from server.encryption import load_rsa_public_key
+    from transfer_manager import new_transfer_id
+
+    workdir = tempfile.mkdtemp(prefix="bench_transfer_")
+    child, port = start_server(workdir, production_limits)
+    clients = []
+    try:
+        public_key = load_rsa_public_key(os.path.join(ROOT, "client", "public_key.pem"))
+        clients = [BenchClient(f"http://127.0.0.1:{port}", f"bench{i}", public_key) for i in range(count)]
+        sources = []
+        for i in range(count):
+            path = os.path.join(workdir, f"source{i}.bin")
+            make_file(path, size)
+            sources.append((path, new_transfer_id()))
+        os.makedirs(os.path.join(workdir, "downloads"))
+
+        admitted = threading.Barrier(count)
+        up = measure(child.pid, clients, lambda i, c: c.upload(*sources[i], ready=admitted), size * count)
+        down = measure(child.pid, clients,
+                       lambda i, c: c.download(sources[i][1], os.path.basename(sources[i][0]),
+                                               os.path.join(workdir, "downloads", f"copy{i}.bin")),
+                       size * count)
+        return up, down
+    finally:
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        child.kill()
+        child.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def format_row(label, r):
+    cpu = f"{r['cpu']:>7.2f}s {r['cpu_pct']:>5.0f}%" if r['cpu'] is not None else f"{'n/a':>14}"
+    rss = f"{r['rss']:>8.0f}MB" if r['rss'] is not None else f"{'n/a':>10}"
+    return f"{label:<24} {r['mbps']:>9.1f} {r['ttfb_ms']:>9.1f}ms {cpu} {rss} {r['client_pct']:>9.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), help="file sizes, e.g. 1MB 512MB 2GB")
+    parser.add_argument("--clients", type=int, nargs="+", default=list(CLIENTS), help="concurrent client counts")
+    parser.add_argument("--production-limits", action="store_true",
+                        help="keep the server's per-session upload rate limits")
+    parser.add_argument("--serve", nargs=2, metavar=("PORT", "WORKDIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(int(args.serve[0]), args.serve[1], args.production_limits)
+        return
+
+    print(f"{CHUNK_SIZE // 1024}KB chunks, websocket, "
+          f"{'production' if args.production_limits else 'lifted'} upload limits\n")
+    print(f"{'run':<24} {'MB/s':>9} {'ttfb p50':>11} {'server cpu':>14} {'peak rss':>10} {'client cpu':>10}")
+    for size_text in args.sizes:
+        for count in args.clients:
+            label = f"{size_text} x{count}"
+            try:
+                up, down = run(parse_size(size_text), count, args.production_limits)
+            except RuntimeError as e:
+                # A saturated server can miss pings and drop clients; report it and go on
+                print(f"{label:<24} failed: {e}", flush=True)
+                continue
+            print(format_row(f"{label} upload", up))
+            print(format_row(f"{label} download", down), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Connect latency and per-message overhead for each transport mode.
+
+Starts a ChatServer per configuration in a child process and talks to it
+through a byte-counting TCP proxy, so the byte counts include everything on
+the wire: HTTP requests and headers for polling, the polling handshake and
+upgrade for "upgrade", WebSocket framing and pings otherwise.
+
+    python benchmarks/bench_transport.py --connects 20 --messages 500
+    python benchmarks/bench_transport.py --modes websocket polling --compression
+
+The Python client (websocket-client) never offers permessage-deflate, so
+--compression only changes the polling rows (HTTP response compression);
+WebSocket frame compression only applies to browser clients.
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from server.transport import TRANSPORT_MODES, transports
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(port, mode, compression):
+    """Child process: run a ChatServer with the given transport settings."""
+    import logs.db_logger
+    logs.db_logger.DB_PATH = os.path.join(os.getcwd(), "bench_logs.db")  # Keep the real log clean
+    import eventlet
+    import eventlet.wsgi
+    from server.server import ChatServer
+    server = ChatServer(inbox_path=":memory:", snapshot_path=os.path.join(os.getcwd(), "snapshot.json"),
+                        rate_limits={'list_rooms': (1e9, 1e9)}, transport_mode=mode, compression=compression)
+    eventlet.wsgi.server(eventlet.listen(('127.0.0.1', port)), server.app, log_output=False)
+
+
+class CountingProxy:
+    """Forwards one local port to the server and counts bytes in both directions."""
+
+    def __init__(self, target_port):
+        self.target_port = target_port
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(64)
+        self.port = self.listener.getsockname()[1]
+        self.sent = self.received = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            total = self.sent + self.received
+            self.sent = self.received = 0
+        return total
+
+    def accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.pump, args=(client, upstream, 'sent'), daemon=True).start()
+            threading.Thread(target=self.pump, args=(upstream, client, 'received'), daemon=True).start()
+
+    def pump(self, src, dst, counter):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                with self.lock:
+                    setattr(self, counter, getattr(self, counter) + len(data))
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def start_server(mode, compression):
+    workdir = tempfile.mkdtemp(prefix="bench_transport_")
+    shutil.copy(os.path.join(ROOT, "server", "private_key.pem"), workdir)
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONWARNINGS="ignore")
+    args = [sys.executable, os.path.abspath(__file__), "--serve", str(port), mode]
+    if compression:
+        args.append("--compression")
+    child = subprocess.Popen(args, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return child, port, workdir
+        except OSError:
+            time.sleep(0.05)
+    child.kill()
+    raise RuntimeError("server did not start")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode, compression, connects, messages):
+    import socketio
+
+    child, port, workdir = start_server(mode, compression)
+    proxy = CountingProxy(port)
+    url = f"http://127.0.0.1:{proxy.port}"
+    try:
+        # Connect latency: until the Socket.IO namespace is connected
+        times = []
+        proxy.reset()
+        for _ in range(connects):
+            client = socketio.Client(reconnection=False)
+            start = time.perf_counter()
+            client.connect(url, transports=transports(mode), wait_timeout=10)
+            if mode == "upgrade":
+                # Count the upgrade too: that is when the connection is fully set up
+                while client.eio.current_transport != "websocket":
+                    time.sleep(0.001)
+            times.append((time.perf_counter() - start) * 1000)
+            client.disconnect()
+        time.sleep(0.2)
+        connect_bytes = proxy.reset() / connects
+
+        # Per-message cost: one event and its ack on an established connection
+        client = socketio.Client(reconnection=False)
+        client.connect(url, transports=transports(mode), wait_timeout=10)
+        time.sleep(0.5)  # Let an upgrade finish
+        proxy.reset()
+        rtts = []
+        for _ in range(messages):
+            start = time.perf_counter()
+            client.call('list_rooms', timeout=10)
+            rtts.append((time.perf_counter() - start) * 1000)
+        message_bytes = proxy.reset() / messages
+        client.disconnect()
+    finally:
+        child.kill()
+        child.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'connect_p50': statistics.median(times), 'connect_p95': percentile(times, 0.95),
+            'connect_bytes': connect_bytes, 'rtt_p50': statistics.median(rtts),
+            'rtt_p95': percentile(rtts, 0.95), 'message_bytes': message_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=list(TRANSPORT_MODES), choices=list(TRANSPORT_MODES))
+    parser.add_argument("--connects", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--compression", action="store_true", help="also run with compression enabled")
+    parser.add_argument("--serve", nargs=2, metavar=("PORT", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(int(args.serve[0]), args.serve[1], args.compression)
+        return
+
+    configs = [(mode, False) for mode in args.modes]
+    if args.compression:
+        configs += [(mode, True) for mode in args.modes]
+
+    print(f"{args.connects} connects, {args.messages} request/ack round trips per configuration\n")
+    print(f"{'mode':<10} {'deflate':<8} {'connect p50':>12} {'p95':>8} {'bytes/connect':>14} "
+          f"{'rtt p50':>9} {'p95':>8} {'bytes/msg':>10}")
+    for mode, compression in configs:
+        r = run(mode, compression, args.connects, args.messages)
+        print(f"{mode:<10} {'on' if compression else 'off':<8} {r['connect_p50']:>10.2f}ms {r['connect_p95']:>6.2f}ms "
+              f"{r['connect_bytes']:>14.0f} {r['rtt_p50']:>7.3f}ms {r['rtt_p95']:>6.3f}ms {r['message_bytes']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
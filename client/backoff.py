@@ -0,0 +1,13 @@
+import random
+
+# Delays between attempts to reach the server. Exponential so a server that is
+# down is not hammered, and jittered ("full jitter": anywhere between zero and
+# the cap) so clients that lost the same server do not all come back in step.
+
+CONNECT_BACKOFF_BASE = 0.5     # Seconds; cap for the first retry
+CONNECT_BACKOFF_MAX = 30.0     # Cap never grows past this
+
+
+def backoff_delay(attempt, base=CONNECT_BACKOFF_BASE, cap=CONNECT_BACKOFF_MAX, rand=random.random):
+    """Seconds to wait before retry number attempt (0 for the first retry)."""
+    return rand() * min(cap, base * (2 ** attempt))
@@ -0,0 +1,52 @@
+import os
+import sys
+from dataclasses import dataclass
+
+from transfer_manager import MAX_CONCURRENT, DEFAULT_BANDWIDTH
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.config import setting, load_config, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
+from server.transport import TRANSPORT_MODES, TRANSPORT_MODE, CHUNK_SIZE
+
+# Client settings: the [client] section of chatspace.ini, CHATSPACE_CLIENT_*
+# environment variables or command-line flags (see server/config.py).
+
+SERVER_API_URL = "http://localhost:8080"
+PUBLIC_KEY_PATH = "public_key.pem"   # Server public key, loaded on the first key exchange
+UPLOAD_RESUME_WAIT = 60              # Seconds an upload waits for a restarted server to resume it
+
+
+@dataclass
+class ClientConfig:
+    SECTION = "client"
+
+    server_url: str = setting(SERVER_API_URL, "chat server to connect to")
+    transport_mode: str = setting(TRANSPORT_MODE, "websocket, upgrade or polling; must match the server")
+    chunk_size: int = setting(CHUNK_SIZE, "bytes per upload chunk; clamped to the server's chunk_size")
+    public_key_path: str = setting(PUBLIC_KEY_PATH, "server RSA public key")
+    bandwidth: int = setting(DEFAULT_BANDWIDTH, "bytes/sec shared by all transfers, 0 for unlimited")
+    max_concurrent: int = setting(MAX_CONCURRENT, "transfers running at once")
+    upload_resume_wait: float = setting(UPLOAD_RESUME_WAIT, "seconds an upload waits for a restarted server")
+    e2e: bool = setting(False, "end-to-end encrypt messages")
+
+    def validate(self):
+        errors = []
+        if not self.server_url.startswith(("http://", "https://")):
+            errors.append(f"server_url must start with http:// or https://, got {self.server_url!r}")
+        if self.transport_mode not in TRANSPORT_MODES:
+            errors.append(f"transport_mode must be one of {', '.join(TRANSPORT_MODES)}, got {self.transport_mode!r}")
+        if not MIN_CHUNK_SIZE <= self.chunk_size <= MAX_CHUNK_SIZE:
+            errors.append(f"chunk_size must be {MIN_CHUNK_SIZE}-{MAX_CHUNK_SIZE} bytes, got {self.chunk_size}")
+        if self.bandwidth < 0:
+            errors.append("bandwidth cannot be negative")
+        if self.max_concurrent < 1:
+            errors.append("max_concurrent must be at least 1")
+        if self.upload_resume_wait < 0:
+            errors.append("upload_resume_wait cannot be negative")
+        if not os.path.isfile(self.public_key_path):
+            errors.append(f"public_key_path {self.public_key_path!r} does not exist")
+        return errors
+
+
+def load_client_config(argv=None, env=None, path=None):
+    return load_config(ClientConfig, argv=argv, env=env, path=path, prog="gui.py")
@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+import queue
+
+# Pipeline between the Socket.IO receive threads and the disk.
+# Socket.IO runs every client handler on its own thread, so chunks can reach
+# the writer out of order: data is written positionally (os.pwrite) and the
+# SHA-256 is advanced only over the contiguous prefix.
+#
+# Flow control: the download is requested with a window of QUEUE_CHUNKS and the
+# writer reports the bytes it has on disk (on_progress -> download_ack). The
+# server keeps at most a window of chunks unacknowledged, so a slow disk slows
+# the sender instead of piling chunks up in the queue and in handler threads.
+
+QUEUE_CHUNKS = 32                      # Download window: ~1.5MB of 48KB chunks in flight
+ACK_EVERY = 8                          # Chunks written between progress reports
+SIDECAR_EVERY = 4 * 1024 * 1024        # Persist resume info every 4MB
+FINISH_TIMEOUT = 10                    # Seconds to wait for late chunks after finish_download
+IDLE_TIMEOUT = 60                      # Seconds without any message before the download is given up
+HASH_READ_SIZE = 1024 * 1024
+
+_FINISH = object()
+_ABORT = object()
+
+
+def part_path(save_path):
+    return save_path + ".part"
+
+
+def sidecar_path(save_path):
+    return save_path + ".part.json"
+
+
+def read_resume_offset(save_path, file_id):
+    """Return how many bytes of a previous download of file_id are already on disk."""
+    try:
+        with open(sidecar_path(save_path), "r") as f:
+            info = json.load(f)
+        # Keyed on the stored file's ID: another file with the same name is not a prefix of this one
+        if not file_id or info.get("file_id") != file_id:
+            return 0
+        offset = int(info.get("offset", 0))
+        if os.path.getsize(part_path(save_path)) < offset:
+            return 0
+        return offset
+    except (OSError, ValueError):
+        return 0
+
+
+class DownloadWriter:
+    def __init__(self, filename, save_path, offset=0, maxsize=QUEUE_CHUNKS, file_id=None, on_progress=None,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.filename = filename
+        self.file_id = file_id
+        self.save_path = save_path
+        self.part_path = part_path(save_path)
+        self.sidecar_path = sidecar_path(save_path)
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.hash = hashlib.sha256()
+        self.offset = offset           # Contiguous bytes written and hashed
+        self.filesize = None
+        self.expected_hash = None
+        self.pending = {}              # offset -> bytes written ahead of the hashed prefix
+        self.fd = None
+        self._last_sidecar = offset
+        self.on_progress = on_progress # Called with the contiguous offset as it advances
+        self._unacked = 0
+        self._last_progress = offset
+        self.idle_timeout = idle_timeout   # A lost finish or abort (e.g. a dropped session) ends here
+
+        if offset:
+            self._rehash_prefix()
+
+    # --- Producer side (Socket.IO threads) ---
+    def put_chunk(self, offset, data, filesize):
+        # The server's window keeps this from filling. A server without flow
+        # control can still fill it, and then each further chunk blocks its own
+        # handler thread: memory stays bounded, but the sender is not slowed.
+        self.queue.put((offset, data, filesize))
+
+    def finish(self, server_hash, filesize=None):
+        self.queue.put((_FINISH, server_hash, filesize))
+
+    def abort(self):
+        self.queue.put((_ABORT, None, None))
+
+    # --- Consumer side (writer thread) ---
+    def run(self):
+        """Drain the queue until the file is complete. Returns True if the hash verified."""
+        try:
+            while True:
+                try:
+                    timeout = FINISH_TIMEOUT if self.expected_hash is not None else self.idle_timeout
+                    offset, data, filesize = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._close(keep_partial=True)
+                    return False
+
+                if offset is _ABORT:
+                    self._close(keep_partial=True)
+                    return False
+                if offset is _FINISH:
+                    self.expected_hash = data
+                    if filesize is not None:
+                        self.filesize = filesize
+                else:
+                    self._write(offset, data, filesize)
+                    self._report_progress()
+
+                if self.expected_hash is not None and self.filesize is not None \
+                        and self.offset >= self.filesize:
+                    return self._verify()
+        except Exception:
+            self._close(keep_partial=True)
+            raise
+
+    def _open(self, filesize):
+        self.filesize = filesize
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        self.fd = os.open(self.part_path, flags, 0o644)
+        # Preallocate so positional writes never extend the file piecemeal
+        if os.fstat(self.fd).st_size != filesize:
+            os.ftruncate(self.fd, filesize)
+        self._write_sidecar()
+
+    def _write(self, offset, data, filesize):
+        if self.fd is None:
+            self._open(filesize)
+        if offset + len(data) <= self.offset:
+            return  # Already have it (resume overlap)
+        if offset < self.offset:
+            data = data[self.offset - offset:]
+            offset = self.offset
+
+        _pwrite(self.fd, data, offset)
+
+        if offset == self.offset:
+            self._advance(data)
+            while self.offset in self.pending:
+                self._advance(self.pending.pop(self.offset))
+        else:
+            self.pending[offset] = data
+
+        if self.offset - self._last_sidecar >= SIDECAR_EVERY:
+            self._write_sidecar()
+
+    def _report_progress(self):
+        # Every ACK_EVERY chunks, and whenever the writer has caught up, so the
+        # sender is never left waiting on chunks that are already on disk
+        self._unacked += 1
+        if self.on_progress is None or self.offset == self._last_progress:
+            return
+        if self._unacked >= ACK_EVERY or self.queue.empty():
+            self._unacked = 0
+            self._last_progress = self.offset
+            self.on_progress(self.offset)
+
+    def _advance(self, data):
+        self.hash.update(data)
+        self.offset += len(data)
+
+    def _rehash_prefix(self):
+        # Rebuild the running hash over the bytes kept from an earlier attempt
+        with open(self.part_path, "rb") as f:
+            remaining = self.offset
+            while remaining:
+                block = f.read(min(HASH_READ_SIZE, remaining))
+                if not block:
+                    break
+                self.hash.update(block)
+                remaining -= len(block)
+
+    def _write_sidecar(self):
+        tmp = self.sidecar_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"file_id": self.file_id, "filename": self.filename, "filesize": self.filesize,
+                       "offset": self.offset}, f)
+        os.replace(tmp, self.sidecar_path)
+        self._last_sidecar = self.offset
+
+    def _verify(self):
+        if self.fd is None:  # Empty file: no chunks were ever sent
+            self._open(self.filesize)
+        ok = self.hash.hexdigest() == self.expected_hash
+        if ok:
+            os.fsync(self.fd)
+            self._close(keep_partial=False)
+            os.replace(self.part_path, self.save_path)  # Atomic on the same filesystem
+        else:
+            self._close(keep_partial=False)
+            if os.path.exists(self.part_path):
+                os.remove(self.part_path)
+        return ok
+
+    def _close(self, keep_partial):
+        if self.fd is not None:
+            if keep_partial:
+                self._write_sidecar()
+            os.close(self.fd)
+            self.fd = None
+        if not keep_partial and os.path.exists(self.sidecar_path):
+            os.remove(self.sidecar_path)
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+    else:  # Windows
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
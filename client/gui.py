@@ -1,37 +1,51 @@
 import os
 import base64
 import threading
-import socketio
 import sys
 import time
 import math
 import hashlib
-from queue import Queue
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 from tkinter.ttk import Progressbar
 from datetime import datetime
 from emoji_dict import EMOJI_DICT
+from download_writer import DownloadWriter, read_resume_offset, QUEUE_CHUNKS
+from transfer_manager import TransferManager, new_transfer_id
+from reliable import OutgoingMessages, RETRANSMIT_CHECK_MS
+from backoff import backoff_delay
+from config import ClientConfig, load_client_config
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from logs.db_logger import log_event
 
-from server.crypto_utils import (
+from server.encryption import (
     load_rsa_public_key, encrypt_rsa, generate_aes_key,
-    encrypt_aes, decrypt_aes
+    encrypt_aes_raw, decrypt_aes_raw,
+    generate_rsa_private_key, public_key_pem, load_rsa_public_key_pem, seal_for, open_sealed
 )
-
-# Load server private key
-public_key = load_rsa_public_key("public_key.pem")
+from server.batching import unpack_batch
+from server.compression import upload_codecs, compress_chunk
+from server.transport import transports
+from server.envelope import pack_envelope, unpack_envelope, now_ms, SeqTracker, KIND_ROOM, KIND_PRIVATE
+from server.config import ConfigError
 
 FONT = "Lato"
-SERVER_API_URL = "http://localhost:8080"
-CHUNK_SIZE = 49152 # 48KB
+RECONNECT_GRACE_MS = 30000  # Give up and exit if a reconnect has not succeeded by then
 
 is_connecting = False
 connection_failed = False
 
+socketio = None  # Imported by the connect thread, so the login window does not wait for it
+
+def load_socketio():
+    global socketio
+    if socketio is None:
+        import socketio as module
+        socketio = module
+    return socketio
+
 def center_window(window, width, height):
     screen_width = window.winfo_screenwidth()
     screen_height = window.winfo_screenheight()
@@ -46,21 +60,50 @@ def setup_window(window, title, width, height):
     center_window(window, width, height)
 
 class ChatClientGUI:
-    def __init__(self):
+    def __init__(self, config=None):
+        # Server address, transport and transfer tuning (client/config.py)
+        self.config = config or ClientConfig()
         self.Window = tk.Tk()
         self.Window.withdraw()
 
         self.emoji_window = None
         self.username = None
         self.active_users = []
-        
-        # setup the socket client
-        self.sio = socketio.Client()
-        self.setup_socketio()
-        # self.connect_to_server()
-        
-        # set up file transfer
+        self.current_room = "Global"  # Where plain messages go; changed with /join
+        self.send_seq = 0             # Sequence number of the last envelope sent (kept across reconnects)
+
+        # At-least-once delivery: unacked messages are re-sent, received ones deduped by dseq
+        self.outgoing = OutgoingMessages()
+        self.resume_token = None      # Lets the server replay what we missed while disconnected
+        self.received = SeqTracker()
+        self.retransmit_started = False
+
+        # Server restarts: uploads pause until the new process says where to continue
+        self.session_aes_key = None
+        self.restart_generation = 0   # Bumped on every server_restarting; each upload tracks the one it synced to
+        self.upload_resumes = {}      # transfer_id -> {'event', 'offset'}
+
+        # End-to-end mode: messages are sealed for each recipient's public key,
+        # so the server only ever forwards ciphertext it cannot read
+        self.e2e = self.config.e2e
+        self.e2e_private_key = None
+        self.peer_keys = {}           # username -> RSA public key
+        self.room_members = {}        # room -> member usernames, for sealing room messages
+        
+        # The socket client is created by the connect thread (see connect_to_server)
+        self.sio = None
+        self.transports = transports(self.config.transport_mode)  # Must match what the server accepts
+        self.server_public_key = None
+        self.connection_status = "connecting"
+        self.retry_delay = 0
+        self.closing = threading.Event()  # Stops connect retries when the app exits
+        
+        # set up file transfer (all keyed by transfer ID)
+        self.transfers = TransferManager(max_concurrent=self.config.max_concurrent,
+                                         bandwidth=self.config.bandwidth or None)
         self.download_files = {}
+        self.download_bars = {}       # transfer_id -> Progressbar of a running download
+        self.preview_images = {}      # file_id -> PhotoImage, kept alive while shown
         self.progress_n_index = {}
         self.upload_confirmation = {}
         
@@ -73,78 +116,158 @@ class ChatClientGUI:
             print("Connected to server.")
             log_event("client", "connect", "Connected to server.")
 
-            # # After connection, generate AES key & exchange
-            self.session_aes_key = generate_aes_key()
-            encrypted_aes = encrypt_rsa(public_key, self.session_aes_key)
-            encrypted_aes_b64 = base64.b64encode(encrypted_aes).decode()
-            self.sio.emit('exchange_key', {'encrypted_aes': encrypted_aes_b64})
+            if self.resume_token and self.session_aes_key:
+                # Reconnect: prove we still hold the session key instead of a new RSA handshake
+                proof = encrypt_aes_raw(self.session_aes_key, self.resume_token.encode())
+                self.sio.emit('resume_session', {'token': self.resume_token, 'proof': proof},
+                              callback=self.on_session_resumed)
+            else:
+                self.exchange_key()
+
+        @self.sio.event
+        def server_restarting(data):
+            # The server is draining; Socket.IO reconnects with jittered backoff from this delay
+            self.restart_generation += 1
+            self.sio.reconnection_delay = data.get("reconnect_after", self.sio.reconnection_delay)
+            self.display_system_message("Server is restarting. Reconnecting shortly...")
+
+        @self.sio.event
+        def kicked(data):
+            # Removed by an operator: the server disconnects us next, and we stay disconnected
+            self.sio.reconnection = False
+            self.resume_token = None
+            self.display_system_message(f"You were disconnected by the server: {data.get('reason', '')}")
+
+        @self.sio.event
+        def upload_resume(data):
+            # A checkpointed upload was restored by the new server process
+            resume = self.upload_resumes.setdefault(data.get("transfer_id", ""), {'event': threading.Event()})
+            resume['offset'] = data.get("offset", 0)
+            resume['event'].set()
 
         @self.sio.event
         def current_users(data):
+            # The roster follows every join/leave notice; a newer one may have replaced older ones
             usernames = data.get('usernames', [])
             print(f"Current usernames: {usernames}")
             log_event("client", "current_users", f"Received current users: {usernames}")
             self.active_users = usernames
-            # self.update_user_list(users)
+            if getattr(self, 'user_list', None) is not None:
+                self.update_user_list(usernames[::-1])
 
         @self.sio.event
         def user_joined(data):
             username = data.get("username", "Unknown")
-            usernames = data.get("usernames", [])
-            self.active_users = usernames
 
             # Check if chat_box exists
             if not hasattr(self, 'chat_box') or self.chat_box is None: 
                 return
             
             self.display_system_message(f"{username} has joined the chat.")
-            self.update_user_list(usernames[::-1])
 
         @self.sio.event
         def user_left(data):
             username = data.get("username", "Unknown")
-            usernames = data.get("usernames", [])
-            self.active_users = usernames
-            self.update_user_list(usernames[::-1])
+            self.peer_keys.pop(username, None)
             self.display_system_message(f"{username} has left the chat.")
 
+        @self.sio.event
+        def public_key(data):
+            try:
+                self.peer_keys[data.get("username")] = load_rsa_public_key_pem(data.get("public_key", ""))
+            except Exception as e:
+                log_event("client", "e2e_key_error", f"Bad public key from {data.get('username')}: {e}")
+
+        @self.sio.event
+        def incoming_e2e_message(data):
+            if not self.accept_delivery(data):
+                return
+            sender = data.get("sender", "Unknown")
+            try:
+                envelope = unpack_envelope(open_sealed(self.e2e_private_key, data.get("ciphertext", b""), data.get("key", b"")))
+            except Exception:
+                self.display_system_message(f"Failed to decrypt end-to-end message from {sender}")
+                return
+            # Only the server knows who really sent it; flag envelopes claiming otherwise
+            if envelope.sender != sender:
+                self.display_system_message(f"Message from {sender} claims to be from {envelope.sender}")
+            if data.get("room"):
+                self.display_envelope(data["room"], sender, envelope)
+            else:
+                self.display_envelope("Private", f"From {sender}", envelope)
+
         @self.sio.event
         def disconnect():
             print("Disconnected from server.")
             log_event("client", "disconnect", "Disconnected from server.")
-            self.display_system_message("Disconnected from server. Exitting...")
-            self.Window.attributes("-disabled", True)
-            self.Window.after(5000, self.force_exit)
+            # Socket.IO keeps reconnecting; unacked messages are re-sent once it does
+            self.display_system_message("Connection lost. Reconnecting...")
+            # Downloads stream on the old session and are not resumed by the new one
+            for download in list(self.download_files.values()):
+                download['writer'].abort()
+            self.Window.after(RECONNECT_GRACE_MS, self.exit_if_disconnected)
 
         @self.sio.event
         def incoming_global_message(data):
-            sender = data.get("sender", "Unknown")
+            if "batch" in data:
+                self.display_batch(data)
+                return
+            if not self.accept_delivery(data):
+                return
+
             try:
-                # decrypted = decrypt_message(data.get("message", ""))
-                decrypted = decrypt_aes(self.session_aes_key, data.get("message", ""))
+                envelope = self.open_envelope(data.get("envelope", b""))
+                self.display_envelope(envelope.target, envelope.sender, envelope)
+            except Exception as e:
+                self.display_system_message("Failed to decrypt global message")
+
+        @self.sio.event
+        def room_history(data):
+            room = data.get("room", "")
+            for entry in data.get("messages", []):
+                try:
+                    envelope = self.open_envelope(entry)
+                    self.display_envelope(room, envelope.sender, envelope)
+                except Exception:
+                    self.display_system_message(f"Failed to decrypt history from {room}")
+
+        @self.sio.event
+        def room_presence(data):
+            self.room_members[data.get("room")] = data.get("members", [])
+            members = ", ".join(data.get("members", []))
+            self.display_system_message(f"{data.get('username')} {data.get('action')} #{data.get('room')} (members: {members})")
 
-                timestamp, message = decrypted.split("|", 1)
-                self.display_message("Global", sender, message, timestamp)
+        @self.sio.event
+        def offline_messages(data):
+            # Private messages queued on the server while we were offline, in one batch
+            try:
+                payload = decrypt_aes_raw(self.session_aes_key, data.get("batch", b""))
+                entries = unpack_batch(payload, data.get("codec", "none"))
             except Exception as e:
-                self.display_system_message(f"Failed to decrypt global message from {sender}")
+                self.display_system_message("Failed to decrypt offline messages")
+                log_event("client", "offline_error", f"Failed to unpack offline messages: {e}")
+                return
+            self.display_system_message(f"{len(entries)} messages arrived while you were offline:")
+            for entry in entries:
+                envelope = unpack_envelope(entry)
+                self.display_envelope("Private", f"From {envelope.sender}", envelope)
 
         @self.sio.event
         def incoming_private_message(data):
-            sender = data.get("sender", "Unknown")
+            if not self.accept_delivery(data):
+                return
             try:
-                # decrypted = decrypt_message(data.get("message", ""))
-                decrypted = decrypt_aes(self.session_aes_key, data.get("message", ""))
-                timestamp, message = decrypted.split("|", 1)
-                # self.display_message("Private", sender, message, timestamp)
-                self.display_message("Private", f"From {sender}", message, timestamp)
-
+                envelope = self.open_envelope(data.get("envelope", b""))
+                self.display_envelope("Private", f"From {envelope.sender}", envelope)
             except Exception as e:
-                self.display_system_message(f"Failed to decrypt private message from {sender}")
+                self.display_system_message("Failed to decrypt private message")
         
         @self.sio.event
         def incoming_global_file(data):
             sender = data.get("sender", "Unknown")
             filename = data.get("filename", "")
+            file_id = data.get("file_id", "")
+            filesize = data.get("filesize", 0)
             timestamp = data.get("time", "")
             
             if sender == self.username:
@@ -152,85 +275,132 @@ class ChatClientGUI:
                 # self.display_download_button(filename)
                 pass
             else:
-                self.receive_file("Global", f"From {sender}", filename, timestamp)
+                self.receive_file("Global", f"From {sender}", filename, timestamp, file_id, filesize)
         
         @self.sio.event
         def incoming_private_file(data):
             sender = data.get("sender", "Unknown")
             filename = data.get("filename", "")
+            file_id = data.get("file_id", "")
+            filesize = data.get("filesize", 0)
             timestamp = data.get("time", "")
             
-            self.receive_file("Private", f"From {sender}", filename, timestamp)
+            self.receive_file("Private", f"From {sender}", filename, timestamp, file_id, filesize)
         
+        @self.sio.event
+        def file_preview(data):
+            self.show_preview(data)
+
         @self.sio.event
         def incoming_file_chunk(data):
             chunk_data = data.get("chunk_data")
-            filename = data.get("filename", "")
-            
-            if chunk_data:
-                self.download_files[filename]['queue'].put(chunk_data) # Append encoded data to queue
-                        
+            download = self.download_files.get(data.get("transfer_id", ""))
+
+            if chunk_data and download:
+                # Decode here so the writer thread only does disk I/O
+                download['writer'].put_chunk(data.get("offset", 0),
+                                             base64.b64decode(chunk_data.encode()),
+                                             data.get("filesize", 0))
+
         @self.sio.event
         def finish_download(data):
-            time.sleep(0.5)
-            filename = data.get("filename", "")
-            server_hash = data.get("hash_file", "")
-            
-            if filename in self.download_files:
-                computed_hash = self.download_files[filename]['computed_hash'].hexdigest()
-                saving_path = self.download_files[filename]['path']
-                
-                if computed_hash != server_hash:
-                    messagebox.showerror("Error", f"Failed to download file {filename} from server. Please download again.")
-                    log_event("client", "finish_download_failed", f"Hash mismatch for {filename}")
-                    
-                    # Delete the failed file
-                    if os.path.exists(saving_path):
-                        os.remove(saving_path)
-                        log_event("client", "delete_failed_download_file", f"Deleted corrupt file: {saving_path}")
-                else:
-                    self.download_files[filename]['queue'].put(None)
-                    self.display_system_message(f"File {filename} has been successfully downloaded.")
+            download = self.download_files.get(data.get("transfer_id", ""))
+
+            if download:
+                # Verification happens in the writer once every chunk has landed
+                download['writer'].finish(data.get("hash_file", ""), data.get("filesize"))
         
+        @self.sio.event
+        def download_aborted(data):
+            download = self.download_files.get(data.get("transfer_id", ""))
+            if download:
+                download['writer'].abort()
+
+        @self.sio.event
+        def upload_aborted(data):
+            transfer_id = data.get("transfer_id", "")
+            # Stops the sending loop before it pushes more chunks
+            self.transfers.cancel(transfer_id)
+            self.upload_rejected(transfer_id, data.get("filename", ""), data.get("reason", "unknown"))
+
         @self.sio.event
         def retry_sending(data):
+            transfer_id = data.get("transfer_id", "")
             filename = data.get("filename", "")
             sender = data.get("sender", "Unknown")
             
             if sender == self.username:
                 # Cancel success timer if it's still pending
-                if filename in self.upload_confirmation:
-                    self.root.after_cancel(self.upload_confirmation[filename])
-                    self.upload_confirmation.pop(filename, None)
+                if transfer_id in self.upload_confirmation:
+                    self.Window.after_cancel(self.upload_confirmation[transfer_id])
+                    self.upload_confirmation.pop(transfer_id, None)
                 
                 # Display the error
                 messagebox.showerror("Error", f"File upload to server failed for '{filename}'. Please try resending the file.")
-                self.error_upload(filename)
+                self.error_upload(transfer_id)
     
     def connect_to_server(self):
         def connect():
-            try:
-                self.sio.connect(SERVER_API_URL)
-                self.sio.wait()
-            except Exception as e:
-                print(f"Connection failed: {e}")
-                log_event("client", "connect_to_server_error", f"Connection failed: {e}")
+            print("Connecting to server...")
+            log_event("client", "login_screen", "Attempting to connect to server...")
+            if self.sio is None:
+                self.sio = load_socketio().Client()
+                self.setup_socketio()
+
+            # Retry with jittered exponential backoff until connected or the app closes
+            attempt = 0
+            while not self.closing.is_set():
+                try:
+                    self.sio.connect(self.config.server_url, transports=self.transports)
+                    break
+                except Exception as e:
+                    delay = backoff_delay(attempt)
+                    attempt += 1
+                    print(f"Connection failed: {e}; retrying in {delay:.1f}s")
+                    log_event("client", "connect_to_server_error", f"Connection failed (attempt {attempt}): {e}")
+                    self.signal_connection("retrying", delay)
+                    self.closing.wait(delay)
+            else:
+                return
+
+            self.signal_connection("connected")
+            self.sio.wait()
         threading.Thread(target=connect, daemon=True).start()
 
+    def signal_connection(self, status, delay=0):
+        """Hand a connection status change to the Tk thread; Tk calls are only safe from there."""
+        try:
+            self.Window.after(0, self.on_connection_status, status, delay)
+        except (tk.TclError, RuntimeError):
+            pass  # Window already closed
+
+    def on_connection_status(self, status, delay=0):
+        self.connection_status = status
+        self.retry_delay = delay
+        if not hasattr(self, 'status_label') or not self.status_label.winfo_exists():
+            return
+        if self.connection_status == "connected":
+            self.status_label.config(text="Connected ✓")
+            self.button.config(state="normal")
+        elif self.connection_status == "retrying":
+            self.status_label.config(text=f"Server unreachable, retrying in {math.ceil(self.retry_delay)}s...")
+        else:
+            self.status_label.config(text="Connecting...")
+
     def update_user_server(self):
         """Update the server with the current username."""
         if self.sio.connected:
-            self.sio.emit('user_joined', {'username': self.username})
+            data = {'username': self.username}
+            if self.resume_token:
+                data['resume'] = {'token': self.resume_token, 'dseq': self.received.high}
+            self.sio.emit('user_joined', data, callback=self.on_joined)
         else:
             messagebox.showerror("Error", "Not connected to server.")
 
     def validate_username(self, username):
         username = username.strip()
 
-        current_users = self.sio.call('get_current_users').get('current_usernames', [])
-        self.active_users = current_users
-
-        if not self.sio.connected:
+        if not self.sio or not self.sio.connected:
             messagebox.showerror("Error", "Not connected to server.")
             return False
         
@@ -246,15 +416,26 @@ class ChatClientGUI:
         elif not username.isalnum():
             messagebox.showwarning("Warning", "Username cannot contain special characters. Please choose another one.")
             return False
-        elif username in self.active_users:
-            messagebox.showwarning("Warning", "This username is already taken. Please choose another one.")
-            return False
-    
-        self.username = username
-        self.chatroom_screen()
 
+        # The server reserves the name atomically; the answer comes back on the socket thread
+        self.button.config(state="disabled")
+        self.sio.emit('claim_username', {'username': username},
+                      callback=lambda reply=None: self.Window.after(0, self.on_username_claimed, username, reply))
         return True
 
+    def on_username_claimed(self, username, reply):
+        if not self.login.winfo_exists():
+            return
+        self.button.config(state="normal")
+        status = (reply or {}).get('status')
+        if status == 'ok':
+            self.username = username
+            self.chatroom_screen()
+        elif (reply or {}).get('reason') == 'username_taken':
+            messagebox.showwarning("Warning", "This username is already taken. Please choose another one.")
+        else:
+            messagebox.showerror("Error", f"Could not use this username: {(reply or {}).get('reason', 'no reply')}")
+
     def setup_login_screen(self):
         self.login = tk.Toplevel(bg="dark green")
         setup_window(self.login, "ChatSpace Login", 680, 230)
@@ -298,10 +479,15 @@ class ChatClientGUI:
             activebackground="#FFA500",  # Orange when clicked
             activeforeground="white",
             cursor="hand2",  # Hand cursor on hover
-            command=lambda: self.validate_username(self.entry_username.get())
+            command=lambda: self.validate_username(self.entry_username.get()),
+            state="disabled"  # Enabled once connected
         )
         self.button.grid(row=0, column=2, padx=(10, 0))    
 
+        # Connection status, updated by on_connection_status
+        self.status_label = tk.Label(content_frame, text="Connecting...", font=(FONT, 11), fg="white", bg="dark green")
+        self.status_label.grid(row=1, column=0, columnspan=3, pady=(15, 0))
+
         # Set focus
         self.entry_username.focus_set()
         
@@ -312,14 +498,9 @@ class ChatClientGUI:
         self.login.protocol("WM_DELETE_WINDOW", self.graceful_exit)
 
     def login_screen(self):
-        self.connect_to_server()
-        print("Connecting to server...")
-        log_event("client", "login_screen", "Attempting to connect to server...")
-        
-        while (not self.sio.connected):
-            continue
-
+        # Show the login window straight away; the connection is made in the background
         self.setup_login_screen()
+        self.connect_to_server()
 
     def setup_chatroom_screen(self):
         self.Window.deiconify()
@@ -430,7 +611,7 @@ class ChatClientGUI:
         # Suggestion label - moved to row 4 and spans both columns
         self.suggestion_label = tk.Label(
             self.Window,
-            text="Tip: Type '/w [username] [message]' to send a private message \nType '/filew [username] [filepath]' to privately send a file",
+            text="Tip: Type '/w [username] [message]' to send a private message \nType '/filew [username] [filepath]' to privately send a file\nType '/join [room]', '/leave [room]' or '/rooms' to manage chat rooms",
             fg="#2E86C1",
             font=(FONT, 10, "italic")
         )
@@ -627,7 +808,7 @@ class ChatClientGUI:
         else:
             filepath = path
         
-        accept_extension = ["mp4", "jpeg", "jpg", "mp3", "png"]
+        accept_extension = ["mp4", "jpeg", "jpg", "mp3", "png", "wav", "bmp"]
         
         if filepath:
             try: 
@@ -640,10 +821,7 @@ class ChatClientGUI:
                 if extension in accept_extension:
                     if f_size_mb <= 25:
                         # self.display_system_message(f"Selected file: {filepath.split('/')[-1]}")
-                        if recipient == "Global":
-                            threading.Thread(target=self.send_file_w_progressbar, args=(filepath,), daemon=True).start()
-                        else:
-                            threading.Thread(target=self.send_file_w_progressbar, args=(filepath, recipient,), daemon=True).start()
+                        self.start_upload(filepath, recipient)
                     else:
                         messagebox.showwarning("Warning", "Please choose a file smaller than 20 MB.")
                 else:
@@ -653,66 +831,137 @@ class ChatClientGUI:
             except Exception as e:
                 messagebox.showerror("Error", "Inappropriate file path")    
             
-    def send_file_w_progressbar(self, path, recipient = "Global"):      
+    def start_upload(self, path, recipient = "Global"):
+        """Show the progress bar and queue the upload on the transfer manager."""
+        filename = os.path.basename(path)
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        transfer_id = new_transfer_id()
+
+        if recipient == "Global":
+            self.display_progress_bar("Global", self.username, timestamp, filename, transfer_id)
+        else:
+            self.display_progress_bar("Private", f"To {recipient}", timestamp, filename, transfer_id)
+
+        self.transfers.submit('upload', filename, os.path.getsize(path),
+                              lambda transfer: self.send_file_w_progressbar(path, recipient, transfer.id, timestamp),
+                              transfer_id=transfer_id,
+                              on_progress=lambda transfer: self.update_progress(transfer.id, transfer.done_bytes, transfer.total_bytes))
+
+    def send_file_w_progressbar(self, path, recipient = "Global", transfer_id = None, timestamp = None):
         try:
                     # EXTRACT FILE METADATA
             filename = os.path.basename(path)
-            f_size_b = os.path.getsize(path)
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            
-            chunk_num = 0
-            total_chunks = math.ceil(f_size_b/CHUNK_SIZE)
+            timestamp = timestamp or datetime.now().strftime("%H:%M:%S")
             
             # Hashing file
             hash_algo = hashlib.sha256()
             
-            # self.display_system_message(f"[Upload file] Waiting for server confirmation...")
-            if recipient == "Global":
-                self.display_progress_bar("Global", self.username, timestamp, filename)
-            else:
-                self.display_progress_bar("Private", f"To {recipient}", timestamp, filename)
-            
-            self.sio.emit('start_upload', {
+            # Wait for the server to admit the upload against its quotas before sending chunks
+            reply = self.sio.call('start_upload', {
+                          'transfer_id': transfer_id,
                           'filename': filename,
+                          'filesize': os.path.getsize(path),
                           'sender': self.username, 
-                          'recipient': recipient
-                         })
+                          'recipient': recipient,
+                          'codecs': upload_codecs(path)
+                         }) or {}
+            if reply.get('status') != 'ok':
+                self.upload_rejected(transfer_id, filename, reply.get('reason', 'unknown'))
+                return
+            codec = reply.get('codec', 'none')
+            # A chunk over the server's chunk_size would exceed its packet limit and drop the connection
+            chunk_size = min(self.config.chunk_size, reply.get('max_chunk') or self.config.chunk_size)
             
+            position = 0
+            synced = self.restart_generation  # Restarts before this point cannot have checkpointed the upload
             with open(path, "rb") as file:
                 while True:
-                    chunk = file.read(CHUNK_SIZE)
+                    if self.restart_generation != synced:
+                        # Server restart: continue from what the new process has on disk
+                        synced = self.restart_generation
+                        position = self.wait_for_upload_resume(transfer_id)
+                        hash_algo = self.hash_prefix(file, position)
+                        self.transfers.get(transfer_id).done_bytes = position
+
+                    chunk = file.read(chunk_size)
                     if not chunk:
+                        if self.restart_generation != synced:
+                            continue  # Restarted after the last chunk went out: resume before finishing
                         break
-                    hash_algo.update(chunk)
-
+                    if self.transfers.is_cancelled(transfer_id):
+                        self.abandon_upload(transfer_id)
+                        return
 
-                    #ENCODE CHUNK FOR TRANSMISSION    
-                    encoded_data = base64.b64encode(chunk).decode()
-                    self.sio.emit('upload_chunk', {
-                                  'filename': filename,
-                                  'recipient': recipient,
-                                  'chunk_data': encoded_data
-                                 })
-                    chunk_num += 1
-                    self.update_progress(filename, chunk_num, total_chunks)
-                    # print(f"[DEBUG] Writing {threading.current_thread().name}, {filename}")
-                    time.sleep(0.05)
+                    #ENCODE CHUNK FOR TRANSMISSION (compressed when negotiated; the hash stays over the original bytes)
+                    payload, compressed = compress_chunk(chunk, codec)
+                    encoded_data = base64.b64encode(payload).decode()
+                    try:
+                        self.sio.emit('upload_chunk', {
+                                      'transfer_id': transfer_id,
+                                      'chunk_data': encoded_data,
+                                      'compressed': compressed
+                                     })
+                    except socketio.exceptions.SocketIOError:
+                        if self.restart_generation == synced:
+                            raise
+                        continue
+                    hash_algo.update(chunk)
+                    position += len(chunk)
+                    # Paces this upload to its bandwidth share and updates the progress bar
+                    self.transfers.progress(transfer_id, len(chunk))
                     
             time.sleep(0.5)
             self.sio.emit('finish_upload', {
+                          'transfer_id': transfer_id,
                           'filename': filename, 
                           'sender': self.username,
                           'recipient': recipient,
                           'hash_file': hash_algo.hexdigest(),
                           'time': timestamp})
             print(hash_algo.hexdigest())
+            self.transfers.finish(transfer_id)
             
         except Exception as e:
+            self.transfers.finish(transfer_id, ok=False)
             messagebox.showerror("Error", f"File transfer failed {e}")
     
-    def error_upload(self, filename):
+    def abandon_upload(self, transfer_id):
+        # Lets the server delete the partial file and release its quota now instead of at the idle sweep.
+        # Ignored by the server when it was the one that aborted the upload.
+        self.sio.emit('cancel_upload', {'transfer_id': transfer_id})
+        self.transfers.finish(transfer_id, ok=False)
+
+    def wait_for_upload_resume(self, transfer_id):
+        resume = self.upload_resumes.setdefault(transfer_id, {'event': threading.Event()})
+        if not resume['event'].wait(self.config.upload_resume_wait):
+            self.upload_resumes.pop(transfer_id, None)
+            raise ConnectionError("the server restarted and did not resume the upload")
+        return self.upload_resumes.pop(transfer_id)['offset']
+
+    def hash_prefix(self, file, length):
+        """SHA-256 state after the first length bytes of file, leaving the file positioned there."""
+        hash_algo = hashlib.sha256()
+        file.seek(0)
+        remaining = length
+        while remaining:
+            block = file.read(min(self.config.chunk_size, remaining))
+            if not block:
+                break
+            hash_algo.update(block)
+            remaining -= len(block)
+        file.seek(length)
+        return hash_algo
+
+    def upload_rejected(self, transfer_id, filename, reason):
+        self.transfers.finish(transfer_id, ok=False)
+        messagebox.showerror("Error", f"The server stopped the upload of '{filename}' ({reason.replace('_', ' ')}).")
+        log_event("client", "upload_rejected", f"Upload of {filename} rejected: {reason}")
+        self.Window.after(0, self.error_upload, transfer_id)
+
+    def error_upload(self, transfer_id):
         try:
-            bar_info = self.progress_n_index.get(filename)
+            bar_info = self.progress_n_index.get(transfer_id)
+            filename = bar_info["filename"] if bar_info else transfer_id
             
             if not bar_info:
                 return
@@ -733,30 +982,31 @@ class ChatClientGUI:
             self.chat_box.config(state="disabled")
             self.chat_box.yview(tk.END)
             
-            self.progress_n_index.pop(filename, None)
+            self.progress_n_index.pop(transfer_id, None)
             
         except Exception as e:
             print("Cannot display the upload error.")
-            log_event("client", "error_upload_error", f"Cannot display the upload error for {filename}: {e}") 
+            log_event("client", "error_upload_error", f"Cannot display the upload error for {transfer_id}: {e}") 
     
-    def update_progress(self, filename, chunk_num, total_chunks):
-        self.Window.after(0, self._update_progress_ui, filename, chunk_num, total_chunks)
+    def update_progress(self, transfer_id, done_bytes, total_bytes):
+        self.Window.after(0, self._update_progress_ui, transfer_id, done_bytes, total_bytes)
 
-    def _update_progress_ui(self, filename, chunk_num, total_chunks):
+    def _update_progress_ui(self, transfer_id, done_bytes, total_bytes):
         try:
-            bar_info = self.progress_n_index.get(filename)
+            bar_info = self.progress_n_index.get(transfer_id)
             
             if not bar_info:
                 return
             
-            percent = math.floor((chunk_num/total_chunks) * 100)
+            filename = bar_info["filename"]
+            percent = math.floor((done_bytes/total_bytes) * 100) if total_bytes else 100
 
             if percent == 100:
                 self.chat_box.config(state="normal")
                 progressbar_pos = bar_info["index"]
                 
                 def finalize_upload():
-                    if filename not in self.upload_confirmation:
+                    if transfer_id not in self.upload_confirmation:
                         return
 
                     try:
@@ -771,7 +1021,7 @@ class ChatClientGUI:
                         log_event("client", "progress_bar_error", f"Error destroying progress bar for {filename}: {e}")
                     
                     # Insert download button
-                    download_button = tk.Button(self.chat_box, text="⬇", command=lambda: self.ask_download(filename), 
+                    download_button = tk.Button(self.chat_box, text="⬇", command=lambda: self.ask_download(transfer_id, filename, total_bytes), 
                                         bg="midnight blue", fg="black", relief="flat", width=2, 
                                         padx=0, pady=0, font=(FONT, 11),   # Dark gray when clicked
                                         activeforeground="white",    
@@ -783,11 +1033,11 @@ class ChatClientGUI:
                     self.chat_box.config(state="disabled")
                     self.chat_box.yview(tk.END)
                     
-                    self.progress_n_index.pop(filename, None)
-                    self.upload_confirmation.pop(filename, None)
+                    self.progress_n_index.pop(transfer_id, None)
+                    self.upload_confirmation.pop(transfer_id, None)
                 
-                if filename not in self.upload_confirmation:
-                    self.upload_confirmation[filename] = self.Window.after(2000, finalize_upload)
+                if transfer_id not in self.upload_confirmation:
+                    self.upload_confirmation[transfer_id] = self.Window.after(2000, finalize_upload)
             else:
                 # Check if progress bar still exists before updating
                 if ("bar" in bar_info and bar_info["bar"] and 
@@ -795,10 +1045,10 @@ class ChatClientGUI:
                     bar_info["bar"]["value"] = percent
             
         except Exception as e:
-            print(f"Cannot update the progress bar of {filename}: {e}")
-            log_event("client", "progress_bar_update_error", f"Cannot update progress bar for {filename}: {e}")
+            print(f"Cannot update the progress bar of {transfer_id}: {e}")
+            log_event("client", "progress_bar_update_error", f"Cannot update progress bar for {transfer_id}: {e}")
         
-    def display_progress_bar(self, msg_type, sender, timestamp, filename):
+    def display_progress_bar(self, msg_type, sender, timestamp, filename, transfer_id):
         self.chat_box.config(state="normal")
         tag = "blue" if msg_type == "Global" else "orange"
         formatted = f"({msg_type}) ({sender}) ({timestamp}): {filename} "
@@ -815,34 +1065,28 @@ class ChatClientGUI:
         self.chat_box.tag_config("orange", foreground="darkorange")
         
         # Store the position of the progress bar for later replacing with the download button
-        self.progress_n_index[filename] = {"index": progressbar_pos, 'bar': bar}
+        self.progress_n_index[transfer_id] = {"index": progressbar_pos, 'bar': bar, 'filename': filename}
         
         self.chat_box.config(state="disabled")
         self.chat_box.yview(tk.END)
     
-    def save_file_stream(self, filename):
-        file_path = self.download_files[filename]['path']
-        queue = self.download_files[filename]['queue']
-        computed_hash = self.download_files[filename]['computed_hash']
-        
+    def save_file_stream(self, transfer_id, filename):
+        writer = self.download_files[transfer_id]['writer']
+
         try:
-            with open(file_path, "wb") as f:
-                while True:
-                    chunk = queue.get()
-                    if chunk is None:  # Poison pill
-                        break
-                    
-                    decoded_chunk = base64.b64decode(chunk.encode())
-                    
-                    f.write(decoded_chunk)
-                    computed_hash.update(decoded_chunk)
+            if writer.run():
+                self.display_system_message(f"File {filename} has been successfully downloaded.")
+            else:
+                messagebox.showerror("Error", f"Failed to download file {filename} from server. Please download again.")
+                log_event("client", "finish_download_failed", f"Hash mismatch or incomplete download for {filename}")
         except Exception as e:
             messagebox.showerror("Error", "Failed to write chunk when downloading.")
             log_event("client", "save_file_stream_failed", f"Failed to write chunk when downloading {filename}: {e}")
         finally:
-            self.download_files.pop(filename)
+            self.download_files.pop(transfer_id, None)
+            self.Window.after(0, self._update_download_bar, transfer_id, None)
     
-    def ask_download(self, filename):
+    def ask_download(self, file_id, filename, filesize=0):
         if messagebox.askyesno("Download", f"Do you want to download {filename}?"):
             extension = os.path.splitext(filename)[1]  # get original file extension
             save_path = filedialog.asksaveasfilename(title="Save As", initialfile=filename)
@@ -850,38 +1094,123 @@ class ChatClientGUI:
             if save_path:
                 if not save_path.lower().endswith(extension.lower()):
                     save_path += extension  # auto-append if user forgot
-                    
-                q = Queue()
-                hash_algo_download = hashlib.sha256()
-                
-                self.download_files[filename] = {
-                    'queue': q,
-                    'path': save_path,
-                    'thread': threading.Thread(target=self.save_file_stream, args=(filename,), daemon=True),
-                    'computed_hash': hash_algo_download
+
+                # Pick up where an interrupted download of the same file left off
+                offset = read_resume_offset(save_path, file_id)
+                transfer_id = new_transfer_id()
+
+                # Bytes on disk go back to the server, which keeps at most QUEUE_CHUNKS in flight,
+                # and to the progress bar; the server paces the download, so no pacing here
+                def ack(written):
+                    self.sio.emit('download_ack', {'transfer_id': transfer_id, 'offset': written})
+                    transfer = self.transfers.get(transfer_id)
+                    if transfer:
+                        self.transfers.progress(transfer_id, written - transfer.done_bytes, pace=False)
+
+                self.download_files[transfer_id] = {
+                    'writer': DownloadWriter(filename, save_path, offset, file_id=file_id, on_progress=ack),
+                    'path': save_path
                 }
 
-                self.download_files[filename]['thread'].start()
-                
-                self.sio.emit('download_request', {'filename': filename})
+                def requested(reply=None):
+                    download, transfer = self.download_files.get(transfer_id), self.transfers.get(transfer_id)
+                    # A rejected request gets no chunks; stop the writer instead of waiting on them
+                    if not reply or reply.get('status') != 'ok':
+                        log_event("client", "download_request_failed",
+                                  f"Download of {filename} refused: {(reply or {}).get('reason', 'no reply')}")
+                        if download:
+                            download['writer'].abort()
+                    elif transfer and reply.get('filesize'):
+                        transfer.total_bytes = reply['filesize']
+
+                def run(transfer):
+                    # Only request the chunks once the scheduler hands this download a slot
+                    self.sio.emit('download_request', {'file_id': file_id,
+                                                       'filename': filename,
+                                                       'transfer_id': transfer.id,
+                                                       'offset': offset,
+                                                       'window': QUEUE_CHUNKS}, callback=requested)
+                    self.save_file_stream(transfer.id, filename)
+                    self.transfers.finish(transfer.id)
+
+                self.display_download_bar(transfer_id, filename)
+                self.transfers.submit('download', filename, filesize, run, transfer_id=transfer_id,
+                                      on_progress=lambda transfer: self.Window.after(0, self._update_download_bar,
+                                                                                     transfer.id, transfer.percent))
     
-    def receive_file(self, msg_type, sender, filename, timestamp):
+    def display_download_bar(self, transfer_id, filename):
+        self.chat_box.config(state="normal")
+        self.chat_box.insert(tk.END, f"Downloading {filename} ", "blue")
+        bar = Progressbar(self.chat_box, orient=tk.HORIZONTAL, mode="determinate", maximum=100, length=50)
+        self.chat_box.window_create(tk.END, window=bar, pady=3)
+        self.chat_box.insert(tk.END, "\n")
+        self.download_bars[transfer_id] = bar
+        self.chat_box.config(state="disabled")
+        self.chat_box.yview(tk.END)
+
+    def _update_download_bar(self, transfer_id, percent):
+        # None: the download is over and the bar stays as it is
+        bar = self.download_bars.pop(transfer_id, None) if percent is None else self.download_bars.get(transfer_id)
+        try:
+            if percent is not None and bar is not None and bar.winfo_exists():
+                bar["value"] = percent
+        except tk.TclError:
+            pass  # Window already closed
+
+    def receive_file(self, msg_type, sender, filename, timestamp, file_id, filesize=0):
         self.chat_box.config(state="normal")
         tag = "blue" if msg_type == "Global" else "orange"
         formatted = f"({msg_type}) ({sender}) ({timestamp}): {filename} "
         self.chat_box.insert(tk.END, formatted, tag)
         
-        download_button = tk.Button(self.chat_box, text = "⬇", command = lambda : self.ask_download(filename), 
+        download_button = tk.Button(self.chat_box, text = "⬇", command = lambda : self.ask_download(file_id, filename, filesize), 
                                     bg="dark green", fg="white", relief="flat", width= 2, 
                                     padx=0, pady=0, font=(FONT, 11))
         self.chat_box.window_create(tk.END, window = download_button, pady=3)
         self.chat_box.insert(tk.END, "\n")
+        # The preview arrives later and goes right under this line
+        self.chat_box.mark_set(f"preview_{file_id}", "end-2c")
         
         self.chat_box.tag_config("blue", foreground="dark green")
         self.chat_box.tag_config("orange", foreground="darkorange")
         self.chat_box.config(state="disabled")
         self.chat_box.yview(tk.END)
     
+    @staticmethod
+    def preview_caption(preview):
+        """One-line summary of a file preview, e.g. "1920×1080 · 0:42 · 3.1 MB"."""
+        parts = []
+        if preview.get('width') and preview.get('height'):
+            parts.append(f"{preview['width']}×{preview['height']}")
+        if preview.get('duration'):
+            minutes, seconds = divmod(int(round(preview['duration'])), 60)
+            parts.append(f"{minutes}:{seconds:02d}")
+        size = preview.get('size') or 0
+        parts.append(f"{size / (1000 * 1000):.1f} MB" if size >= 1000 * 1000 else f"{math.ceil(size / 1000)} KB")
+        return " · ".join(parts)
+
+    def show_preview(self, preview):
+        """Insert a thumbnail and caption under the file's chat line."""
+        file_id = preview.get('file_id', '')
+        mark = f"preview_{file_id}"
+        if not hasattr(self, 'chat_box') or mark not in self.chat_box.mark_names():
+            return
+
+        self.chat_box.config(state="normal")
+        self.chat_box.insert(mark, "\n")
+        thumbnail = preview.get('thumbnail')
+        if thumbnail:
+            try:
+                image = tk.PhotoImage(data=base64.b64encode(thumbnail).decode())
+                self.preview_images[file_id] = image
+                self.chat_box.image_create(mark, image=image, padx=4, pady=2)
+            except tk.TclError as e:
+                log_event("client", "preview_error", f"Bad thumbnail for {file_id}: {e}")
+        self.chat_box.insert(mark, f" {self.preview_caption(preview)}", "gray")
+        self.chat_box.tag_config("gray", foreground="gray")
+        self.chat_box.mark_unset(mark)
+        self.chat_box.config(state="disabled")
+
     def check_for_slash_command(self, event):
         """Check if user typed '/' and show suggestion"""
         current_text = self.entry_var.get()
@@ -903,7 +1232,29 @@ class ChatClientGUI:
 
         timestamp = datetime.now().strftime("%H:%M:%S")
 
-        if raw_msg.startswith("/filew "):
+        if raw_msg.startswith("/join "):
+            self.join_room(raw_msg.split(maxsplit=1)[1].strip())
+
+        elif raw_msg.startswith("/leave"):
+            parts = raw_msg.split(maxsplit=1)
+            self.leave_room(parts[1].strip() if len(parts) > 1 else self.current_room)
+
+        elif self.e2e and raw_msg.startswith("/w "):
+            parts = raw_msg.split(maxsplit=2)
+            if len(parts) < 3:
+                self.display_system_message("Invalid private message format. Use '/w username message'")
+                return
+            if self.send_e2e(KIND_PRIVATE, parts[1], parts[2], [parts[1]]):
+                self.display_message("Private", f"To {parts[1]}", parts[2], timestamp)
+
+        elif self.e2e and not raw_msg.startswith("/"):
+            members = self.active_users if self.current_room == "Global" else self.room_members.get(self.current_room, [])
+            self.send_e2e(KIND_ROOM, self.current_room, raw_msg, members)
+
+        elif raw_msg.strip() == "/rooms":
+            self.sio.emit('list_rooms', callback=lambda reply: self.Window.after(0, self.show_rooms, reply))
+
+        elif raw_msg.startswith("/filew "):
             parts = raw_msg.split(maxsplit=2)
             
             if len(parts) >= 3:
@@ -916,19 +1267,14 @@ class ChatClientGUI:
             if len(parts) >= 3:
                 recipient = parts[1]
                 message_content = parts[2]  
-                plaintext = f"{timestamp}|{message_content}" 
-                # encrypted_msg = encrypt_message(plaintext)
                 # --- CHECK IF RECIPIENT IS IN ACTIVE USERS ---
-                if recipient not in self.active_users:
-                    messagebox.showwarning("Warning", f"User '{recipient}' does not exist or is not active.")
+                # Offline users get it from the server's inbox when they next join
+                if recipient not in self.active_users and not messagebox.askyesno(
+                        "Offline", f"User '{recipient}' is not online. Deliver the message when they join?"):
                     return
-                encrypted_msg = encrypt_aes(self.session_aes_key, plaintext)
 
-                self.sio.emit('private_message', {
-                    'recipient': recipient,
-                    'message': encrypted_msg,
-                    'sender': self.username
-                })
+                seq, envelope = self.next_envelope(KIND_PRIVATE, recipient, message_content)
+                self.send_reliable(seq, 'private_message', envelope)
 
                 self.display_message("Private", f"To {recipient}", message_content, timestamp)
 
@@ -936,21 +1282,184 @@ class ChatClientGUI:
                 self.display_system_message("Invalid private message format. Use '/w username message'")
                 return
         else:
-            message_content = raw_msg
-            plaintext = f"{timestamp}|{message_content}"  
-            encrypted_msg = encrypt_aes(self.session_aes_key, plaintext)
+            seq, envelope = self.next_envelope(KIND_ROOM, self.current_room, raw_msg)
+            self.send_reliable(seq, 'global_message', envelope)
+
+        self.entry_var.set("")
 
+    def next_envelope(self, kind, target, text):
+        """Pack an outgoing message; the server fills in the real sender. Returns (seq, envelope)."""
+        self.send_seq += 1
+        return self.send_seq, pack_envelope(kind, self.send_seq, now_ms(), self.username, target, text)
 
-            self.sio.emit('global_message', {
-                'message': encrypted_msg,
-                'sender': self.username
-            })
+    # --- At-least-once delivery ---
+    def send_reliable(self, seq, event, item):
+        """Send a message and keep it until the server acks it."""
+        self.outgoing.add(seq, event, item, time.monotonic())
+        self.emit_reliable(seq, event, item)
 
-        self.entry_var.set("")
+    def emit_reliable(self, seq, event, item):
+        if not self.sio.connected:
+            return  # Re-sent after the reconnect
+        # Envelopes are encrypted per send: a retransmit after a reconnect must use the new key
+        data = {'envelope': encrypt_aes_raw(self.session_aes_key, item)} if isinstance(item, bytes) else item
+        self.sio.emit(event, data, callback=lambda reply=None: self.on_ack(seq, reply))
+
+    def on_ack(self, seq, reply):
+        if reply and reply.get("reason") == "rate_limited":
+            # Sending too fast: leave it pending so the retransmit timer tries again later
+            if self.outgoing.defer(seq, time.monotonic()):
+                self.Window.after(0, self.display_system_message, "Sending too fast; message will be retried.")
+            return
+        if self.outgoing.ack(seq) is None:
+            return  # Ack for an earlier copy of a message we already settled
+        if reply and reply.get("status") == "queued":
+            self.Window.after(0, self.display_system_message, "Recipient is offline; message will be delivered when they join.")
+        elif not reply or reply.get("status") not in ("ok", "duplicate"):
+            reason = (reply or {}).get("reason", "no reply")
+            self.Window.after(0, self.display_system_message, f"Message was not delivered: {reason}")
+
+    def exchange_key(self):
+        # Generate a fresh AES session key and send it RSA-encrypted to the server
+        self.session_aes_key = generate_aes_key()
+        if self.server_public_key is None:
+            self.server_public_key = load_rsa_public_key(self.config.public_key_path)
+        encrypted_aes = encrypt_rsa(self.server_public_key, self.session_aes_key)
+        encrypted_aes_b64 = base64.b64encode(encrypted_aes).decode()
+        # After an automatic reconnect, rejoin once the new key is in place
+        rejoin = (lambda *_: self.update_user_server()) if self.resume_token else None
+        self.sio.emit('exchange_key', {'encrypted_aes': encrypted_aes_b64}, callback=rejoin)
+
+    def on_session_resumed(self, reply=None):
+        if reply and reply.get("status") == "ok":
+            self.update_user_server()
+        else:
+            self.exchange_key()  # Session expired on the server: full handshake
+
+    def on_joined(self, reply=None):
+        if not reply or reply.get("status") != "ok":
+            if reply and reply.get("reason") == "username_taken":
+                self.Window.after(0, self.display_system_message, "Your username was taken while you were away. Please restart and choose another one.")
+            return
+        if reply.get("resume_token") != self.resume_token:
+            self.received = SeqTracker()  # New delivery session, numbering starts over
+        self.resume_token = reply.get("resume_token")
+        if reply.get("replayed"):
+            self.Window.after(0, self.display_system_message, f"Reconnected; {reply['replayed']} missed messages delivered.")
+        if self.e2e:
+            self.publish_e2e_key()  # Keys can only be published once the join has been processed
+        for seq, entry in self.outgoing.all(time.monotonic()):
+            self.emit_reliable(seq, entry['event'], entry['data'])
+        if not self.retransmit_started:
+            self.retransmit_started = True
+            self.Window.after(RETRANSMIT_CHECK_MS, self.retransmit_unacked)
+
+    def retransmit_unacked(self):
+        resend, expired = self.outgoing.due(time.monotonic())
+        for seq, entry in resend:
+            self.emit_reliable(seq, entry['event'], entry['data'])
+        for seq, entry in expired:
+            self.display_system_message(f"Message #{seq} could not be delivered.")
+        self.Window.after(RETRANSMIT_CHECK_MS, self.retransmit_unacked)
+
+    def accept_delivery(self, data):
+        """False for a message already shown (a replay or duplicate delivery)."""
+        dseq = data.get("dseq")
+        return not dseq or not self.received.seen(dseq)
+
+    def exit_if_disconnected(self):
+        if not self.sio.connected:
+            self.display_system_message("Could not reconnect. Exitting...")
+            self.Window.attributes("-disabled", True)
+            self.Window.after(5000, self.force_exit)
+
+    def publish_e2e_key(self):
+        if self.e2e_private_key is None:
+            self.e2e_private_key = generate_rsa_private_key()
+        self.sio.emit('publish_key', {'public_key': public_key_pem(self.e2e_private_key)},
+                      callback=self.store_peer_keys)
+
+    def store_peer_keys(self, reply):
+        if not reply or reply.get("status") != "ok":
+            self.display_system_message("Could not publish end-to-end key")
+            return
+        for username, pem in reply.get("keys", {}).items():
+            try:
+                self.peer_keys[username] = load_rsa_public_key_pem(pem)
+            except Exception as e:
+                log_event("client", "e2e_key_error", f"Bad public key from {username}: {e}")
+
+    def send_e2e(self, kind, target, text, recipients):
+        """Seal one message for every recipient with a published key. Returns False if nobody could get it."""
+        keys = {name: self.peer_keys[name] for name in recipients if name in self.peer_keys}
+        if kind == KIND_PRIVATE and not keys:
+            self.display_system_message(f"{target} has no end-to-end key; message not sent.")
+            return False
+        if kind == KIND_ROOM and self.username in self.peer_keys:
+            keys.setdefault(self.username, self.peer_keys[self.username])  # Echo room messages back to us
+
+        self.send_seq += 1
+        envelope = pack_envelope(kind, self.send_seq, now_ms(), self.username, target, text)
+        ciphertext, wrapped = seal_for(keys, envelope)
+        message = {'seq': self.send_seq, 'ciphertext': ciphertext, 'keys': wrapped}
+        if kind == KIND_ROOM:
+            message['room'] = target
+        else:
+            message['recipient'] = target
+        self.send_reliable(self.send_seq, 'e2e_message', message)
+        return True
+
+    def open_envelope(self, blob):
+        return unpack_envelope(decrypt_aes_raw(self.session_aes_key, blob))
+
+    def display_envelope(self, msg_type, sender, envelope):
+        timestamp = datetime.fromtimestamp(envelope.timestamp / 1000).strftime("%H:%M:%S")
+        self.display_message(msg_type, sender, envelope.payload.decode(), timestamp)
+
+    def display_batch(self, data):
+        """Unpack a server-side batch of room messages (one decrypt for all of them)."""
+        try:
+            payload = decrypt_aes_raw(self.session_aes_key, data.get("batch", b""))
+            entries = unpack_batch(payload, data.get("codec", "none"))
+        except Exception as e:
+            self.display_system_message("Failed to decrypt a batch of messages")
+            log_event("client", "batch_error", f"Failed to unpack batch: {e}")
+            return
+
+        dseqs = data.get("dseqs") or [None] * len(entries)
+        for entry, dseq in zip(entries, dseqs):
+            if not self.accept_delivery({"dseq": dseq}):
+                continue
+            envelope = unpack_envelope(entry)
+            self.display_envelope(envelope.target, envelope.sender, envelope)
+
+    def join_room(self, room):
+        def joined(reply):
+            if reply and reply.get("status") == "ok":
+                self.current_room = room
+                self.room_members[room] = reply.get("members", [])
+                self.display_system_message(f"Now chatting in #{room} (members: {', '.join(reply.get('members', []))})")
+            else:
+                self.display_system_message(f"Could not join #{room}: {(reply or {}).get('reason', 'no reply')}")
+        self.sio.emit('join_room', {'room': room}, callback=lambda reply: self.Window.after(0, joined, reply))
+
+    def leave_room(self, room):
+        def left(reply):
+            if reply and reply.get("status") == "ok":
+                if self.current_room == room:
+                    self.current_room = "Global"
+                self.display_system_message(f"Left #{room}. Now chatting in #{self.current_room}")
+            else:
+                self.display_system_message(f"Could not leave #{room}: {(reply or {}).get('reason', 'no reply')}")
+        self.sio.emit('leave_room', {'room': room}, callback=lambda reply: self.Window.after(0, left, reply))
+
+    def show_rooms(self, reply):
+        rooms = ", ".join(f"#{r['name']} ({r['members']})" for r in (reply or {}).get("rooms", []))
+        self.display_system_message(f"Rooms: {rooms}")
 
     def display_message(self, msg_type, sender, message, timestamp):
         self.chat_box.config(state="normal")
-        tag = "blue" if msg_type == "Global" else "orange"
+        tag = "orange" if msg_type == "Private" else "blue"
         # Insert colored metadata
         metadata = f"({msg_type}) ({sender}) ({timestamp}): "
         self.chat_box.insert(tk.END, metadata, tag)
@@ -1132,8 +1641,9 @@ class ChatClientGUI:
 
     def graceful_exit(self):
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
+            self.closing.set()
             try:
-                if self.sio.connected:
+                if self.sio and self.sio.connected:
                     self.sio.disconnect()   
             except:
                 pass
@@ -1141,12 +1651,18 @@ class ChatClientGUI:
     
     def force_exit(self):
         """Force exit the application without confirmation."""
+        self.closing.set()
         try:
-            if self.sio.connected:
+            if self.sio and self.sio.connected:
                 self.sio.disconnect()
         except:
             pass
         self.Window.destroy()
         
 if __name__ == "__main__":
-    app = ChatClientGUI()
\ No newline at end of file
+    # Flags, CHATSPACE_CLIENT_* variables or chatspace.ini; e.g. --e2e --transport-mode polling
+    try:
+        config = load_client_config(sys.argv[1:])
+    except ConfigError as e:
+        sys.exit(str(e))
+    app = ChatClientGUI(config)
\ No newline at end of file
@@ -0,0 +1,58 @@
+import threading
+
+# Client half of at-least-once messaging: every chat message stays here until
+# the server acks it, and is re-sent when the ack does not arrive in time (or
+# straight away after a reconnect). The server drops repeats by sequence number.
+
+ACK_TIMEOUT = 5.0        # Seconds before an unacked message is sent again
+MAX_ATTEMPTS = 5         # Give up and tell the user after this many sends
+RETRANSMIT_CHECK_MS = 1000
+
+
+class OutgoingMessages:
+    def __init__(self, timeout=ACK_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.pending = {}   # seq -> {'event', 'data', 'sent_at', 'attempts'}
+        self.lock = threading.Lock()
+
+    def add(self, seq, event, data, now):
+        with self.lock:
+            self.pending[seq] = {'event': event, 'data': data, 'sent_at': now, 'attempts': 1}
+
+    def ack(self, seq):
+        with self.lock:
+            return self.pending.pop(seq, None)
+
+    def defer(self, seq, now):
+        """Keep seq pending and retry it after the timeout (e.g. the server rate-limited it)."""
+        with self.lock:
+            entry = self.pending.get(seq)
+            if entry:
+                entry['sent_at'] = now
+            return entry
+
+    def due(self, now):
+        """Return ([(seq, entry)] to re-send now, [(seq, entry)] that ran out of attempts)."""
+        resend, expired = [], []
+        with self.lock:
+            for seq, entry in list(self.pending.items()):
+                if now - entry['sent_at'] < self.timeout:
+                    continue
+                if entry['attempts'] >= self.max_attempts:
+                    expired.append((seq, self.pending.pop(seq)))
+                    continue
+                entry['sent_at'] = now
+                entry['attempts'] += 1
+                resend.append((seq, entry))
+        return resend, expired
+
+    def all(self, now):
+        """Everything still unacked, in send order (e.g. to flush after a reconnect)."""
+        with self.lock:
+            for entry in self.pending.values():
+                entry['sent_at'] = now
+            return sorted(self.pending.items())
+
+    def __len__(self):
+        return len(self.pending)
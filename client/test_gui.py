@@ -107,7 +107,7 @@ class TestChatClientGUI(unittest.TestCase):
     def test_ask_download_decline(self, mock_asksaveasfilename, mock_askyesno):
         """Test declining a file download."""
         mock_askyesno.return_value = False
-        self.gui.ask_download("test_file.txt")
+        self.gui.ask_download("0" * 32, "test_file.txt")
         self.assertFalse(mock_asksaveasfilename.called)
 
     @patch("client.gui.messagebox.askyesno")
@@ -117,7 +117,7 @@ class TestChatClientGUI(unittest.TestCase):
         mock_askyesno.return_value = True
         mock_asksaveasfilename.return_value = "/path/to/save/test_file.txt"
         with patch("threading.Thread.start"):
-            self.gui.ask_download("test_file.txt")
+            self.gui.ask_download("0" * 32, "test_file.txt")
         mock_asksaveasfilename.assert_called_once()
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+# Schedules uploads/downloads by transfer ID so files with the same name never
+# share state, and paces them so concurrent transfers split the bandwidth.
+
+MAX_CONCURRENT = 3
+DEFAULT_BANDWIDTH = 49152 * 20  # Bytes/sec across all transfers (one 48KB chunk per 50ms)
+
+
+def new_transfer_id():
+    return uuid.uuid4().hex
+
+
+class Transfer:
+    def __init__(self, transfer_id, kind, filename, total_bytes, weight=1):
+        self.id = transfer_id
+        self.kind = kind                # 'upload' or 'download'
+        self.filename = filename
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.weight = weight            # Relative bandwidth share
+        self.state = "queued"           # queued -> running -> done / failed / cancelled
+        self.started = None
+        self.next_slot = 0.0            # Monotonic time the next chunk may go out
+        self.callbacks = []
+
+    @property
+    def percent(self):
+        if not self.total_bytes:
+            return 100
+        return min(100, (self.done_bytes * 100) // self.total_bytes)
+
+
+class TransferManager:
+    def __init__(self, max_concurrent=MAX_CONCURRENT, bandwidth=DEFAULT_BANDWIDTH):
+        self.max_concurrent = max_concurrent
+        self.bandwidth = bandwidth      # None disables pacing
+        self.transfers = {}             # transfer_id -> Transfer
+        self.active = set()
+        self.pending = deque()
+        self.lock = threading.Lock()
+
+    def submit(self, kind, filename, total_bytes, run, transfer_id=None, on_progress=None, weight=1):
+        """Queue run(transfer) to execute on a worker thread once a slot frees up."""
+        transfer = Transfer(transfer_id or new_transfer_id(), kind, filename, total_bytes, weight)
+        if on_progress:
+            transfer.callbacks.append(on_progress)
+
+        with self.lock:
+            self.transfers[transfer.id] = transfer
+            self.pending.append((transfer, run))
+        self._schedule()
+        return transfer.id
+
+    def get(self, transfer_id):
+        return self.transfers.get(transfer_id)
+
+    def _schedule(self):
+        with self.lock:
+            ready = []
+            while self.pending and len(self.active) < self.max_concurrent:
+                transfer, run = self.pending.popleft()
+                transfer.state = "running"
+                transfer.started = time.monotonic()
+                self.active.add(transfer.id)
+                ready.append((transfer, run))
+
+        for transfer, run in ready:
+            threading.Thread(target=self._run, args=(transfer, run), daemon=True).start()
+
+    def _run(self, transfer, run):
+        try:
+            run(transfer)
+            if transfer.state == "running":
+                transfer.state = "done"
+        except Exception:
+            transfer.state = "failed"
+            raise
+        finally:
+            with self.lock:
+                self.active.discard(transfer.id)
+            self._schedule()
+
+    def share(self, transfer):
+        """Bytes/sec this transfer may use right now."""
+        if self.bandwidth is None:
+            return None
+        with self.lock:
+            total_weight = sum(self.transfers[t].weight for t in self.active if t in self.transfers) or transfer.weight
+        return self.bandwidth * transfer.weight / total_weight
+
+    def progress(self, transfer_id, nbytes, pace=True):
+        """Record nbytes moved, pace the caller to its bandwidth share (unless pace is False) and fire callbacks."""
+        transfer = self.transfers.get(transfer_id)
+        if not transfer:
+            return
+        transfer.done_bytes += nbytes
+
+        rate = self.share(transfer) if pace else None
+        if rate:
+            now = time.monotonic()
+            transfer.next_slot = max(now, transfer.next_slot) + nbytes / rate
+            if transfer.next_slot > now:
+                time.sleep(transfer.next_slot - now)
+
+        for callback in transfer.callbacks:
+            callback(transfer)
+
+    def cancel(self, transfer_id):
+        transfer = self.transfers.get(transfer_id)
+        if transfer:
+            transfer.state = "cancelled"
+
+    def is_cancelled(self, transfer_id):
+        transfer = self.transfers.get(transfer_id)
+        return transfer is None or transfer.state == "cancelled"
+
+    def finish(self, transfer_id, ok=True):
+        transfer = self.transfers.pop(transfer_id, None)
+        if transfer:
+            transfer.state = "done" if ok else "failed"
+        return transfer
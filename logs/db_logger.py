@@ -1,6 +1,8 @@
 import sqlite3
 from datetime import datetime
 import threading
+import atexit
+import time
 import os
 
 log_lock = threading.Lock()
@@ -8,34 +10,78 @@ log_lock = threading.Lock()
 # Set shared DB file path (relative to project root or use absolute path)
 DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "chat_logs.db"))
 
-# Establish connection
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-
-# Create table if it doesn't exist
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS logs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    role TEXT NOT NULL,         -- 'client' or 'server'
-    source TEXT NOT NULL,       -- e.g., username or SID
-    event TEXT NOT NULL,        -- event message
-    timestamp TEXT NOT NULL     -- when the event occurred
-)
-""")
-conn.commit()
+# Commit batching: 1 commits every event (safest); larger batches trade a few
+# seconds of log on a crash for far fewer fsyncs under load
+LOG_BATCH_SIZE = 1
+LOG_FLUSH_INTERVAL = 1.0   # Seconds; a batch is committed at least this often
+
+conn = None  # Opened on first use, so importing the logger costs nothing
+pending = 0  # Events inserted but not yet committed
+last_commit = time.monotonic()
+
+def configure(db_path=None, batch_size=None, flush_interval=None):
+    """Apply logging settings (see LogConfig in server/config.py); reopens the database if it moved."""
+    global DB_PATH, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL
+    if db_path is not None and os.path.abspath(db_path) != DB_PATH:
+        close_logger()
+        DB_PATH = os.path.abspath(db_path)
+    if batch_size is not None:
+        LOG_BATCH_SIZE = batch_size
+    if flush_interval is not None:
+        LOG_FLUSH_INTERVAL = flush_interval
+
+def _connection():
+    """Open the database and create the table on first use (call with log_lock held)."""
+    global conn
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,         -- 'client' or 'server'
+            source TEXT NOT NULL,       -- e.g., username or SID
+            event TEXT NOT NULL,        -- event message
+            timestamp TEXT NOT NULL     -- when the event occurred
+        )
+        """)
+        conn.commit()
+    return conn
+
+def _commit():
+    """Commit the open batch (call with log_lock held)."""
+    global pending, last_commit
+    if conn is not None and pending:
+        conn.commit()
+    pending = 0
+    last_commit = time.monotonic()
 
 def log_event(role, source, event):
     """Thread-safe log insertion"""
+    global pending
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     with log_lock:
-        cursor.execute(
+        db = _connection()
+        db.execute(
             "INSERT INTO logs (role, source, event, timestamp) VALUES (?, ?, ?, ?)",
             (role, source, event, timestamp)
         )
-        conn.commit()
+        pending += 1
+        if pending >= LOG_BATCH_SIZE or time.monotonic() - last_commit >= LOG_FLUSH_INTERVAL:
+            _commit()
+
+def flush_logs():
+    """Make sure everything logged so far is on disk (called on shutdown and by server maintenance)."""
+    with log_lock:
+        _commit()
 
 def close_logger():
+    global conn
     with log_lock:
-        conn.close()
+        if conn is not None:
+            _commit()
+            conn.close()
+            conn = None
+
+atexit.register(flush_logs)  # A partial batch is not lost on a normal exit
 
 
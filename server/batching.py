@@ -0,0 +1,87 @@
+import struct
+
+from server.compression import available_codec, compress, decompress
+
+# Optional per-recipient batching of room messages. Instead of one packet per
+# message per recipient, messages for a recipient are collected for a short
+# window, serialized together, optionally compressed, then encrypted once.
+#
+# Batch payload: AES(compress(len + envelope, len + envelope, ...)), lengths as !I
+
+BATCH_WINDOW_MS = 0             # 0 disables batching; 5-20ms is a sensible range
+BATCH_CODEC = "zlib"            # "zlib", "zstd" or "none"
+COMPRESS_MIN_BYTES = 256        # Smaller batches are sent uncompressed
+MAX_BATCH = 200                 # Flush early once this many messages are pending
+
+LENGTH = struct.Struct("!I")
+
+
+def pack_batch(entries, codec):
+    """Serialize a list of packed envelopes. Returns (payload bytes, codec actually used)."""
+    raw = b"".join(LENGTH.pack(len(entry)) + entry for entry in entries)
+    if codec == "none" or len(raw) < COMPRESS_MIN_BYTES:
+        return raw, "none"
+    return compress(raw, codec), codec
+
+
+def unpack_batch(payload, codec):
+    raw = decompress(payload, codec)
+    entries = []
+    pos = 0
+    while pos < len(raw):
+        (length,) = LENGTH.unpack_from(raw, pos)
+        pos += LENGTH.size
+        entries.append(raw[pos:pos + length])
+        pos += length
+    return entries
+
+
+class MessageBatcher:
+    def __init__(self, deliver, spawn, sleep, window_ms=BATCH_WINDOW_MS, codec=BATCH_CODEC, max_batch=MAX_BATCH):
+        self.deliver = deliver          # deliver(sid, payload bytes, codec, count, tags)
+        self.spawn = spawn              # start a background task
+        self.sleep = sleep
+        self.window = window_ms / 1000.0
+        self.codec = available_codec(codec)
+        self.max_batch = max_batch
+        self.pending = {}               # sid -> list of (entry, tag)
+
+        self.batches = 0
+        self.messages = 0
+        self.raw_bytes = 0
+        self.packed_bytes = 0
+
+    def add(self, sid, entry, tag=None):
+        """Queue entry for sid; tag (e.g. a delivery number) is handed back with the batch."""
+        entries = self.pending.get(sid)
+        if entries is None:
+            # First message for this recipient opens a window
+            entries = self.pending[sid] = []
+            self.spawn(self._flush_later, sid)
+        entries.append((entry, tag))
+        if len(entries) >= self.max_batch:
+            self.flush(sid)
+
+    def _flush_later(self, sid):
+        self.sleep(self.window)
+        self.flush(sid)
+
+    def flush(self, sid):
+        pending = self.pending.pop(sid, None)
+        if not pending:
+            return
+        entries = [entry for entry, _ in pending]
+        payload, codec = pack_batch(entries, self.codec)
+
+        self.batches += 1
+        self.messages += len(entries)
+        self.raw_bytes += sum(len(entry) for entry in entries)
+        self.packed_bytes += len(payload)
+        self.deliver(sid, payload, codec, len(entries), [tag for _, tag in pending])
+
+    def discard(self, sid):
+        self.pending.pop(sid, None)
+
+    def stats(self):
+        return {'batches': self.batches, 'messages': self.messages,
+                'raw_bytes': self.raw_bytes, 'packed_bytes': self.packed_bytes}
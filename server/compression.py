@@ -0,0 +1,115 @@
+import io
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional: falls back to zlib
+    zstandard = None
+
+# Codecs shared by message batching and file uploads.
+#
+# Uploads compress each chunk on its own rather than as one stream, so a chunk
+# can still be written as soon as it arrives, rate limits see wire bytes, and a
+# resumed upload can pick up at any chunk boundary. Before offering a codec the
+# client samples the file: media that is already compressed (JPEG, MP4, MP3)
+# would only cost CPU.
+
+CODECS = ("none", "zlib", "zstd")
+UPLOAD_CODECS = ("zstd", "zlib")      # Client preference when offering compression
+UPLOAD_LEVELS = {"zlib": 1, "zstd": 3}  # Fast levels: chunks are compressed while uploading
+
+COMPRESSED_EXTENSIONS = ("jpg", "jpeg", "png", "gif", "webp", "mp4", "mov", "mkv", "webm",
+                         "mp3", "aac", "ogg", "flac", "m4a", "zip", "gz", "7z", "rar", "pdf")
+SAMPLE_SIZE = 16 * 1024        # Bytes per sample
+SAMPLE_COUNT = 4               # Samples spread evenly across the file
+MIN_SAVING = 0.10              # Compress only if the samples shrink by at least this much
+
+
+def available_codec(codec):
+    """Fall back to zlib when zstd was asked for but is not installed."""
+    if codec == "zstd" and zstandard is None:
+        return "zlib"
+    return codec if codec in CODECS else "none"
+
+
+def compress(data, codec, level=None):
+    if codec == "zlib":
+        return zlib.compress(data, 6 if level is None else level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    return data
+
+
+def decompress(data, codec):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd data received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def decompress_bounded(data, codec, limit):
+    """Decompress at most limit bytes. Raises ValueError if the data expands past it."""
+    if codec == "zlib":
+        # max_length=0 means unbounded to zlib, so ask for one byte more and check
+        decompressor = zlib.decompressobj()
+        out = decompressor.decompress(data, limit + 1)
+        if len(out) > limit or not decompressor.eof:
+            raise ValueError("decompressed chunk exceeds limit")
+        return out
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd data received but zstandard is not installed")
+        out = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read(limit + 1)
+        if len(out) > limit:
+            raise ValueError("decompressed chunk exceeds limit")
+        return out
+    return data
+
+
+# --- Upload negotiation ---
+def sample_saving(path, sample_size=SAMPLE_SIZE, samples=SAMPLE_COUNT):
+    """Fraction of bytes a fast zlib pass saves on a few samples of the file."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0.0
+    step = max((size - sample_size) // max(samples - 1, 1), 1)
+    raw = packed = 0
+    with open(path, "rb") as f:
+        for i in range(samples):
+            f.seek(min(i * step, max(size - sample_size, 0)))
+            block = f.read(sample_size)
+            if not block:
+                break
+            raw += len(block)
+            packed += len(zlib.compress(block, 1))
+    return 1 - packed / raw if raw else 0.0
+
+
+def upload_codecs(path):
+    """Codecs to offer at start_upload, best first; empty when compression would not pay."""
+    extension = os.path.splitext(path)[1][1:].lower()
+    if extension in COMPRESSED_EXTENSIONS or sample_saving(path) < MIN_SAVING:
+        return []
+    return [codec for codec in UPLOAD_CODECS if codec != "zstd" or zstandard is not None]
+
+
+def compress_chunk(chunk, codec):
+    """(payload, compressed) for one upload chunk; chunks that would not shrink go raw."""
+    if codec == "none":
+        return chunk, False
+    packed = compress(chunk, codec, UPLOAD_LEVELS.get(codec))
+    if len(packed) >= len(chunk):
+        return chunk, False
+    return packed, True
+
+
+def negotiate(offered):
+    """Server side: the first offered codec this process supports, or "none"."""
+    for codec in offered or ():
+        if codec in UPLOAD_CODECS and available_codec(codec) == codec:
+            return codec
+    return "none"
@@ -0,0 +1,213 @@
+import argparse
+import configparser
+import os
+from dataclasses import dataclass, field, fields
+
+from logs.db_logger import DB_PATH, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL
+from server.batching import BATCH_WINDOW_MS, BATCH_CODEC
+from server.compression import CODECS, zstandard
+from server.previews import PREVIEW_WORKERS
+from server.diskio import DISK_WORKERS
+from server.outbound import POLICIES, DEFAULT_POLICY, MAX_QUEUE, MAX_BULK
+from server.transport import (TRANSPORT_MODES, TRANSPORT_MODE, PING_INTERVAL, PING_TIMEOUT,
+                              CHUNK_SIZE, PERMESSAGE_DEFLATE)
+
+# Deployment settings for the server, the client and the log database.
+#
+# Each section is a dataclass whose defaults are the module constants the code
+# used before, so running without any configuration behaves exactly as before.
+# Values are layered, later ones winning:
+#
+#     defaults < config file < environment < command line
+#
+# The file is INI with [server], [client] and [logging] sections, read from
+# --config, $CHATSPACE_CONFIG or chatspace.ini in the project root. Environment
+# variables are CHATSPACE_<SECTION>_<FIELD> (e.g. CHATSPACE_SERVER_PORT=9000)
+# and every field is also a flag (--port 9000). Everything is type-checked and
+# validated before the program starts.
+
+CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "chatspace.ini"))
+ENV_PREFIX = "CHATSPACE"
+MIN_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+UPLOAD_FOLDER = "upload_files"
+PRIVATE_KEY_PATH = "private_key.pem"
+HOST = "localhost"
+PORT = 8080
+MAX_CONNECTIONS = 1024      # Concurrent connections (eventlet's green thread pool)
+
+TRUE_WORDS = ("1", "true", "yes", "on")
+FALSE_WORDS = ("0", "false", "no", "off")
+
+
+class ConfigError(ValueError):
+    """Invalid configuration; the message lists every problem found."""
+
+
+def setting(default, help):
+    return field(default=default, metadata={'help': help})
+
+
+@dataclass
+class ServerConfig:
+    SECTION = "server"
+
+    host: str = setting(HOST, "address to bind")
+    port: int = setting(PORT, "port to listen on")
+    max_connections: int = setting(MAX_CONNECTIONS, "size of the connection pool")
+    upload_folder: str = setting(UPLOAD_FOLDER, "where uploaded files are stored")
+    private_key_path: str = setting(PRIVATE_KEY_PATH, "RSA private key for the key exchange")
+    chunk_size: int = setting(CHUNK_SIZE, "bytes per download chunk; sizes the inbound packet limit")
+    transport_mode: str = setting(TRANSPORT_MODE, "websocket, upgrade or polling")
+    ping_interval: float = setting(PING_INTERVAL, "seconds between pings")
+    ping_timeout: float = setting(PING_TIMEOUT, "seconds to wait for a pong")
+    compression: bool = setting(PERMESSAGE_DEFLATE, "permessage-deflate and polling compression")
+    batch_window_ms: int = setting(BATCH_WINDOW_MS, "room message batching window, 0 disables")
+    batch_codec: str = setting(BATCH_CODEC, "batch compression: none, zlib or zstd")
+    preview_workers: int = setting(PREVIEW_WORKERS, "processes generating file previews")
+    disk_workers: int = setting(DISK_WORKERS, "threads writing and hashing uploads")
+    admin_token: str = setting("", "shared secret for the /admin namespace; empty disables it")
+    queue_policy: str = setting(DEFAULT_POLICY, "full send queue: drop_oldest, coalesce or disconnect")
+    max_queue: int = setting(MAX_QUEUE, "control and chat messages queued per client")
+    max_bulk: int = setting(MAX_BULK, "file chunks queued per client")
+
+    def validate(self):
+        errors = []
+        if not 1 <= self.port <= 65535:
+            errors.append(f"port must be 1-65535, got {self.port}")
+        if self.max_connections < 1:
+            errors.append("max_connections must be at least 1")
+        if not MIN_CHUNK_SIZE <= self.chunk_size <= MAX_CHUNK_SIZE:
+            errors.append(f"chunk_size must be {MIN_CHUNK_SIZE}-{MAX_CHUNK_SIZE} bytes, got {self.chunk_size}")
+        if self.transport_mode not in TRANSPORT_MODES:
+            errors.append(f"transport_mode must be one of {', '.join(TRANSPORT_MODES)}, got {self.transport_mode!r}")
+        if self.ping_interval <= 0 or self.ping_timeout <= 0:
+            errors.append("ping_interval and ping_timeout must be positive")
+        if self.batch_window_ms < 0:
+            errors.append("batch_window_ms cannot be negative")
+        if self.batch_codec not in CODECS:
+            errors.append(f"batch_codec must be one of {', '.join(CODECS)}, got {self.batch_codec!r}")
+        elif self.batch_codec == "zstd" and zstandard is None:
+            errors.append("batch_codec zstd needs the zstandard package (pip install zstandard)")
+        if self.preview_workers < 1:
+            errors.append("preview_workers must be at least 1")
+        if self.disk_workers < 1:
+            errors.append("disk_workers must be at least 1")
+        if not os.path.isfile(self.private_key_path):
+            errors.append(f"private_key_path {self.private_key_path!r} does not exist (run rsa_key_generator.py)")
+        if self.queue_policy not in POLICIES:
+            errors.append(f"queue_policy must be one of {', '.join(POLICIES)}, got {self.queue_policy!r}")
+        if self.max_queue < 1 or self.max_bulk < 1:
+            errors.append("max_queue and max_bulk must be at least 1")
+        if self.admin_token and len(self.admin_token) < 16:
+            errors.append("admin_token must be at least 16 characters")
+        parent = os.path.dirname(os.path.abspath(self.upload_folder))
+        if not os.path.isdir(self.upload_folder) and not os.access(parent, os.W_OK):
+            errors.append(f"upload_folder {self.upload_folder!r} does not exist and cannot be created")
+        return errors
+
+
+@dataclass
+class LogConfig:
+    SECTION = "logging"
+
+    log_db_path: str = setting(DB_PATH, "SQLite file for the event log")
+    log_batch_size: int = setting(LOG_BATCH_SIZE, "events per commit (1 commits every event)")
+    log_flush_interval: float = setting(LOG_FLUSH_INTERVAL, "commit at least this often, in seconds")
+
+    def validate(self):
+        errors = []
+        if self.log_batch_size < 1:
+            errors.append("log_batch_size must be at least 1")
+        if self.log_flush_interval < 0:
+            errors.append("log_flush_interval cannot be negative")
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.log_db_path))):
+            errors.append(f"log_db_path {self.log_db_path!r} is not in an existing directory")
+        return errors
+
+
+# --- Loading ---
+def parse_value(kind, raw, name):
+    if isinstance(raw, kind) and not (kind is int and isinstance(raw, bool)):
+        return raw
+    text = str(raw).strip()
+    try:
+        if kind is bool:
+            if text.lower() in TRUE_WORDS:
+                return True
+            if text.lower() in FALSE_WORDS:
+                return False
+            raise ValueError
+        return kind(text)
+    except ValueError:
+        raise ConfigError(f"{name}: expected {kind.__name__}, got {raw!r}") from None
+
+
+def field_types(section):
+    types = {'str': str, 'int': int, 'float': float, 'bool': bool}
+    return {f.name: types.get(f.type, f.type) if isinstance(f.type, str) else f.type for f in fields(section)}
+
+
+def build_parser(sections, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Settings can also come from a config file "
+                                     f"or {ENV_PREFIX}_<SECTION>_<FIELD> environment variables.")
+    parser.add_argument("--config", help=f"INI file (default: ${ENV_PREFIX}_CONFIG or {CONFIG_PATH})")
+    for section in sections:
+        group = parser.add_argument_group(section.SECTION)
+        for f in fields(section):
+            flag = "--" + f.name.replace("_", "-")
+            if field_types(section)[f.name] is bool:
+                group.add_argument(flag, dest=f.name, action=argparse.BooleanOptionalAction, default=None,
+                                   help=f.metadata.get('help'))
+            else:
+                group.add_argument(flag, dest=f.name, default=None, help=f.metadata.get('help'))
+    return parser
+
+
+def load_config(*sections, argv=None, env=None, path=None, prog=None):
+    """Build one instance per section class from defaults, file, environment and argv.
+
+    Returns a single instance for one section, else a tuple. Raises ConfigError
+    (or exits, for bad flags) when anything is invalid.
+    """
+    env = os.environ if env is None else env
+    args = build_parser(sections, prog).parse_args([] if argv is None else argv)
+
+    path = path or args.config or env.get(f"{ENV_PREFIX}_CONFIG")
+    if path is None and os.path.exists(CONFIG_PATH):
+        path = CONFIG_PATH
+    ini = configparser.ConfigParser()
+    if path is not None:
+        if not ini.read(path):
+            raise ConfigError(f"config file {path!r} could not be read")
+
+    results, errors = [], []
+    for section in sections:
+        types = field_types(section)
+        values = {}
+        if ini.has_section(section.SECTION):
+            for name, raw in ini.items(section.SECTION):
+                if name not in types:
+                    errors.append(f"[{section.SECTION}] unknown setting {name!r}")
+                    continue
+                values[name] = raw
+        for name in types:
+            raw = env.get(f"{ENV_PREFIX}_{section.SECTION}_{name}".upper())
+            if raw is not None:
+                values[name] = raw
+            if getattr(args, name) is not None:
+                values[name] = getattr(args, name)
+
+        try:
+            config = section(**{name: parse_value(types[name], raw, f"{section.SECTION}.{name}")
+                                for name, raw in values.items()})
+        except ConfigError as e:
+            errors.append(str(e))
+            continue
+        errors.extend(f"{section.SECTION}.{message}" for message in config.validate())
+        results.append(config)
+
+    if errors:
+        raise ConfigError("invalid configuration:\n  " + "\n  ".join(errors))
+    return results[0] if len(results) == 1 else tuple(results)
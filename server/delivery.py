@@ -0,0 +1,111 @@
+import secrets
+import time
+from collections import deque
+
+from server.envelope import SeqTracker
+
+# At-least-once delivery state that outlives a single connection.
+#
+# Each joined user gets a delivery session identified by a resume token. The
+# session numbers every chat message sent to the user (dseq) and keeps the most
+# recent ones, so a client that reconnects with its token and last dseq gets
+# only what it missed. It also remembers which of the user's own sequence
+# numbers were already accepted, so retransmits after a reconnect are dropped.
+
+REPLAY_SIZE = 100        # Messages kept per user for replay
+REPLAY_TTL = 120         # Seconds a disconnected session can still be resumed
+
+
+class DeliverySession:
+    def __init__(self, token, size=REPLAY_SIZE):
+        self.token = token
+        self.last_dseq = 0
+        self.entries = deque(maxlen=size)   # (dseq, event, item)
+        self.seen = SeqTracker()            # Sender-side sequence numbers already accepted
+        self.detached = None                # Monotonic time of disconnect, None while connected
+        self.aes_key = None                 # Lets the client reconnect without a new RSA handshake
+        self.username = None                # Name reserved for the session while it can be resumed
+
+
+class DeliveryTracker:
+    def __init__(self, size=REPLAY_SIZE, ttl=REPLAY_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.sessions = {}  # token -> DeliverySession
+
+    def open(self, token=None):
+        """Resume a session by token, or start a new one. Returns (session, resumed).
+
+        The old connection may not have timed out yet when the client comes back,
+        so an attached session can be taken over too: only its owner knows the token.
+        """
+        session = self.sessions.get(token) if token else None
+        if session is not None:
+            session.detached = None
+            return session, True
+
+        session = DeliverySession(secrets.token_hex(16), self.size)
+        self.sessions[session.token] = session
+        return session, False
+
+    def get(self, token):
+        return self.sessions.get(token)
+
+    def record(self, token, event, item):
+        """Number an outgoing message and keep it for replay. Returns its dseq (0 without a session)."""
+        session = self.sessions.get(token)
+        if session is None:
+            return 0
+        session.last_dseq += 1
+        session.entries.append((session.last_dseq, event, item))
+        return session.last_dseq
+
+    def since(self, token, dseq):
+        session = self.sessions.get(token)
+        if session is None:
+            return []
+        return [entry for entry in session.entries if entry[0] > dseq]
+
+    def is_duplicate(self, token, seq):
+        session = self.sessions.get(token)
+        return session is not None and session.seen.seen(seq)
+
+    def detach(self, token, now=None):
+        session = self.sessions.get(token)
+        if session is not None:
+            session.detached = time.monotonic() if now is None else now
+
+    def close(self, token):
+        self.sessions.pop(token, None)
+
+    def export(self):
+        """Plain-data copy of every session, for a restart snapshot."""
+        return [{'token': session.token, 'aes_key': session.aes_key, 'username': session.username,
+                 'last_dseq': session.last_dseq,
+                 'entries': list(session.entries), 'seen_high': session.seen.high,
+                 'seen_recent': sorted(session.seen.recent)}
+                for session in self.sessions.values()]
+
+    def restore(self, exported, now=None):
+        """Recreate sessions from export(). They start detached, so unclaimed ones expire normally."""
+        now = time.monotonic() if now is None else now
+        for item in exported:
+            session = DeliverySession(item['token'], self.size)
+            session.aes_key = item.get('aes_key')
+            session.username = item.get('username')
+            session.last_dseq = item.get('last_dseq', 0)
+            session.entries.extend(tuple(entry) for entry in item.get('entries', []))
+            session.seen.high = item.get('seen_high', 0)
+            session.seen.recent = set(item.get('seen_recent', []))
+            session.detached = now
+            self.sessions[session.token] = session
+        return len(exported)
+
+    def expire(self, now=None):
+        """Forget sessions that stayed disconnected longer than the TTL."""
+        now = time.monotonic() if now is None else now
+        expired = [token for token, session in self.sessions.items()
+                   if session.detached is not None and now - session.detached > self.ttl]
+        for token in expired:
+            del self.sessions[token]
+        return len(expired)
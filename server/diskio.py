@@ -0,0 +1,159 @@
+import hashlib
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Upload writes and hashing off the event loop.
+#
+# The server does not monkey-patch, so a write to a slow or busy disk inside a
+# handler stalls every socket. Instead each upload gets an UploadWriter: chunks
+# are queued on the loop and a shared thread pool writes and hashes them. Both
+# file.write and hashlib release the GIL for chunk-sized buffers, so the loop
+# keeps running meanwhile.
+#
+# Ordering: a writer has at most one drain job on the pool at a time and that
+# job takes chunks in the order they were queued, so the pool can be shared by
+# any number of uploads without interleaving within a file.
+#
+# Bounded: a writer refuses chunks once DISK_BUFFER bytes are waiting for the
+# disk; the caller aborts the upload rather than buffer without limit.
+
+DISK_WORKERS = 4                     # Threads shared by all uploads
+DISK_BUFFER = 8 * 1024 * 1024        # Bytes one upload may have queued for the disk
+DISK_POLL = 0.005                    # Seconds between checks while waiting for a writer
+REHASH_BLOCK = 1024 * 1024           # Read size when rehashing a resumed upload
+
+
+# --- Blocking helpers (run on the pool) ---
+def sync_and_close(file):
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+
+
+def reopen_upload(path, received):
+    """Reopen a checkpointed upload at `received` bytes; returns (file, sha256 of what is kept)."""
+    file = open(path, 'r+b')
+    try:
+        file.truncate(received)
+        hasher = hashlib.sha256()
+        while True:
+            block = file.read(REHASH_BLOCK)
+            if not block:
+                break
+            hasher.update(block)
+    except Exception:
+        file.close()
+        raise
+    return file, hasher
+
+
+class UploadWriter:
+    """Ordered, bounded writes and hashing for one upload file."""
+
+    def __init__(self, submit, file, hasher, max_pending=DISK_BUFFER):
+        self.submit = submit          # Runs a callable on the pool
+        self.file = file
+        self.hasher = hasher
+        self.max_pending = max_pending
+        self.pending = deque()        # Chunks not yet on disk, oldest first
+        self.pending_bytes = 0
+        self.running = False          # A drain job is queued or running
+        self.error = None             # First write failure; later chunks are dropped
+        self.lock = threading.Lock()  # pending is shared with the drain thread
+
+    def write(self, chunk):
+        """Queue a chunk. False if the buffer is full or an earlier write failed."""
+        with self.lock:
+            if self.error is not None or self.pending_bytes + len(chunk) > self.max_pending:
+                return False
+            self.pending.append(chunk)
+            self.pending_bytes += len(chunk)
+            if self.running:
+                return True
+            self.running = True
+        self.submit(self.drain)
+        return True
+
+    def drain(self):
+        while True:
+            with self.lock:
+                if not self.pending or self.error is not None:
+                    self.running = False
+                    return
+                chunk = self.pending.popleft()
+            try:
+                self.file.write(chunk)
+                self.hasher.update(chunk)
+            except Exception as e:
+                with self.lock:
+                    self.error = e
+                    self.pending.clear()
+                    self.pending_bytes = 0
+                    self.running = False
+                return
+            with self.lock:
+                self.pending_bytes -= len(chunk)
+
+    def discard(self):
+        """Drop chunks that have not been written yet (the upload is being aborted)."""
+        with self.lock:
+            # The chunk a drain is writing has left pending already; the drain uncounts it itself
+            self.pending_bytes -= sum(len(chunk) for chunk in self.pending)
+            self.pending.clear()
+
+    @property
+    def idle(self):
+        with self.lock:
+            return not self.running
+
+
+class DiskIO:
+    def __init__(self, sleep, workers=DISK_WORKERS, max_pending=DISK_BUFFER):
+        self.sleep = sleep
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = None          # Created on first use
+
+        self.chunks = 0
+        self.bytes = 0
+        self.rejected = 0             # Chunks refused by a full or failed writer
+
+    def writer(self, file, hasher):
+        return UploadWriter(self.submit, file, hasher, self.max_pending)
+
+    def submit(self, fn, *args):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="diskio")
+        return self.executor.submit(fn, *args)
+
+    def write(self, writer, chunk):
+        if not writer.write(chunk):
+            self.rejected += 1
+            return False
+        self.chunks += 1
+        self.bytes += len(chunk)
+        return True
+
+    def flush(self, writer):
+        """Wait, yielding to the loop, until every queued chunk of writer is on disk or dropped."""
+        while not writer.idle:
+            self.sleep(DISK_POLL)
+        return writer.error
+
+    def run(self, fn, *args):
+        """Run a blocking call on the pool and wait for it, yielding to the loop. Re-raises its error."""
+        future = self.submit(fn, *args)
+        # Poll instead of add_done_callback: callbacks would run on the pool's thread
+        while not future.done():
+            self.sleep(DISK_POLL)
+        return future.result()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def stats(self):
+        return {'chunks': self.chunks, 'bytes': self.bytes, 'rejected': self.rejected}
@@ -10,18 +10,29 @@ def generate_aes_key():
     return os.urandom(32)  # 256-bit random key
 
 def encrypt_aes(aes_key, message: str) -> str:
+    return encrypt_aes_bytes(aes_key, message.encode())
+
+def decrypt_aes(aes_key, ciphertext_b64: str) -> str:
+    return decrypt_aes_bytes(aes_key, ciphertext_b64).decode()
+
+def encrypt_aes_bytes(aes_key, data: bytes) -> str:
+    return base64.b64encode(encrypt_aes_raw(aes_key, data)).decode()
+
+def decrypt_aes_bytes(aes_key, ciphertext_b64: str) -> bytes:
+    return decrypt_aes_raw(aes_key, base64.b64decode(ciphertext_b64.encode()))
+
+def encrypt_aes_raw(aes_key, data: bytes) -> bytes:
     iv = os.urandom(16)
     padder = padding.PKCS7(128).padder()
-    padded_data = padder.update(message.encode()) + padder.finalize()
+    padded_data = padder.update(data) + padder.finalize()
 
     cipher = Cipher(algorithms.AES(aes_key), modes.CBC(iv), backend=default_backend())
     encryptor = cipher.encryptor()
     ciphertext = encryptor.update(padded_data) + encryptor.finalize()
 
-    return base64.b64encode(iv + ciphertext).decode()
+    return iv + ciphertext
 
-def decrypt_aes(aes_key, ciphertext_b64: str) -> str:
-    data = base64.b64decode(ciphertext_b64.encode())
+def decrypt_aes_raw(aes_key, data: bytes) -> bytes:
     iv = data[:16]
     ciphertext = data[16:]
 
@@ -30,12 +41,22 @@ def decrypt_aes(aes_key, ciphertext_b64: str) -> str:
     padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
 
     unpadder = padding.PKCS7(128).unpadder()
-    plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
-
-    return plaintext.decode()
+    return unpadder.update(padded_plaintext) + unpadder.finalize()
 
 # RSA part
 
+def generate_rsa_private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def public_key_pem(private_key) -> str:
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+def load_rsa_public_key_pem(pem: str):
+    return serialization.load_pem_public_key(pem.encode())
+
 def load_rsa_public_key(filepath):
     with open(filepath, "rb") as f:
         public_key = serialization.load_pem_public_key(f.read())
@@ -65,3 +86,14 @@ def decrypt_rsa(private_key, ciphertext: bytes) -> bytes:
             label=None
         )
     )
+
+# End-to-end part: one AES message key per message, wrapped for each recipient
+
+def seal_for(public_keys, data: bytes):
+    """Encrypt data once and wrap its key per recipient. Returns (ciphertext, {name: wrapped_key})."""
+    message_key = generate_aes_key()
+    ciphertext = encrypt_aes_raw(message_key, data)
+    return ciphertext, {name: encrypt_rsa(key, message_key) for name, key in public_keys.items()}
+
+def open_sealed(private_key, ciphertext: bytes, wrapped_key: bytes) -> bytes:
+    return decrypt_aes_raw(decrypt_rsa(private_key, wrapped_key), ciphertext)
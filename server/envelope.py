@@ -0,0 +1,108 @@
+import struct
+import time
+from collections import namedtuple
+
+# Compact binary message envelope, shared by client and server.
+#
+#   !B  version
+#   !B  kind         KIND_ROOM or KIND_PRIVATE
+#   !Q  seq          per-sender monotonic sequence number
+#   !Q  timestamp    sender's clock, ms since the epoch
+#   !B  len + sender (utf-8)   overwritten by the server with the authenticated username
+#   !B  len + target (utf-8)   room name or recipient username
+#   ... payload      message text (utf-8), the rest of the envelope
+#
+# The whole envelope is AES-encrypted and sent as a binary Socket.IO attachment.
+
+VERSION = 1
+KIND_ROOM = 0
+KIND_PRIVATE = 1
+
+HEADER = struct.Struct("!BBQQ")
+MAX_NAME = 255
+MAX_PAYLOAD = 64 * 1024
+
+Envelope = namedtuple("Envelope", "kind seq timestamp sender target payload")
+
+
+class EnvelopeError(ValueError):
+    pass
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def pack_envelope(kind, seq, timestamp, sender, target, payload):
+    sender_b = sender.encode()
+    target_b = target.encode()
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if len(sender_b) > MAX_NAME or len(target_b) > MAX_NAME:
+        raise EnvelopeError("name too long")
+    if len(payload) > MAX_PAYLOAD:
+        raise EnvelopeError("payload too large")
+    return b"".join((HEADER.pack(VERSION, kind, seq, timestamp),
+                     bytes((len(sender_b),)), sender_b,
+                     bytes((len(target_b),)), target_b,
+                     payload))
+
+
+def unpack_envelope(data):
+    if len(data) < HEADER.size + 2:
+        raise EnvelopeError("envelope too short")
+    version, kind, seq, timestamp = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise EnvelopeError(f"unsupported envelope version {version}")
+    if kind not in (KIND_ROOM, KIND_PRIVATE):
+        raise EnvelopeError(f"unknown envelope kind {kind}")
+
+    pos = HEADER.size
+    sender, pos = _read_name(data, pos)
+    target, pos = _read_name(data, pos)
+    payload = bytes(data[pos:])
+    if len(payload) > MAX_PAYLOAD:
+        raise EnvelopeError("payload too large")
+    return Envelope(kind, seq, timestamp, sender, target, payload)
+
+
+def _read_name(data, pos):
+    if pos >= len(data):
+        raise EnvelopeError("truncated envelope")
+    length = data[pos]
+    end = pos + 1 + length
+    if end > len(data):
+        raise EnvelopeError("truncated envelope")
+    try:
+        return bytes(data[pos + 1:end]).decode(), end
+    except UnicodeDecodeError:
+        raise EnvelopeError("invalid name encoding")
+
+
+def restamp(envelope, sender):
+    """Re-pack an envelope with the server-authenticated sender."""
+    return pack_envelope(envelope.kind, envelope.seq, envelope.timestamp, sender,
+                         envelope.target, envelope.payload)
+
+
+class SeqTracker:
+    """Remembers recently seen sequence numbers so retransmits can be dropped."""
+
+    WINDOW = 1024
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.high = 0
+        self.recent = set()
+
+    def seen(self, seq):
+        """Record seq; returns True if it was already seen (or is too old to tell)."""
+        if seq <= self.high - self.window or seq in self.recent:
+            return True
+        self.recent.add(seq)
+        if seq > self.high:
+            self.high = seq
+            if len(self.recent) > self.window:
+                floor = self.high - self.window
+                self.recent = {s for s in self.recent if s > floor}
+        return False
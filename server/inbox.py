@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Durable per-user inbox for private messages sent while the recipient is
+# offline. Messages are kept as packed envelopes in SQLite and handed over in
+# one batch the next time the user joins.
+#
+# Only names that have joined before (within the TTL) get an inbox, so a sender
+# cannot park messages under made-up names for whoever claims them first, and
+# each sender has a cap across all recipients as well as each recipient's.
+
+INBOX_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "offline_inbox.db"))
+INBOX_SIZE = 100                  # Messages kept per recipient
+INBOX_SENDER_LIMIT = 200          # Messages one sender may have queued across all recipients
+INBOX_TTL = 7 * 24 * 60 * 60      # Seconds before an undelivered message (or a known name) is dropped
+
+
+class OfflineInbox:
+    def __init__(self, path=INBOX_PATH, max_messages=INBOX_SIZE, ttl=INBOX_TTL, max_per_sender=INBOX_SENDER_LIMIT):
+        self.path = path
+        self.max_messages = max_messages
+        self.max_per_sender = max_per_sender
+        self.ttl = ttl
+        self.conn = None
+        self.known = {}                # name -> last_seen written to known_users, saves a write per join
+        self.lock = threading.Lock()
+
+    def _connect(self, create):
+        # Opened lazily, so a server that never queues anything never creates the file
+        if self.conn is None:
+            if not create and self.path != ":memory:" and not os.path.exists(self.path):
+                return None
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS inbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient TEXT NOT NULL,
+                created REAL NOT NULL,      -- time.time() when queued
+                envelope BLOB NOT NULL,     -- packed envelope, sender already authenticated
+                sender TEXT NOT NULL DEFAULT ''
+            )
+            """)
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(inbox)")}
+            if 'sender' not in columns:  # Inbox written before the per-sender cap
+                self.conn.execute("ALTER TABLE inbox ADD COLUMN sender TEXT NOT NULL DEFAULT ''")
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS known_users (
+                name TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL     -- time.time() of the last join
+            )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS inbox_recipient ON inbox (recipient, id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS inbox_sender ON inbox (sender)")
+            self.conn.commit()
+        return self.conn
+
+    def remember(self, name, now=None):
+        """Record that name joined, which lets it receive offline messages for the next TTL."""
+        now = time.time() if now is None else now
+        if now - self.known.get(name, float('-inf')) < self.ttl / 2:
+            return  # Written recently enough to outlive the TTL check
+        with self.lock:
+            conn = self._connect(create=True)
+            conn.execute("INSERT OR REPLACE INTO known_users (name, last_seen) VALUES (?, ?)", (name, now))
+            conn.commit()
+        self.known[name] = now
+
+    def knows(self, name, now=None):
+        """True if name joined within the TTL."""
+        now = time.time() if now is None else now
+        if now - self.known.get(name, float('-inf')) <= self.ttl:
+            return True
+        with self.lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return False
+            row = conn.execute("SELECT last_seen FROM known_users WHERE name = ?", (name,)).fetchone()
+        if row is None or now - row[0] > self.ttl:
+            return False
+        self.known[name] = row[0]
+        return True
+
+    def store(self, recipient, envelope, sender='', now=None):
+        """Queue an envelope for recipient. Returns False if their inbox or the sender's quota is full."""
+        now = time.time() if now is None else now
+        with self.lock:
+            conn = self._connect(create=True)
+            (count,) = conn.execute("SELECT COUNT(*) FROM inbox WHERE recipient = ? AND created >= ?",
+                                    (recipient, now - self.ttl)).fetchone()
+            if count >= self.max_messages:
+                return False
+            (count,) = conn.execute("SELECT COUNT(*) FROM inbox WHERE sender = ? AND created >= ?",
+                                    (sender, now - self.ttl)).fetchone()
+            if count >= self.max_per_sender:
+                return False
+            conn.execute("INSERT INTO inbox (recipient, created, envelope, sender) VALUES (?, ?, ?, ?)",
+                         (recipient, now, envelope, sender))
+            conn.commit()
+            return True
+
+    def drain(self, recipient, now=None):
+        """Remove and return every unexpired envelope queued for recipient, oldest first."""
+        now = time.time() if now is None else now
+        with self.lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return []
+            rows = conn.execute("SELECT envelope FROM inbox WHERE recipient = ? AND created >= ? ORDER BY id",
+                                (recipient, now - self.ttl)).fetchall()
+            conn.execute("DELETE FROM inbox WHERE recipient = ?", (recipient,))
+            conn.commit()
+        return [bytes(row[0]) for row in rows]
+
+    def expire(self, now=None):
+        """Drop messages and known names older than the TTL. Returns how many messages were removed."""
+        now = time.time() if now is None else now
+        with self.lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return 0
+            removed = conn.execute("DELETE FROM inbox WHERE created < ?", (now - self.ttl,)).rowcount
+            conn.execute("DELETE FROM known_users WHERE last_seen < ?", (now - self.ttl,))
+            conn.commit()
+        self.known = {name: seen for name, seen in self.known.items() if now - seen <= self.ttl}
+        return removed
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,62 @@
+import math
+import threading
+import time
+from collections import Counter
+
+# In-memory counters for the running server. Cheap enough to bump from every
+# handler; read by the maintenance loop and the admin views.
+#
+# Rates are exponentially decaying averages over RATE_WINDOW: one multiply per
+# event and no per-second buckets, so they cost the same at any event rate.
+
+RATE_WINDOW = 10.0           # Seconds; events older than this weigh less than 1/e
+
+
+def decayed(rate, updated, now, window=RATE_WINDOW):
+    """A decaying rate last updated at `updated`, as of now."""
+    return rate * math.exp(-(now - updated) / window) if now > updated else rate
+
+
+def bumped(rate, updated, now, window=RATE_WINDOW):
+    """The rate after one more event at now."""
+    return decayed(rate, updated, now, window) + 1 / window
+
+class Metrics:
+    def __init__(self):
+        self.counters = Counter()
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def get(self, name):
+        return self.counters.get(name, 0)
+
+    def snapshot(self):
+        with self.lock:
+            return {'uptime': time.time() - self.started, 'counters': dict(self.counters)}
+
+
+class RateMeter:
+    """Events/sec per name, as decaying averages."""
+
+    def __init__(self, window=RATE_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.entries = {}   # name -> [rate, last update]
+
+    def tick(self, name, now=None):
+        now = self.clock() if now is None else now
+        entry = self.entries.get(name)
+        if entry is None:
+            self.entries[name] = [1 / self.window, now]
+        else:
+            entry[0], entry[1] = bumped(entry[0], entry[1], now, self.window), now
+
+    def rates(self, now=None):
+        now = self.clock() if now is None else now
+        rates = {name: round(decayed(rate, updated, now, self.window), 3)
+                 for name, (rate, updated) in list(self.entries.items())}
+        return dict(sorted(rates.items(), key=lambda item: -item[1]))
@@ -0,0 +1,167 @@
+from collections import deque
+
+# Bounded per-session send queues. Every emit to a single client goes through
+# its OutboundQueue, drained by one background task that stops pulling while
+# the client's Engine.IO backlog is high. A slow reader therefore fills its own
+# bounded queue, where the overflow policy applies, instead of growing the
+# server's memory.
+
+PRIORITY_CONTROL = 0    # Presence, acks, transfer control
+PRIORITY_CHAT = 1       # Messages
+PRIORITY_BULK = 2       # File chunks
+
+MAX_QUEUE = 256         # Control + chat messages per session
+MAX_BULK = 16           # File chunks per session (~1MB); producers wait for room
+MAX_BACKLOG = 64        # Engine.IO packets in flight before the drainer pauses
+BACKLOG_PAUSE = 0.05    # Seconds to wait when the client is behind
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+POLICY_DISCONNECT = "disconnect"
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+DEFAULT_POLICY = POLICY_COALESCE
+
+
+class OutboundQueue:
+    def __init__(self, sid, send, create_event, sleep, backlog=None, on_overflow=None,
+                 policy=DEFAULT_POLICY, max_queue=MAX_QUEUE, max_bulk=MAX_BULK):
+        self.sid = sid
+        self.send = send                # send(event, data) -> actually emits
+        self.sleep = sleep
+        self.backlog = backlog          # backlog() -> packets still unsent by Engine.IO
+        self.on_overflow = on_overflow  # called with sid under the disconnect policy
+        self.policy = policy
+        self.max_queue = max_queue
+        self.max_bulk = max_bulk
+
+        self.queues = (deque(), deque(), deque())   # Indexed by priority
+        self.coalesce_keys = {}         # key -> queued item, for replace-in-place
+        self.ready = create_event()     # Set when there is something to send
+        self.room = create_event()      # Set when a bulk slot frees up
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+
+    @property
+    def depth(self):
+        return sum(len(q) for q in self.queues)
+
+    def put(self, event, data, priority=PRIORITY_CHAT, coalesce_key=None):
+        """Queue a message; returns False if it was not accepted."""
+        if self.closed:
+            return False
+
+        if priority == PRIORITY_BULK:
+            # Bulk producers (download streams) wait instead of dropping data
+            while True:
+                self.room.clear()
+                if len(self.queues[PRIORITY_BULK]) < self.max_bulk:
+                    break
+                self.room.wait()
+                if self.closed:
+                    return False
+            self.queues[PRIORITY_BULK].append([event, data])
+        else:
+            if coalesce_key and self._coalesce(coalesce_key, event, data):
+                return True
+            if not self._make_room():
+                return False
+            item = [event, data]
+            self.queues[priority].append(item)
+            if coalesce_key and self.policy == POLICY_COALESCE:
+                self.coalesce_keys[coalesce_key] = item
+
+        self.high_water = max(self.high_water, self.depth)
+        self.ready.set()
+        return True
+
+    def _coalesce(self, key, event, data):
+        # Once a reader is behind, a newer presence update replaces the queued one
+        if self.policy != POLICY_COALESCE or self._chat_depth() < self.max_queue // 2:
+            return False
+        item = self.coalesce_keys.get(key)
+        if item is None:
+            return False
+        item[0], item[1] = event, data
+        self.coalesced += 1
+        return True
+
+    def _chat_depth(self):
+        return len(self.queues[PRIORITY_CONTROL]) + len(self.queues[PRIORITY_CHAT])
+
+    def _make_room(self):
+        if self._chat_depth() < self.max_queue:
+            return True
+        if self.policy == POLICY_DISCONNECT:
+            self.close()
+            if self.on_overflow:
+                self.on_overflow(self.sid)
+            return False
+
+        # drop_oldest, or coalesce with nothing left to merge: shed the oldest chat message
+        victim = self.queues[PRIORITY_CHAT] or self.queues[PRIORITY_CONTROL]
+        dropped = victim.popleft()
+        self._forget(dropped)
+        self.dropped += 1
+        return True
+
+    def _forget(self, item):
+        for key, queued in list(self.coalesce_keys.items()):
+            if queued is item:
+                del self.coalesce_keys[key]
+
+    def pop(self):
+        for priority, queue in enumerate(self.queues):
+            if queue:
+                item = queue.popleft()
+                if priority == PRIORITY_BULK:
+                    self.room.set()
+                else:
+                    self._forget(item)
+                return item
+        return None
+
+    def drain_once(self):
+        """Send everything currently queued. Returns how many messages went out."""
+        count = 0
+        item = self.pop()
+        while item is not None:
+            self.send(item[0], item[1])
+            self.sent += 1
+            count += 1
+            item = self.pop()
+        return count
+
+    def run(self):
+        """Drainer loop, one per session as a background task."""
+        while not self.closed:
+            self.ready.clear()
+            item = self.pop()
+            if item is None:
+                self.ready.wait()
+                continue
+            while self.backlog and self.backlog() > MAX_BACKLOG and not self.closed:
+                self.sleep(BACKLOG_PAUSE)
+            if self.closed:
+                break
+            self.send(item[0], item[1])
+            self.sent += 1
+
+    def close(self):
+        self.closed = True
+        for queue in self.queues:
+            queue.clear()
+        self.coalesce_keys.clear()
+        self.ready.set()
+        self.room.set()
+
+    def stats(self):
+        return {'depth': self.depth,
+                'bulk_depth': len(self.queues[PRIORITY_BULK]),
+                'high_water': self.high_water,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced}
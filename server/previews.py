@@ -0,0 +1,256 @@
+import io
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from logs.db_logger import log_event
+
+# Previews for finished uploads: a small PNG thumbnail plus metadata
+# (dimensions, duration, size), so recipients can see what a file is before
+# downloading it. Decoding media is CPU-bound, so it runs in a process pool off
+# the event loop. Results are cached by content hash: the same file sent twice
+# (or to several rooms) is only decoded once.
+#
+# Thumbnails need Pillow for images and ffmpeg/ffprobe for video and audio;
+# without them only the metadata that can be read from file headers is sent.
+
+PREVIEW_SIZE = 160               # Longest thumbnail edge in pixels
+PREVIEW_WORKERS = 2
+PREVIEW_CACHE_SIZE = 256         # Previews kept, keyed by content hash
+PREVIEW_POLL = 0.05              # Seconds between checks on a running job
+FFMPEG_TIMEOUT = 10
+
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "bmp")
+VIDEO_EXTENSIONS = ("mp4",)
+AUDIO_EXTENSIONS = ("mp3", "wav")
+
+
+def media_kind(filename):
+    extension = os.path.splitext(filename)[1][1:].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return "image"
+    if extension in VIDEO_EXTENSIONS:
+        return "video"
+    if extension in AUDIO_EXTENSIONS:
+        return "audio"
+    return None
+
+
+# --- Header parsing (no dependencies) ---
+def png_size(head):
+    if head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", head[16:24])
+
+
+def bmp_size(head):
+    if head[:2] != b"BM" or len(head) < 26:
+        return None
+    width, height = struct.unpack("<ii", head[18:26])
+    return width, abs(height)  # Negative height means top-down rows
+
+
+def jpeg_size(f):
+    """Width and height from the first SOF marker of an open JPEG file."""
+    f.seek(0)
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0x01, 0xD8) or 0xD0 <= marker[1] <= 0xD7:
+            continue  # Standalone markers have no length
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        (length,) = struct.unpack(">H", length)
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(path):
+    with open(path, "rb") as f:
+        head = f.read(26)
+        return png_size(head) or bmp_size(head) or jpeg_size(f)
+
+
+def wav_duration(path):
+    with wave.open(path, "rb") as audio:
+        return audio.getnframes() / audio.getframerate()
+
+
+# --- Thumbnails ---
+def pillow():
+    """PIL.Image, imported in the worker that needs it; None if Pillow is not installed."""
+    try:
+        from PIL import Image
+    except ImportError:  # Optional: images still get dimensions, just no thumbnail
+        return None
+    return Image
+
+
+def image_thumbnail(path, Image):
+    """(width, height, PNG thumbnail bytes) via Pillow."""
+    with Image.open(path) as image:
+        width, height = image.size
+        image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, format="PNG", optimize=True)
+        return width, height, out.getvalue()
+
+
+def ffprobe(path):
+    """Duration and video dimensions via ffprobe, or {} if it is not installed."""
+    if not shutil.which("ffprobe"):
+        return {}
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
+         "stream=width,height:format=duration", "-of", "default=noprint_wrappers=1", path],
+        capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+    info = {}
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("=")
+        try:
+            info[key] = float(value) if key == "duration" else int(value)
+        except ValueError:
+            pass
+    return info
+
+
+def video_thumbnail(path, at):
+    """PNG of one frame scaled to PREVIEW_SIZE via ffmpeg, or None."""
+    if not shutil.which("ffmpeg"):
+        return None
+    scale = f"scale='min({PREVIEW_SIZE},iw)':'min({PREVIEW_SIZE},ih)':force_original_aspect_ratio=decrease"
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-ss", str(at), "-i", path, "-frames:v", "1", "-vf", scale,
+         "-f", "image2pipe", "-vcodec", "png", "-"],
+        capture_output=True, timeout=FFMPEG_TIMEOUT)
+    return result.stdout or None
+
+
+def probe_media(path, kind):
+    """Build the preview for one file. Runs in a worker process, so it must stay picklable."""
+    preview = {'kind': kind, 'size': os.path.getsize(path), 'width': None, 'height': None,
+               'duration': None, 'thumbnail': None}
+    try:
+        if kind == "image":
+            Image = pillow()
+            if Image is not None:
+                preview['width'], preview['height'], preview['thumbnail'] = image_thumbnail(path, Image)
+            else:
+                preview['width'], preview['height'] = image_size(path) or (None, None)
+        elif kind in ("video", "audio"):
+            info = ffprobe(path)
+            if not info and path.lower().endswith(".wav"):
+                info = {'duration': wav_duration(path)}
+            preview['duration'] = info.get('duration')
+            if kind == "video":
+                preview['width'], preview['height'] = info.get('width'), info.get('height')
+                preview['thumbnail'] = video_thumbnail(path, min(1.0, (preview['duration'] or 0) / 2))
+    except Exception as e:
+        # A file that will not decode still gets its size
+        preview['error'] = str(e)
+    return preview
+
+
+class PreviewCache:
+    def __init__(self, size=PREVIEW_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()   # content hash -> preview
+
+    def get(self, key):
+        preview = self.entries.get(key)
+        if preview is not None:
+            self.entries.move_to_end(key)
+        return preview
+
+    def put(self, key, preview):
+        self.entries[key] = preview
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class PreviewPipeline:
+    def __init__(self, spawn, sleep, workers=PREVIEW_WORKERS, cache_size=PREVIEW_CACHE_SIZE, executor=None):
+        self.spawn = spawn              # start a background task
+        self.sleep = sleep
+        self.workers = workers
+        self.executor = executor        # Created on first use, so idle servers fork no workers
+        self.cache = PreviewCache(cache_size)
+        self.waiting = {}               # content hash -> callbacks for a job already running
+
+        self.generated = 0
+        self.cache_hits = 0
+        self.failed = 0
+
+    def request(self, content_hash, path, kind, callback):
+        """Call callback(preview) once a preview for this content exists."""
+        preview = self.cache.get(content_hash)
+        if preview is not None:
+            self.cache_hits += 1
+            callback(preview)
+            return
+        if content_hash in self.waiting:
+            self.waiting[content_hash].append(callback)
+            return
+
+        self.waiting[content_hash] = [callback]
+        if self.executor is None:
+            # Spawned, not forked: a fork would copy the event loop's hub and sockets
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        future = self.executor.submit(probe_media, path, kind)
+        if future.done():
+            self._finish(content_hash, future)
+        else:
+            self.spawn(self._wait, content_hash, future)
+
+    def _wait(self, content_hash, future):
+        # Poll instead of add_done_callback: callbacks would run on the pool's
+        # thread, and sending must happen on the event loop
+        while not future.done():
+            self.sleep(PREVIEW_POLL)
+        self._finish(content_hash, future)
+
+    def _finish(self, content_hash, future):
+        callbacks = self.waiting.pop(content_hash, [])
+        try:
+            preview = future.result()
+        except Exception as e:
+            # The worker itself failed (crashed, or could not import this module), not the decode
+            self.failed += 1
+            print(f"[previews] Preview worker failed: {e!r}")
+            log_event("server", "preview_failed", f"Preview worker failed for {content_hash}: {e!r}")
+            return
+        self.generated += 1
+        self.cache.put(content_hash, preview)
+        for callback in callbacks:
+            callback(preview)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self):
+        return {'generated': self.generated, 'cache_hits': self.cache_hits,
+                'failed': self.failed, 'cached': len(self.cache)}
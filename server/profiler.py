@@ -0,0 +1,172 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Opt-in profiling for a running server, switched on and off from the admin
+# namespace.
+#
+# Two views are collected while it runs:
+#   - per-handler timing: calls, cumulative and worst wall time for each
+#     Socket.IO event, from wrappers put in front of the handlers on start()
+#     and removed again on stop(), so a server that is not profiling runs the
+#     original handlers with no extra call at all;
+#   - stack samples: a real OS thread looks at the event loop thread every few
+#     milliseconds and counts its Python stack, rooted at the event being
+#     handled ("(background)" for queues, batching and maintenance). The result
+#     is in collapsed-stack format ("a;b;c 12" per line), which flamegraph.pl,
+#     speedscope and inferno read directly.
+# Samples taken while the hub is idle, waiting for sockets, are not counted.
+#
+# Handlers run on green threads that interleave whenever one yields, so there
+# is no single "current" event. Each wrapper registers its own frame while it
+# runs, and a sample is labelled with the innermost registered frame on the
+# sampled stack, which is always the greenlet actually running. Handler times
+# are wall time from call to return: a handler that yields (waiting on the disk
+# or a queue) is charged for the time it was parked while others ran. The
+# samples only ever count the greenlet on the CPU.
+
+PROFILE_INTERVAL = 0.005      # Seconds between stack samples
+PROFILE_MAX_DEPTH = 64        # Innermost frames kept per sample
+PROFILE_MAX_STACKS = 20000    # Distinct stacks kept; further new stacks are counted as "(truncated)"
+BACKGROUND = "(background)"
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def is_idle(frame):
+    """True when the loop thread is parked in the eventlet hub waiting for I/O."""
+    code = frame.f_code
+    return code.co_name in ("wait", "do_poll") and f"{os.sep}hubs{os.sep}" in code.co_filename
+
+
+class HandlerProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, max_stacks=PROFILE_MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.enabled = False
+        self.started = None
+        self.stopped = None
+        self.active = {}              # Frame of a running wrapper -> its event, one per greenlet stack
+        self.timings = {}             # event -> {'calls', 'total', 'max'} in seconds
+        self.stacks = Counter()       # collapsed stack -> samples
+        self.lock = threading.Lock()  # stacks is written by the sampler thread
+        self.samples = 0
+        self.idle_samples = 0
+        self.originals = None         # Handler table before wrapping, restored by stop()
+        self.handlers = None
+        self.target = None            # Thread id of the event loop
+        self.sampler = None
+
+    def start(self, handlers, target=None, exclude=()):
+        """Wrap the handlers in the table and start sampling. Returns False if already running.
+
+        Events in exclude are left alone: Socket.IO finds the connect and
+        disconnect signatures by retrying on TypeError, which a wrapper would
+        count as extra calls.
+        """
+        if self.enabled:
+            return False
+        self.timings.clear()
+        with self.lock:
+            self.stacks.clear()
+        self.samples = self.idle_samples = 0
+        self.handlers = handlers
+        self.originals = {event: handler for event, handler in handlers.items() if event not in exclude}
+        for event, handler in self.originals.items():
+            handlers[event] = self.timed(event, handler)
+        self.target = threading.get_ident() if target is None else target
+        self.enabled = True
+        self.started, self.stopped = time.monotonic(), None
+        self.sampler = threading.Thread(target=self.sample_loop, name="profiler", daemon=True)
+        self.sampler.start()
+        return True
+
+    def stop(self):
+        """Put the original handlers back and stop sampling. Results stay readable until the next start()."""
+        if not self.enabled:
+            return False
+        self.enabled = False
+        self.stopped = time.monotonic()
+        for event, handler in self.originals.items():
+            if getattr(self.handlers.get(event), '__wrapped__', None) is handler:
+                self.handlers[event] = handler
+        self.originals = self.handlers = None
+        if self.sampler is not None and self.sampler is not threading.current_thread():
+            self.sampler.join(timeout=1)
+        self.sampler = None
+        return True
+
+    def timed(self, event, handler):
+        @functools.wraps(handler)
+        def profiled(*args):
+            frame = sys._getframe()
+            self.active[frame] = event
+            start = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                del self.active[frame]
+                stats = self.timings.get(event)
+                if stats is None:
+                    stats = self.timings[event] = {'calls': 0, 'total': 0.0, 'max': 0.0}
+                stats['calls'] += 1
+                stats['total'] += elapsed
+                stats['max'] = max(stats['max'], elapsed)
+        return profiled
+
+    # --- Sampling ---
+    def sample_loop(self):
+        while self.enabled:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                self.record(frame, self.event_of(frame))
+
+    def event_of(self, frame):
+        """Event of the innermost profiled handler on this stack, None outside any handler."""
+        while frame is not None:
+            event = self.active.get(frame)
+            if event is not None:
+                return event
+            frame = frame.f_back
+        return None
+
+    def record(self, frame, event=None):
+        if is_idle(frame):
+            self.idle_samples += 1
+            return
+        names = []
+        while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+            names.append(frame_label(frame))
+            frame = frame.f_back
+        names.append(event or BACKGROUND)
+        stack = ";".join(reversed(names))
+        with self.lock:
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                stack = f"{event or BACKGROUND};(truncated)"
+            self.stacks[stack] += 1
+            self.samples += 1
+
+    # --- Results ---
+    def collapsed(self):
+        """Stack samples in collapsed format, one "frame;frame;... count" line per stack."""
+        with self.lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self):
+        end = self.stopped if self.stopped is not None else time.monotonic()
+        handlers = {event: {'calls': stats['calls'], 'total_ms': round(stats['total'] * 1000, 3),
+                            'mean_ms': round(stats['total'] * 1000 / stats['calls'], 3),
+                            'max_ms': round(stats['max'] * 1000, 3)}
+                    for event, stats in sorted(self.timings.items(), key=lambda item: -item[1]['total'])}
+        return {'enabled': self.enabled,
+                'duration': round(end - self.started, 3) if self.started is not None else 0,
+                'samples': self.samples, 'idle_samples': self.idle_samples,
+                'handlers': handlers}
@@ -0,0 +1,55 @@
+import shutil
+import threading
+
+# Upload admission control. Sizes are reserved when an upload is declared and
+# released if it is aborted, so concurrent uploads cannot overshoot a quota.
+
+MAX_FILE_SIZE = 25 * 1000 * 1000        # Matches the client's 25MB limit
+USER_QUOTA = 200 * 1000 * 1000          # Bytes stored per user
+GLOBAL_QUOTA = 2 * 1000 * 1000 * 1000   # Bytes stored across all users
+MIN_FREE_DISK = 500 * 1000 * 1000       # Keep this much disk free
+
+UPLOAD_RATE = 2 * 1024 * 1024           # upload_chunk bytes/sec per session
+UPLOAD_BURST = 4 * 1024 * 1024
+MAX_THROTTLE_WAIT = 2.0                 # Seconds; flooding beyond this aborts the upload
+
+
+class UploadQuotas:
+    def __init__(self, folder, max_file_size=MAX_FILE_SIZE, user_quota=USER_QUOTA,
+                 global_quota=GLOBAL_QUOTA, min_free_disk=MIN_FREE_DISK):
+        self.folder = folder
+        self.max_file_size = max_file_size
+        self.user_quota = user_quota
+        self.global_quota = global_quota
+        self.min_free_disk = min_free_disk
+        self.used = {}                  # username -> reserved bytes
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, username, size):
+        """Reserve size bytes for username. Returns None on success or a rejection reason."""
+        if size < 0:
+            return "invalid_size"
+        if size > self.max_file_size:
+            return "file_too_large"
+
+        with self.lock:
+            if self.used.get(username, 0) + size > self.user_quota:
+                return "user_quota_exceeded"
+            if self.total + size > self.global_quota:
+                return "server_quota_exceeded"
+            if shutil.disk_usage(self.folder).free - size < self.min_free_disk:
+                return "disk_full"
+
+            self.used[username] = self.used.get(username, 0) + size
+            self.total += size
+        return None
+
+    def release(self, username, size):
+        with self.lock:
+            remaining = self.used.get(username, 0) - size
+            if remaining > 0:
+                self.used[username] = remaining
+            else:
+                self.used.pop(username, None)
+            self.total = max(0, self.total - size)
@@ -0,0 +1,114 @@
+import time
+from collections import deque
+
+# Token bucket shared by the upload throttle and the per-event limits.
+
+# Per-event limits: event -> (events/sec, burst). Anything not listed gets DEFAULT_EVENT_LIMIT.
+EVENT_LIMITS = {
+    'global_message': (5, 20),
+    'private_message': (5, 20),
+    'e2e_message': (5, 20),
+    'join_room': (2, 10),
+    'leave_room': (2, 10),
+    'list_rooms': (2, 10),
+    'publish_key': (1, 5),
+    'get_current_users': (2, 10),
+    'claim_username': (2, 10),
+    'start_upload': (2, 10),
+    'upload_chunk': (200, 400),     # Bytes are limited separately by the upload bucket
+    'download_request': (5, 20),
+    'download_ack': (200, 400),     # At most one per chunk received
+}
+DEFAULT_EVENT_LIMIT = (20, 50)
+UNLIMITED_EVENTS = ('connect', 'disconnect')
+
+# Flood protection: a session rejected this many times within the window is disconnected
+FLOOD_DISCONNECT = 100
+FLOOD_WINDOW = 10
+
+class TokenBucket:
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate                # Tokens added per second
+        self.capacity = capacity        # Burst size
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, amount=1):
+        """Take amount tokens if they are available right now."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def reserve(self, amount, max_wait):
+        """Take amount tokens, going into debt if needed.
+
+        Returns the seconds the caller should wait before acting, or None
+        (taking nothing) if that wait would exceed max_wait.
+        """
+        self._refill()
+        wait = max(0.0, (amount - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= amount
+        return wait
+
+
+class EventLimiter:
+    """One token bucket per (sid, event), plus a running count of rejections per sid."""
+
+    def __init__(self, limits=None, default=DEFAULT_EVENT_LIMIT, disconnect_after=FLOOD_DISCONNECT,
+                 window=FLOOD_WINDOW, clock=time.monotonic):
+        self.limits = dict(EVENT_LIMITS if limits is None else limits)
+        self.default = default
+        self.disconnect_after = disconnect_after
+        self.window = window
+        self.clock = clock
+        self.buckets = {}       # (sid, event) -> TokenBucket
+        self.violations = {}    # sid -> deque of rejection times
+        self.factors = {}       # sid -> multiplier on its limits, set by throttle()
+
+    def limit(self, sid, event):
+        """(rate, burst) for sid and event, after any throttle. A burst always admits one event."""
+        rate, burst = self.limits.get(event, self.default)
+        factor = self.factors.get(sid, 1)
+        return rate * factor, max(1, burst * factor)
+
+    def allow(self, sid, event):
+        bucket = self.buckets.get((sid, event))
+        if bucket is None:
+            bucket = self.buckets[(sid, event)] = TokenBucket(*self.limit(sid, event), self.clock)
+        return bucket.consume()
+
+    def throttle(self, sid, factor):
+        """Scale every limit of sid by factor, including buckets it already has. 1 restores the defaults."""
+        if factor == 1:
+            self.factors.pop(sid, None)
+        else:
+            self.factors[sid] = factor
+        for (bucket_sid, event), bucket in self.buckets.items():
+            if bucket_sid == sid:
+                bucket.rate, bucket.capacity = self.limit(sid, event)
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def violation(self, sid):
+        """Record a rejection. Returns True once sid has flooded past the disconnect threshold."""
+        now = self.clock()
+        times = self.violations.setdefault(sid, deque())
+        times.append(now)
+        while times and now - times[0] > self.window:
+            times.popleft()
+        return len(times) == self.disconnect_after
+
+    def forget(self, sid):
+        for key in [key for key in self.buckets if key[0] == sid]:
+            del self.buckets[key]
+        self.violations.pop(sid, None)
+        self.factors.pop(sid, None)
@@ -0,0 +1,79 @@
+import re
+from collections import deque
+
+# Named chat rooms. Membership maps room -> {sid: user entry} so a broadcast
+# walks only the room's members, and sid -> rooms so a disconnect leaves every
+# room without scanning them all. ChatServer mirrors membership into Socket.IO
+# rooms under the "room:" prefix.
+
+DEFAULT_ROOM = "Global"
+ROOM_HISTORY = 50                       # Messages replayed to someone joining a room
+ROOM_NAME_RE = re.compile(r"[A-Za-z0-9_-]{1,20}")
+
+
+def valid_room_name(name):
+    return isinstance(name, str) and bool(ROOM_NAME_RE.fullmatch(name))
+
+
+def sio_room(name):
+    return f"room:{name}"
+
+
+class RoomRegistry:
+    def __init__(self, history_size=ROOM_HISTORY):
+        self.history_size = history_size
+        self.members = {DEFAULT_ROOM: {}}       # room -> {sid: user entry}
+        self.history = {DEFAULT_ROOM: deque(maxlen=history_size)}
+        self.rooms_of = {}                      # sid -> set of room names
+
+    def join(self, name, user):
+        """Add user to room name, creating it if needed. Returns False if already a member."""
+        sid = user['sid']
+        room = self.members.setdefault(name, {})
+        self.history.setdefault(name, deque(maxlen=self.history_size))
+        if sid in room:
+            return False
+        room[sid] = user
+        self.rooms_of.setdefault(sid, set()).add(name)
+        return True
+
+    def leave(self, name, sid):
+        room = self.members.get(name)
+        if room is None or room.pop(sid, None) is None:
+            return False
+        rooms = self.rooms_of.get(sid)
+        if rooms:
+            rooms.discard(name)
+            if not rooms:
+                del self.rooms_of[sid]
+        if not room and name != DEFAULT_ROOM:
+            # Empty rooms disappear along with their history
+            del self.members[name]
+            del self.history[name]
+        return True
+
+    def leave_all(self, sid):
+        """Remove sid from every room. Returns the names it left."""
+        left = list(self.rooms_of.get(sid, ()))
+        for name in left:
+            self.leave(name, sid)
+        return left
+
+    def is_member(self, name, sid):
+        return sid in self.members.get(name, {})
+
+    def room_members(self, name):
+        return list(self.members.get(name, {}).values())
+
+    def usernames(self, name):
+        return [user['username'] for user in self.members.get(name, {}).values()]
+
+    def record(self, name, entry):
+        if name in self.history:
+            self.history[name].append(entry)
+
+    def recent(self, name):
+        return list(self.history.get(name, ()))
+
+    def listing(self):
+        return [{'name': name, 'members': len(room)} for name, room in sorted(self.members.items())]
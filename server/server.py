@@ -4,36 +4,118 @@ import os
 import base64
 import eventlet
 import hashlib
+import time
+import functools
+import signal
+import greenlet
+import hmac
 
 from flask import Flask, render_template_string
-from server.encryption import load_rsa_private_key, decrypt_rsa, decrypt_aes, encrypt_aes
+from server.encryption import load_rsa_private_key, decrypt_rsa, decrypt_aes, encrypt_aes_raw, decrypt_aes_raw
+from server.envelope import Envelope, KIND_ROOM, KIND_PRIVATE, now_ms, unpack_envelope, restamp
+from server.delivery import DeliveryTracker
+from server.inbox import OfflineInbox, INBOX_PATH
+from server.snapshot import write_snapshot, read_snapshot, SNAPSHOT_PATH
+from server.previews import PreviewPipeline, media_kind, PREVIEW_WORKERS
+from server.diskio import DiskIO, DISK_WORKERS, reopen_upload, sync_and_close
+from server.transfers import (valid_transfer_id, safe_filename, stored_path, stored_file_id,
+                              SWEEP_INTERVAL, UPLOAD_IDLE_TIMEOUT, FILE_RETENTION,
+                              MAX_DOWNLOAD_WINDOW, DOWNLOAD_ACK_TIMEOUT, ACK_POLL)
+from server.quotas import UploadQuotas, UPLOAD_RATE, UPLOAD_BURST, MAX_THROTTLE_WAIT
+from server.ratelimit import TokenBucket, EventLimiter, UNLIMITED_EVENTS
+from server.metrics import Metrics, RateMeter
+from server.profiler import HandlerProfiler
+from server.sessions import SessionTable, SessionField, deep_size, memory_report
+from server.rooms import RoomRegistry, DEFAULT_ROOM, valid_room_name, sio_room
+from server.usernames import UsernameRegistry
+from server.transport import (server_options, without_deflate, TRANSPORT_MODE, PERMESSAGE_DEFLATE,
+                              PING_INTERVAL, PING_TIMEOUT, CHUNK_SIZE)
+from server.config import ServerConfig, LogConfig, load_config, ConfigError, UPLOAD_FOLDER, PRIVATE_KEY_PATH
+from server.batching import MessageBatcher, BATCH_WINDOW_MS, BATCH_CODEC, pack_batch
+from server.compression import negotiate, decompress_bounded, available_codec
+from server.outbound import (OutboundQueue, PRIORITY_CONTROL, PRIORITY_CHAT, PRIORITY_BULK,
+                             DEFAULT_POLICY, MAX_QUEUE, MAX_BULK)
 
 # Add parent directory to path for module import
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from logs.db_logger import log_event
+from logs.db_logger import log_event, flush_logs, configure as configure_logger
 
-# File
-UPLOAD_FOLDER = "upload_files"
-CHUNK_SIZE = 49152 # 48KB 
-os.makedirs(UPLOAD_FOLDER, exist_ok = True)
+# Graceful shutdown
+DRAIN_TIMEOUT = 5            # Seconds to let outbound queues empty before closing sockets
+RECONNECT_AFTER = 2          # Seconds clients are told to wait before reconnecting
+
+# End-to-end mode
+MAX_PUBLIC_KEY = 4096                    # PEM characters
+MAX_E2E_CIPHERTEXT = 64 * 1024 + 1024    # Envelope limit plus IV and padding
+
+# Operator tools
+ADMIN_NAMESPACE = "/admin"               # Needs the admin token; disabled when none is set
+ADMIN_LIST_LIMIT = 20                    # Default rows in admin listings such as top talkers
+KICK_DRAIN = 1.0                         # Seconds a kicked client gets to receive the notice
+TALKER_ORDER = {'rate': 'event_rate', 'events': 'events', 'upload_bytes': 'upload_bytes'}  # top_talkers 'by'
 
 class ChatServer:
-    def __init__(self):
-        # Initialize Flask and Socket.IO
-        self.sio = socketio.Server()
+    def __init__(self, batch_window_ms=BATCH_WINDOW_MS, batch_codec=BATCH_CODEC, inbox_path=INBOX_PATH,
+                 rate_limits=None, snapshot_path=SNAPSHOT_PATH, transport_mode=TRANSPORT_MODE,
+                 compression=PERMESSAGE_DEFLATE, upload_folder=None, private_key_path=PRIVATE_KEY_PATH,
+                 chunk_size=CHUNK_SIZE, preview_workers=PREVIEW_WORKERS, ping_interval=PING_INTERVAL,
+                 ping_timeout=PING_TIMEOUT, admin_token=None, disk_workers=DISK_WORKERS,
+                 queue_policy=DEFAULT_POLICY, max_queue=MAX_QUEUE, max_bulk=MAX_BULK):
+        # Initialize Flask and Socket.IO (transport settings in server/transport.py)
+        self.sio = socketio.Server(**server_options(transport_mode, ping_interval, ping_timeout,
+                                                    compression=compression, chunk_size=chunk_size))
         self.app = Flask(__name__)
         self.app.wsgi_app = socketio.WSGIApp(self.sio, self.app.wsgi_app)
+        if not compression:
+            self.app.wsgi_app = without_deflate(self.app.wsgi_app)
 
         # In-memory state
-        self.users = []          # Connected users: list of {'sid', 'username', 'aes_key'}
-        self.aes_keys = {}       # Temporary AES key store: sid -> aes_key
-        self.private_key = load_rsa_private_key("private_key.pem")  # Load RSA private key
+        self.sessions = SessionTable()  # sid -> Session: owns all per-connection state
+        self.users = []          # Joined users, in join order: Sessions (item access as {'sid', 'username', ...})
+        self.aes_keys = SessionField(self.sessions, 'aes_key')  # sid -> AES key from the exchange
+        self.usernames = UsernameRegistry()  # username -> reserving sid / resume token
+        self.deliveries = DeliveryTracker()  # resume token -> replay buffer and seen sequence numbers
+        self.inbox = OfflineInbox(inbox_path)  # Private messages for users who are not connected
+        self.batch_codec = available_codec(batch_codec)  # Picked once: zstd falls back to zlib when not installed
+        self.outbound = SessionField(self.sessions, 'outbound')  # sid -> OutboundQueue for every connected client
+        self.queue_policy, self.max_queue, self.max_bulk = queue_policy, max_queue, max_bulk  # For every new OutboundQueue
+        self.rooms = RoomRegistry()  # Named rooms; everyone who joins is in DEFAULT_ROOM
+        # Optional per-recipient batching of room messages
+        self.batcher = None
+        if batch_window_ms:
+            self.batcher = MessageBatcher(self.deliver_batch, self.sio.start_background_task, self.sio.sleep,
+                                          window_ms=batch_window_ms, codec=self.batch_codec)
+        self.metrics = Metrics()
+        self.event_rates = RateMeter()  # Inbound events/sec per event name
+        self.profiler = HandlerProfiler()  # Idle until an admin starts it
+        self.admin_token = admin_token
+        self.admins = set()      # sids authenticated on ADMIN_NAMESPACE
+        self.private_key = load_rsa_private_key(private_key_path)  # Load RSA private key
 
-        # File transfer
+        # File transfer: transfer_id -> upload state
+        self.upload_folder = upload_folder or UPLOAD_FOLDER
+        self.chunk_size = chunk_size  # Bytes per download chunk
+        os.makedirs(self.upload_folder, exist_ok=True)
         self.upload_files = {}
+        self.quotas = UploadQuotas(self.upload_folder)
+        self.upload_buckets = SessionField(self.sessions, 'upload_bucket')  # sid -> TokenBucket limiting upload_chunk bytes
+        self.limiter = EventLimiter(rate_limits)  # Per-sid, per-event message rate limits
+        self.stored_files = {}    # file_id -> {'owner', 'size'} for finished uploads
+        self.file_refs = {}       # file_id -> downloads currently streaming it
+        self.downloads = {}       # (sid, transfer_id) -> progress of a download being streamed
+        self.previews = PreviewPipeline(self.sio.start_background_task, self.sio.sleep,
+                                        workers=preview_workers)  # Thumbnails off the event loop
+        self.disk = DiskIO(self.sio.sleep, workers=disk_workers)  # Upload writes and hashing off the event loop
+
+        # Restart handoff
+        self.snapshot_path = snapshot_path
+        self.draining = False         # Set by shutdown(): no new connections or uploads
+        self.suspended_uploads = {}   # transfer_id -> checkpoint manifest waiting for its owner to resume
         
         self.setup_routes()
         self.register_events()
+        self.register_admin_events()
+        self.apply_rate_limits()
 
     def setup_routes(self):
         # Simple landing page
@@ -52,31 +134,54 @@ class ChatServer:
         # --- Connection lifecycle ---
         @self.sio.event
         def connect(sid, environ):
+            if self.draining:
+                return False  # Shutting down: the client retries against the next process
             print(f"Client connected: {sid}")
             log_event("server", "connect", f"Client {sid} connected.")
+            queue = OutboundQueue(sid,
+                                  send=lambda event, data: self.sio.emit(event, data, room=sid),
+                                  create_event=self.sio.eio.create_event,
+                                  sleep=self.sio.sleep,
+                                  backlog=lambda: self.eio_backlog(sid),
+                                  on_overflow=self.drop_slow_client,
+                                  policy=self.queue_policy,
+                                  max_queue=self.max_queue,
+                                  max_bulk=self.max_bulk)
+            self.sessions.open(sid).outbound = queue
+            self.sio.start_background_task(queue.run)
 
         @self.sio.event
         def disconnect(sid):
             # Handle disconnect: remove user and notify others
-            username = None
-            for user in self.users:
-                if user['sid'] == sid:
-                    username = user['username']
-                    break
-            self.users = [user for user in self.users if user['sid'] != sid]
-            self.aes_keys.pop(sid, None)
-            usernames = [user['username'] for user in self.users]
+            username = self.close_session(sid)
 
             if username:
                 print(f"User {username} disconnected ({sid})")
                 log_event("server", "disconnect", f"User {username} disconnected ({sid})")
-                self.sio.emit('user_left', {'username': username, 'usernames': usernames})
+                self.broadcast_presence('user_left', username)
             else:
                 print(f"Client disconnected: {sid}")
                 log_event("server", "disconnect", f"Client disconnected: {sid}")
-                self.sio.emit('user_left', {'username': 'Unknown', 'usernames': usernames})
+                self.broadcast_presence('user_left', 'Unknown')
 
         # --- Key exchange and user join/leave ---
+        @self.sio.event
+        def resume_session(sid, data):
+            # Reconnect with the AES key of an earlier session instead of a new RSA exchange.
+            # The proof is the token encrypted under that key, so the token alone is not enough.
+            session = self.deliveries.get(data.get('token'))
+            if session is None or session.aes_key is None:
+                return {'status': 'error', 'reason': 'unknown_session'}
+            try:
+                if decrypt_aes_raw(session.aes_key, data.get('proof', b'')) != session.token.encode():
+                    raise ValueError("token mismatch")
+            except Exception:
+                return {'status': 'error', 'reason': 'bad_proof'}
+            self.aes_keys[sid] = session.aes_key
+            self.metrics.incr('sessions_resumed')
+            log_event("server", "resume_session", f"Client {sid} resumed a session without key exchange")
+            return {'status': 'ok'}
+
         @self.sio.event
         def exchange_key(sid, data):
             # Decrypt and store AES key sent by client
@@ -95,83 +200,239 @@ class ChatServer:
         def user_joined(sid, data):
             # Finalize user join by binding username with sid and AES key
             username = data.get('username', 'Unknown')
-            aes_key = self.aes_keys.pop(sid, None)
-            self.users.append({'sid': sid, 'username': username, 'aes_key': aes_key})
-            usernames = [user['username'] for user in self.users]
+            # A reconnecting client presents its resume token and the last delivery it saw
+            resume = data.get('resume') or {}
+            # Usually claimed already; a resume token takes back a name held for the session
+            reason = self.usernames.claim(username, sid, resume.get('token'), self.session_alive)
+            if reason:
+                return {'status': 'error', 'reason': reason}
+            user = self.sessions.open(sid)
+            session, resumed = self.deliveries.open(resume.get('token'))
+            session.aes_key = user.aes_key
+            session.username = username
+            self.usernames.bind(sid, session.token)
+            user.username, user.resume_token = username, session.token
+            self.users.append(user)
+            self.inbox.remember(username)  # From now on, private messages to this name can wait offline
+            self.join_room(DEFAULT_ROOM, user)
             print(f"User {username} joined with session ID {sid}")
             log_event("server", "user_joined", f"User '{username}' joined (SID: {sid})")
-            self.sio.emit('user_joined', {'username': username, 'usernames': usernames})
+            self.broadcast_presence('user_joined', username)
+
+            replayed = 0
+            if resumed:
+                missed = self.deliveries.since(session.token, resume.get('dseq', 0))
+                for dseq, event, item in missed:
+                    self.send_recorded(user, dseq, event, item)
+                replayed = len(missed)
+                log_event("server", "resume", f"User '{username}' resumed, {replayed} messages replayed")
+            offline = self.flush_inbox(user)
+            if resumed:
+                self.resume_uploads(user)
+            return {'status': 'ok', 'resume_token': session.token, 'resumed': resumed, 'replayed': replayed,
+                    'offline': offline}
 
         @self.sio.event
         def user_left(sid, data):
             # Remove user from list on leave event
             username = data.get('username', 'Unknown')
+            for user in self.users:
+                if user['sid'] == sid:
+                    self.deliveries.close(user.get('resume_token'))  # Left on purpose: nothing to resume
             self.users[:] = [user for user in self.users if user['sid'] != sid]
-            usernames = [user['username'] for user in self.users]
+            self.usernames.release(sid)
+            self.leave_all_rooms(sid, username)
             print(f"User {username} left with session ID {sid}")
             log_event("server", "user_left", f"User {username} left with session ID {sid}")
-            self.sio.emit('user_left', {'username': username, 'usernames': usernames})
-            self.aes_keys.pop(sid, None)
+            self.broadcast_presence('user_left', username)
+            # The connection stays open, but is no longer a user until it joins again
+            session = self.sessions.get(sid)
+            if session:
+                session.username = session.aes_key = session.public_key = session.resume_token = None
 
         # --- Messaging ---
         @self.sio.event
         def global_message(sid, data):
-            # Receive AES-encrypted global message, decrypt, re-encrypt for each user
-            sender = data.get('sender', 'Anonymous')
-            ciphertext = data.get('message', '')
+            # Receive an AES-encrypted room envelope, re-encrypt it for each room member
             sender_entry = next((u for u in self.users if u['sid'] == sid), None)
 
+            # The return value is the sender's delivery ack
             if not sender_entry:
                 print("Sender not found.")
                 log_event("server", "global_msg", "Sender not found.")
-                return
+                return {'status': 'error', 'reason': 'not_joined'}
 
+            sender = sender_entry['username']
             try:
-                plaintext = decrypt_aes(sender_entry['aes_key'], ciphertext)
-                print(f"[GLOBAL] From {sender}: {ciphertext}")
-                log_event("server", "global_msg", f"[GLOBAL] From {sender}: {ciphertext}")
+                envelope = self.read_envelope(sender_entry, data, KIND_ROOM)
             except Exception as e:
                 print(f"Failed to decrypt sender's message: {e}")
                 log_event("server", "global_msg", f"Failed to decrypt sender's message: {e}")
-                return
+                return {'status': 'error', 'reason': 'bad_message'}
+            if envelope is None:
+                return {'status': 'duplicate'}  # Retransmit of a message already delivered
 
-            for user in self.users:
+            room = envelope.target or DEFAULT_ROOM
+            if not self.rooms.is_member(room, sid):
+                print(f"{sender} is not in room {room}.")
+                log_event("server", "global_msg", f"{sender} is not in room {room}.")
+                return {'status': 'error', 'reason': 'not_member'}
+
+            print(f"[GLOBAL] From {sender} in {room}: #{envelope.seq} ({len(envelope.payload)} bytes)")
+            log_event("server", "global_msg", f"[GLOBAL] From {sender} in {room}: #{envelope.seq} ({len(envelope.payload)} bytes)")
+
+            # The sender field is always the authenticated username, never what the client claimed
+            packed = restamp(envelope, sender)
+            self.rooms.record(room, packed)
+            # Only the room's members, not every connected user
+            for user in self.rooms.room_members(room):
+                if self.batcher:
+                    # Encrypted once per batch in deliver_batch instead of once per message
+                    dseq = self.deliveries.record(user.get('resume_token'), 'incoming_global_message', packed)
+                    self.batcher.add(user['sid'], packed, tag=dseq)
+                    continue
                 try:
-                    re_encrypted = encrypt_aes(user['aes_key'], plaintext)
-                    self.sio.emit('incoming_global_message', {'message': re_encrypted, 'sender': sender}, room=user['sid'])
+                    self.deliver(user, 'incoming_global_message', packed)
                 except Exception as e:
                     print(f"Failed to re-encrypt for {user['username']}: {e}")
                     log_event("server", "global_msg", f"Failed to re-encrypt for {user['username']}: {e}")
+            return {'status': 'ok'}
 
         @self.sio.event
         def private_message(sid, data):
-            # Receive AES-encrypted private message, re-encrypt for specific recipient
-            recipient_name = data.get('recipient', '')
-            ciphertext = data.get('message', '')
-            sender = data.get('sender', 'Anonymous')
-
+            # Receive an AES-encrypted private envelope, re-encrypt it for the specific recipient
             sender_entry = next((u for u in self.users if u['sid'] == sid), None)
-            # Finds the specific recipient by username
-            recipient_entry = next((u for u in self.users if u['username'] == recipient_name), None)
-
-            if not sender_entry or not recipient_entry:
+            if not sender_entry:
                 print("Sender or recipient not found.")
                 log_event("server", "private_msg", "Sender or recipient not found.")
-                return
+                return {'status': 'error', 'reason': 'not_joined'}
 
+            sender = sender_entry['username']
             try:
-                plaintext = decrypt_aes(sender_entry['aes_key'], ciphertext)
-                print(f"[PRIVATE] From {sender} to {recipient_name}: {ciphertext}")
-                log_event("server", "private_msg", f"[PRIVATE] From {sender} to {recipient_name}: {ciphertext}")
+                envelope = self.read_envelope(sender_entry, data, KIND_PRIVATE)
+                if envelope is None:
+                    return {'status': 'duplicate'}  # Retransmit of a message already delivered
+
+                recipient_name = envelope.target
+                # Finds the specific recipient by username
+                recipient_entry = next((u for u in self.users if u['username'] == recipient_name), None)
+                if not recipient_entry:
+                    if not recipient_name:
+                        return {'status': 'error', 'reason': 'recipient_not_found'}
+                    # Only a name that has joined before gets an inbox, not whatever the sender typed
+                    if recipient_name not in self.usernames and not self.inbox.knows(recipient_name):
+                        return {'status': 'error', 'reason': 'recipient_not_found'}
+                    # Recipient is offline: keep it for their next user_joined
+                    if not self.inbox.store(recipient_name, restamp(envelope, sender), sender):
+                        return {'status': 'error', 'reason': 'inbox_full'}
+                    self.metrics.incr('offline_queued')
+                    log_event("server", "private_msg", f"[PRIVATE] Queued #{envelope.seq} from {sender} for offline {recipient_name}")
+                    return {'status': 'queued'}
+
+                print(f"[PRIVATE] From {sender} to {recipient_name}: #{envelope.seq} ({len(envelope.payload)} bytes)")
+                log_event("server", "private_msg", f"[PRIVATE] From {sender} to {recipient_name}: #{envelope.seq} ({len(envelope.payload)} bytes)")
                 # Each user has their own AES key for end-to-end encryption
-                re_encrypted = encrypt_aes(recipient_entry['aes_key'], plaintext)
-                # The 'room=recipient_entry['sid']' parameter ensures message goes ONLY to that client
-                self.sio.emit('incoming_private_message', {'message': re_encrypted, 'sender': sender}, room=recipient_entry['sid'])
+                self.deliver(recipient_entry, 'incoming_private_message', restamp(envelope, sender))
+                return {'status': 'ok'}
             except Exception as e:
                 print(f"Failed private message forwarding: {e}")
                 log_event("server", "private_msg", f"Failed private message forwarding: {e}")
+                return {'status': 'error', 'reason': 'server_error'}
+
+        # --- End-to-end mode ---
+        # Clients publish RSA public keys; messages are sealed client-side and the
+        # server only routes the opaque ciphertext, without any AES/RSA work.
+        @self.sio.event
+        def publish_key(sid, data):
+            user = next((u for u in self.users if u['sid'] == sid), None)
+            pem = data.get('public_key', '')
+            if not user:
+                return {'status': 'error', 'reason': 'not_joined'}
+            if not isinstance(pem, str) or not pem.startswith('-----BEGIN PUBLIC KEY-----') or len(pem) > MAX_PUBLIC_KEY:
+                return {'status': 'error', 'reason': 'invalid_key'}
+
+            user['public_key'] = pem
+            log_event("server", "publish_key", f"User {user['username']} published an E2E public key")
+            for other in self.users:
+                if other['sid'] != sid:
+                    self.send(other['sid'], 'public_key', {'username': user['username'], 'public_key': pem},
+                              priority=PRIORITY_CONTROL)
+            return {'status': 'ok', 'keys': self.public_keys()}
+
+        @self.sio.event
+        def e2e_message(sid, data):
+            sender_entry = next((u for u in self.users if u['sid'] == sid), None)
+            if not sender_entry:
+                return {'status': 'error', 'reason': 'not_joined'}
+
+            ciphertext = data.get('ciphertext')
+            keys = data.get('keys')
+            if not isinstance(ciphertext, bytes) or len(ciphertext) > MAX_E2E_CIPHERTEXT or not isinstance(keys, dict):
+                return {'status': 'error', 'reason': 'invalid_message'}
+
+            # The sequence number rides outside the ciphertext so retransmits can still be dropped
+            seq = data.get('seq', 0)
+            if isinstance(seq, int) and seq > 0:
+                if self.deliveries.is_duplicate(sender_entry.get('resume_token'), seq):
+                    self.metrics.incr('duplicate_messages')
+                    return {'status': 'duplicate'}
+
+            sender = sender_entry['username']
+            room = data.get('room')
+            if room:
+                if not self.rooms.is_member(room, sid):
+                    return {'status': 'error', 'reason': 'not_member'}
+                targets = [u for u in self.rooms.room_members(room) if u['username'] in keys]
+            else:
+                targets = [u for u in self.users if u['username'] == data.get('recipient') and u['username'] in keys]
+                if not targets:
+                    return {'status': 'error', 'reason': 'recipient_not_found'}
+
+            for user in targets:
+                self.deliver(user, 'incoming_e2e_message',
+                             {'sender': sender, 'room': room, 'ciphertext': ciphertext, 'key': keys[user['username']]})
+            self.metrics.incr('e2e_messages')
+            return {'status': 'ok', 'delivered': len(targets)}
+
+        # --- Rooms ---
+        @self.sio.event
+        def join_room(sid, data):
+            name = data.get('room', '')
+            user = next((u for u in self.users if u['sid'] == sid), None)
+            if not user:
+                return {'status': 'error', 'reason': 'not_joined'}
+            if not valid_room_name(name):
+                return {'status': 'error', 'reason': 'invalid_room'}
+
+            if self.join_room(name, user):
+                # Catch the newcomer up on recent history, encrypted for them only
+                history = [encrypt_aes_raw(user['aes_key'], packed) for packed in self.rooms.recent(name)]
+                self.send(sid, 'room_history', {'room': name, 'messages': history})
+            return {'status': 'ok', 'room': name, 'members': self.rooms.usernames(name)}
+
+        @self.sio.event
+        def leave_room(sid, data):
+            name = data.get('room', '')
+            if name == DEFAULT_ROOM:
+                return {'status': 'error', 'reason': 'cannot_leave_default'}
+            user = next((u for u in self.users if u['sid'] == sid), None)
+            if not user or not self.leave_room(name, sid, user['username']):
+                return {'status': 'error', 'reason': 'not_member'}
+            return {'status': 'ok', 'room': name}
+
+        @self.sio.event
+        def list_rooms(sid):
+            return {'rooms': self.rooms.listing()}
 
         # --- User info ---
+        @self.sio.event
+        def claim_username(sid, data):
+            # Constant-time availability check that also reserves the name for this sid
+            reason = self.usernames.claim((data or {}).get('username', ''), sid, token_alive=self.session_alive)
+            if reason:
+                return {'status': 'rejected', 'reason': reason}
+            return {'status': 'ok'}
+
         @self.sio.event
         def get_current_users(sid):
             # Return current list of usernames
@@ -179,159 +440,1085 @@ class ChatServer:
             return {'current_usernames': usernames}
         
         # --- File transfer: Public & Private ---
+        # Every transfer is keyed by a client-generated transfer ID, so two
+        # files with the same name can be in flight at the same time.
         @self.sio.event
         def start_upload(sid, data):
-            filename = data.get('filename', '')
+            transfer_id = data.get('transfer_id', '')
+            filename = safe_filename(data.get('filename', ''))
             sender = data.get('sender', 'Anonymous')
             recipient = data.get('recipient', 'Global')
+            sender_entry = next((u for u in self.users if u['sid'] == sid), None)
             
             if not recipient:
                 print("Recipient not found.")
                 log_event("server", "start_upload", "Recipient not found.")
-                return
+                return {'status': 'rejected', 'reason': 'recipient_not_found'}
+
+            if not valid_transfer_id(transfer_id) or not filename or transfer_id in self.upload_files:
+                print(f"[start_upload] Invalid transfer: {transfer_id}")
+                log_event("server", "start_upload", f"Invalid transfer {transfer_id} for {filename}")
+                return {'status': 'rejected', 'reason': 'invalid_transfer'}
+
+            if not sender_entry:
+                return {'status': 'rejected', 'reason': 'not_joined'}
 
-            path = os.path.join(UPLOAD_FOLDER, filename)
+            if self.draining:
+                return {'status': 'rejected', 'reason': 'server_shutting_down'}
+
+            # The declared size is reserved against the quotas up front and enforced per chunk
+            try:
+                filesize = int(data.get('filesize'))
+            except (TypeError, ValueError):
+                return {'status': 'rejected', 'reason': 'invalid_size'}
+
+            owner = sender_entry['username']
+            reason = self.quotas.reserve(owner, filesize)
+            if reason:
+                print(f"[start_upload] Rejected {filename} from {owner}: {reason}")
+                log_event("server", "start_upload_rejected", f"Rejected {filename} ({filesize} bytes) from {owner}: {reason}")
+                return {'status': 'rejected', 'reason': reason}
+
+            path = stored_path(self.upload_folder, transfer_id, filename)
+            # Chunk compression: the client offers codecs it found worthwhile, the server picks one
+            codec = negotiate(data.get('codecs'))
 
             try:
                 file = open(path, 'wb')
                 hash_algo = hashlib.sha256()
                 
-                # self.upload_files[(sid, filename, recipient)] = file  # Track the file by sid
-                self.upload_files[(sid, filename, recipient)] = {"file": file, 
-                                                                 "hash_compare": hash_algo}
+                self.upload_files[transfer_id] = {"sid": sid,
+                                                  "owner": owner,
+                                                  "file": file,
+                                                  "path": path,
+                                                  "filename": filename,
+                                                  "recipient": recipient,
+                                                  "filesize": filesize,
+                                                  "received": 0,
+                                                  "codec": codec,
+                                                  "started": time.monotonic(),
+                                                  "last_activity": time.monotonic(),
+                                                  "hash_compare": hash_algo,
+                                                  "writer": self.disk.writer(file, hash_algo)}
                 
                 print(f"[Upload from {sender} to Server] Start: {filename}")
-                log_event("server", "start_upload", f"Start upload: {filename} from {sender} to {recipient}")
+                log_event("server", "start_upload", f"Start upload: {filename} ({transfer_id}) from {sender} to {recipient}, codec {codec}")
+                # The packet limit is sized from our chunk_size; clients clamp their chunks to it
+                reply = {'status': 'ok', 'max_chunk': self.chunk_size}
+                if codec != 'none':  # Older clients never offer codecs
+                    reply['codec'] = codec
+                return reply
             except Exception as e:
+                self.quotas.release(owner, filesize)
                 print(f"[start_upload] Failed to create file: {e}")
                 log_event("server", "start_upload", f"Failed to create file: {e}")
+                return {'status': 'rejected', 'reason': 'server_error'}
                 
         # Send checks
         @self.sio.event
         def upload_chunk(sid, data):
             # Decode the base64 to binary when server receives the chunks
-            chunk = base64.b64decode(data.get('chunk_data', None))
-            filename = data.get('filename', '')
-            recipient = data.get('recipient', 'Global')
+            wire = base64.b64decode(data.get('chunk_data', None))
+            transfer_id = data.get('transfer_id', '')
             
-            file_info = self.upload_files.get((sid, filename, recipient))
-            if not file_info:
+            file_info = self.upload_files.get(transfer_id)
+            if not file_info or file_info['sid'] != sid or file_info.get('finishing'):
                 return
-            
-            file = file_info['file']
-            hash_compare = file_info['hash_compare']
-            
-            if file:
+
+            # Compressed chunks may not expand past what is left of the declared size
+            chunk = wire
+            if data.get('compressed'):
+                remaining = file_info['filesize'] - file_info['received']
                 try:
-                    file.write(chunk) # Write in the received file
-                    hash_compare.update(chunk)
-                    # print(f"[upload_chunk] Chunk received: {filename}")
-                    # file['content'].write(chuck)
+                    if file_info['codec'] == 'none':
+                        raise ValueError("chunk compressed without a negotiated codec")
+                    chunk = decompress_bounded(wire, file_info['codec'], remaining)
+                except ValueError:
+                    self.abort_upload(transfer_id, 'size_exceeded')
+                    return
                 except Exception as e:
-                    print(f"[upload_chunk] Failed to write chunk")
-                    log_event("server", "upload_chunk_failed", f"Failed to write chunk for {filename}: {e}")
+                    log_event("server", "upload_chunk_failed", f"Bad compressed chunk for {file_info['filename']}: {e}")
+                    self.abort_upload(transfer_id, 'invalid_chunk')
+                    return
+                self.metrics.incr('upload_bytes_saved', len(chunk) - len(wire))
+
+            # Never accept more than was declared (and reserved) at start_upload
+            if file_info['received'] + len(chunk) > file_info['filesize']:
+                self.abort_upload(transfer_id, 'size_exceeded')
+                return
+
+            # Throttle chunk floods by bytes on the wire; a session far over its rate loses the upload
+            bucket = self.upload_buckets.setdefault(sid, TokenBucket(UPLOAD_RATE, UPLOAD_BURST))
+            wait = bucket.reserve(len(wire), MAX_THROTTLE_WAIT)
+            if wait is None:
+                self.abort_upload(transfer_id, 'rate_limited')
+                return
+            if wait:
+                self.sio.sleep(wait)
+                # The upload may have been aborted while this chunk waited
+                if self.upload_files.get(transfer_id) is not file_info:
+                    return
+            
+            file_info['received'] += len(chunk)
+            file_info['last_activity'] = time.monotonic()
+
+            # Written and hashed on the disk pool, in order; a full buffer means the disk cannot keep up
+            writer = file_info['writer']
+            if not self.disk.write(writer, chunk):
+                if writer.error is not None:
+                    print(f"[upload_chunk] Failed to write chunk for {transfer_id}: {writer.error}")
+                    log_event("server", "upload_chunk_failed", f"Failed to write chunk for {file_info['filename']}: {writer.error}")
+                    self.abort_upload(transfer_id, 'server_error')
+                else:
+                    log_event("server", "upload_chunk_failed", f"Disk buffer full for {file_info['filename']}")
+                    self.abort_upload(transfer_id, 'disk_busy')
                     
         # Finish uploading file
         @self.sio.event
         def finish_upload(sid, data):
-            filename = data.get('filename', '')
+            transfer_id = data.get('transfer_id', '')
             sender = data.get('sender', 'Anonymous')
-            recipient = data.get('recipient', 'Global')
             client_hash = data.get('hash_file', '')
             timestamp = data.get('time', '')
                 
-            file_info = self.upload_files.get((sid, filename, recipient))
-            if not file_info:
+            file_info = self.upload_files.get(transfer_id)
+            if not file_info or file_info['sid'] != sid or file_info.get('finishing'):
                 return
-            
+            # Claimed before the first yield: aborts, checkpoints and a repeated finish leave it alone
+            file_info['finishing'] = True
+
+            filename = file_info['filename']
+            recipient = file_info['recipient']
+
+            # Every queued chunk has to be on disk and hashed before the hashes are compared
+            error = self.disk.flush(file_info['writer'])
+            if error is not None:
+                print(f"[finish_upload] Failed to write chunk for {transfer_id}: {error}")
+                log_event("server", "upload_chunk_failed", f"Failed to write chunk for {filename}: {error}")
+
             try: 
-                file_info['file'].close()
+                self.disk.run(file_info['file'].close)
                 computed_hash = file_info['hash_compare'].hexdigest()
                 
-                if computed_hash != client_hash:
+                if computed_hash != client_hash or file_info['received'] != file_info['filesize']:
+                    self.quotas.release(file_info['owner'], file_info['filesize'])
                     print(f"[finish_upload] Hash mismatch: expected {client_hash}, got {computed_hash}")
                     log_event("server", "finish_upload_failed", f"Hash mismatch for {filename}")
                     
-                    # Construct full path to the file
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)  # Replace UPLOAD_FOLDER with your actual directory variable
-                    
-                    # # Delete the failed file
+                    # Delete the failed file
+                    file_path = file_info['path']
                     if os.path.exists(file_path):
                         os.remove(file_path)
                         print(f"[finish_upload] Deleted corrupt file: {file_path}")
                         log_event("server", "delete_failed_upload_file", f"Deleted corrupt file: {file_path}")
                                     
-                    self.sio.emit('retry_sending', {
+                    self.send(sid, 'retry_sending', {
+                        'transfer_id': transfer_id,
                         'filename': filename,
                         'sender': sender
-                    })
+                    }, priority=PRIORITY_CONTROL)
                     return
                 
+                self.stored_files[transfer_id] = {'owner': file_info['owner'], 'size': file_info['filesize']}
                 print(f"[Upload from {sender} to Server] Finished upload {filename}")
-                log_event("server", "finish_upload", f"Finished upload: {filename} from {sender} to {recipient} at {timestamp}")
-                
+                log_event("server", "finish_upload", f"Finished upload: {filename} ({transfer_id}) from {sender} to {recipient} at {timestamp}")
+
+                # The transfer ID doubles as the stored file's ID for downloads
+                file_notice = {
+                    'file_id': transfer_id,
+                    'filename': filename,
+                    'filesize': file_info['filesize'],
+                    'sender': sender,
+                    'time': timestamp
+                }
                 if recipient == "Global":
                     for user in self.users:
                         # Notify 'incoming_global_file' to all users
-                        # Global file
-                        self.sio.emit('incoming_global_file', {
-                                      'filename': filename,
-                                      'sender': sender,
-                                      'time': timestamp
-                        }, room=user['sid'])
+                        self.send(user['sid'], 'incoming_global_file', file_notice)
                 else:
                     recipient_entry = next((u for u in self.users if u['username'] == recipient), None)
                     
-                    self.sio.emit('incoming_private_file', {
-                                  'filename': filename,
-                                  'sender': sender,
-                                  'time': timestamp
-                    }, room=recipient_entry['sid'])    
+                    self.send(recipient_entry['sid'], 'incoming_private_file', file_notice)
+
+                # Thumbnail and metadata follow the notice once the worker pool has them
+                kind = media_kind(filename)
+                if kind:
+                    self.previews.request(computed_hash, file_info['path'], kind,
+                                          lambda preview: self.send_preview(transfer_id, recipient, preview))
                                 
             except Exception as e:
                 print(f"[finish_upload] Failed to finalize file")
                 log_event("server", "finish_upload_failed", f"Failed to finalize file {filename}: {e}")
             finally:
-                self.upload_files.pop((sid, filename, recipient), None)
+                self.upload_files.pop(transfer_id, None)
                         
+        @self.sio.event
+        def cancel_upload(sid, data):
+            transfer_id = data.get('transfer_id', '')
+            file_info = self.upload_files.get(transfer_id)
+            if file_info and file_info['sid'] == sid:
+                self.abort_upload(transfer_id, 'cancelled')
+
         # --- Request download file --- 
         @self.sio.event
         def download_request(sid, data):
-            filename = data.get('filename', '')
-            path = os.path.join(UPLOAD_FOLDER, filename)
+            file_id = data.get('file_id', '')
+            filename = safe_filename(data.get('filename', ''))
+            # Identifies this download on the client, separate from the stored file's ID
+            transfer_id = data.get('transfer_id', '')
+            # Resume offset from the client's partial-file sidecar
+            start_offset = data.get('offset')
+            start_offset = start_offset if isinstance(start_offset, int) and start_offset > 0 else 0
+            # Chunks the client lets us have unacknowledged; clients that send none get no flow control
+            window = data.get('window')
+            window = min(window, MAX_DOWNLOAD_WINDOW) * self.chunk_size if isinstance(window, int) and window > 0 else 0
             hash_algo_download = hashlib.sha256()
-            
+
+            # Rejections go back as the ack, not as download_aborted: that would name the
+            # transfer ID, which may belong to a download this session already has running
+            if not valid_transfer_id(file_id) or not filename:
+                print(f"[download_request] Invalid file: {file_id}")
+                log_event("server", "download_request_failed", f"Invalid file ID: {file_id}")
+                return {'status': 'rejected', 'reason': 'invalid_file'}
+            # Client-chosen, so only unique per session; checked before anything is pinned
+            key = (sid, transfer_id)
+            if not valid_transfer_id(transfer_id) or key in self.downloads:
+                print(f"[download_request] Invalid transfer ID: {transfer_id}")
+                log_event("server", "download_request_failed", f"Invalid or duplicate transfer ID: {transfer_id}")
+                return {'status': 'rejected', 'reason': 'invalid_transfer_id'}
+
+            path = stored_path(self.upload_folder, file_id, filename)
+
             if not os.path.exists(path):
                 print(f"[download_request] File not found: {filename}")
                 log_event("server", "download_request_failed", f"File not found: {filename}")
-                return
+                return {'status': 'rejected', 'reason': 'not_found'}
+
+            filesize = os.path.getsize(path)
+            start_offset = min(start_offset, filesize)
 
             print(f"Start to downloading {filename}")
+            # Pin the file so the garbage collector leaves it alone while it streams
+            self.file_refs[file_id] = self.file_refs.get(file_id, 0) + 1
+            progress = {'sid': sid, 'file_id': file_id, 'filename': filename, 'filesize': filesize,
+                        'offset': start_offset, 'sent': 0, 'started': time.monotonic(), 'cancelled': False,
+                        'window': window, 'acked': start_offset}
+            self.downloads[key] = progress
+
             # Send chunks to receiver
             def send_chunks():
                 try:
                     with open(path, 'rb') as file:
+                        offset = 0
                         while True:
-                            chunk = file.read(CHUNK_SIZE)
+                            chunk = file.read(self.chunk_size)
                             if not chunk:
                                 break
+                            # The hash always covers the whole file, resumed or not
                             hash_algo_download.update(chunk)
-                            
+                            chunk_offset = offset
+                            offset += len(chunk)
+                            if offset <= start_offset:
+                                continue
+
+                            # Never more than the window ahead of what the client has on disk
+                            reason = 'cancelled' if progress['cancelled'] else None
+                            if not reason and window and not self.wait_for_window(progress, offset - window):
+                                reason = 'cancelled' if progress['cancelled'] else 'stalled'
+                            if reason:
+                                self.send(sid, 'download_aborted', {'transfer_id': transfer_id, 'filename': filename,
+                                                                    'reason': reason}, priority=PRIORITY_CONTROL)
+                                return
+
                             encoded_data = base64.b64encode(chunk).decode()
-                            self.sio.emit('incoming_file_chunk', {
+                            # Bulk lane: yields to chat traffic and blocks while the client is behind
+                            if not self.send(sid, 'incoming_file_chunk', {
+                                    'transfer_id': transfer_id,
                                     'chunk_data': encoded_data,
-                                    'filename': filename}, 
-                                    room=sid)
-                            
-                    self.sio.emit('finish_download', {'filename': filename, 'hash_file': hash_algo_download.hexdigest()}, room=sid)
+                                    'offset': chunk_offset,
+                                    'filesize': filesize},
+                                    priority=PRIORITY_BULK):
+                                return
+                            progress['sent'] += len(chunk)
+
+                    # Same lane as the chunks so it cannot overtake them
+                    self.send(sid, 'finish_download', {'transfer_id': transfer_id,
+                                                       'filename': filename,
+                                                       'hash_file': hash_algo_download.hexdigest(),
+                                                       'filesize': filesize}, priority=PRIORITY_BULK)
                 except Exception as e:
                     print(f"[send_chunks] Failed to send file: {e}")
                     log_event("server", "send_chunks_failed", f"Failed to send file {filename}: {e}")
+                finally:
+                    if self.downloads.get(key) is progress:
+                        self.downloads.pop(key)
+                    refs = self.file_refs.get(file_id, 1) - 1
+                    if refs > 0:
+                        self.file_refs[file_id] = refs
+                    else:
+                        self.file_refs.pop(file_id, None)
             
             self.sio.start_background_task(send_chunks)
+            return {'status': 'ok', 'filesize': filesize}
+
+        @self.sio.event
+        def download_ack(sid, data):
+            # Window credit: the client has this many bytes of the download written to disk
+            progress = self.downloads.get((sid, data.get('transfer_id', '')))
+            offset = data.get('offset')
+            if progress and isinstance(offset, int):
+                progress['acked'] = max(progress['acked'], offset)
         
+    def wait_for_window(self, progress, until):
+        """Wait, yielding to the loop, until the client has acknowledged `until` bytes.
+
+        False if the download was cancelled, its client went away, or no ack
+        came for DOWNLOAD_ACK_TIMEOUT seconds.
+        """
+        deadline = time.monotonic() + DOWNLOAD_ACK_TIMEOUT
+        while progress['acked'] < until:
+            if progress['cancelled'] or progress['sid'] not in self.outbound or time.monotonic() > deadline:
+                return False
+            self.sio.sleep(ACK_POLL)
+        return True
+
+    def close_session(self, sid):
+        """Release everything held for sid; returns the username it had joined with, if any.
+
+        Every way a connection ends (disconnect, slow-client drop, kick,
+        orphan sweep) comes through here, so nothing per-sid outlives it.
+        """
+        session = self.sessions.close(sid)
+        username = next((user['username'] for user in self.users if user['sid'] == sid), None)
+        token = next((user.get('resume_token') for user in self.users if user['sid'] == sid), None)
+        self.users = [user for user in self.users if user['sid'] != sid]
+        # Keep the replay buffer around in case the client comes back, unless it already has
+        if token and not any(user.get('resume_token') == token for user in self.users):
+            self.deliveries.detach(token)
+        self.limiter.forget(sid)
+        self.usernames.detach(sid)  # Still reserved while the session can be resumed
+        self.leave_all_rooms(sid, username)
+        if session and session.outbound:
+            session.outbound.close()
+        if self.batcher:
+            self.batcher.discard(sid)
+        # Close and delete anything this client was still uploading
+        for transfer_id in [t for t, info in self.upload_files.items() if info['sid'] == sid]:
+            self.abort_upload(transfer_id, 'disconnected')
+        return username
+
+    def close_orphaned_sessions(self):
+        """Close sessions whose connection is gone without a disconnect having cleaned up after it."""
+        orphans = self.sessions.orphans(lambda sid: self.sio.manager.is_connected(sid, '/'))
+        for sid in orphans:
+            self.close_session(sid)
+            log_event("server", "orphaned_session", f"Closed session {sid} left behind by a closed connection")
+        return len(orphans)
+
+    def session_memory(self, limit=None):
+        """Bytes held per session: the Session itself plus its uploads, rate-limit buckets and replay buffer."""
+        parts = {}
+        seen = set()  # Shared across sessions: a broadcast queued for everyone is counted once
+        for session in self.sessions.values():
+            sizes = {'session': deep_size(session, seen)}
+            sizes['uploads'] = sum(deep_size(info, seen) for info in list(self.upload_files.values())
+                                   if info['sid'] == session.sid)
+            sizes['rate_limits'] = sum(deep_size(bucket, seen) for (sid, _), bucket in list(self.limiter.buckets.items())
+                                       if sid == session.sid)
+            replay = self.deliveries.get(session.resume_token) if session.resume_token else None
+            sizes['replay'] = deep_size(replay, seen) if replay is not None else 0
+            parts[session.sid] = sizes
+        report = memory_report(parts) if limit is None else memory_report(parts, limit=limit)
+        report['joined'] = len(self.users)
+        report['opened'], report['closed'] = self.sessions.opened, self.sessions.closed
+        return report
+
+    def abort_upload(self, transfer_id, reason):
+        """Stop an upload early: close and delete its file, release its quota, tell the sender.
+
+        Returns False if there is nothing to abort, including an upload finish_upload has claimed.
+        """
+        file_info = self.upload_files.get(transfer_id)
+        if not file_info or file_info.get('finishing'):
+            return False
+        del self.upload_files[transfer_id]
+        self.discard_upload(transfer_id, file_info, reason)
+        return True
+
+    def discard_upload(self, transfer_id, file_info, reason):
+        try:
+            # Unwritten chunks are dropped; the one being written finishes before the file closes
+            file_info['writer'].discard()
+            self.disk.flush(file_info['writer'])
+            self.disk.run(file_info['file'].close)
+            if os.path.exists(file_info['path']):
+                os.remove(file_info['path'])
+        except Exception as e:
+            print(f"[abort_upload] Cleanup failed: {e}")
+            log_event("server", "abort_upload_failed", f"Cleanup failed for {file_info['filename']}: {e}")
+
+        self.quotas.release(file_info['owner'], file_info['filesize'])
+        print(f"[abort_upload] {file_info['filename']} ({transfer_id}): {reason}")
+        log_event("server", "abort_upload", f"Aborted upload {file_info['filename']} ({transfer_id}) from {file_info['owner']}: {reason}")
+        self.send(file_info['sid'], 'upload_aborted', {'transfer_id': transfer_id,
+                                                       'filename': file_info['filename'],
+                                                       'reason': reason}, priority=PRIORITY_CONTROL)
+
+    # --- Graceful shutdown and restart ---
+    def shutdown(self, drain_timeout=DRAIN_TIMEOUT):
+        """Drain and hand off to the next process.
+
+        Stops accepting connections and uploads, tells clients to reconnect,
+        flushes pending batches and outbound queues, checkpoints in-flight
+        uploads, drops the transports (without a close packet, so clients
+        reconnect on their own), snapshots session state and flushes the log.
+        """
+        self.draining = True
+        print("[shutdown] Draining...")
+        log_event("server", "shutdown", "Graceful shutdown started")
+
+        for sid in list(self.outbound):
+            self.send(sid, 'server_restarting', {'reconnect_after': RECONNECT_AFTER}, priority=PRIORITY_CONTROL)
+        if self.batcher:
+            for sid in list(self.batcher.pending):
+                self.batcher.flush(sid)
+
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline and any(q.depth for q in self.outbound.values()):
+            self.sio.sleep(0.05)
+
+        checkpointed = self.checkpoint_uploads()
+        for sid in list(self.outbound):
+            self.drop_transport(sid)
+        self.write_snapshot()
+        self.previews.shutdown()
+        self.disk.shutdown()
+        self.profiler.stop()
+        flush_logs()
+
+        print(f"[shutdown] Done: {checkpointed} uploads checkpointed")
+        log_event("server", "shutdown", f"Shutdown complete, {checkpointed} uploads checkpointed")
+        return checkpointed
+
+    def drop_transport(self, sid):
+        try:
+            eio_sid = self.sio.manager.eio_sid_from_sid(sid, '/')
+            self.sio.eio.sockets[eio_sid].close(wait=False, abort=True)
+        except Exception:
+            pass
+
+    def checkpoint_uploads(self):
+        """Sync and close every in-flight upload, keeping what it needs to resume."""
+        tokens = {user['sid']: user.get('resume_token') for user in self.users}
+        for transfer_id, info in list(self.upload_files.items()):
+            # Out of upload_files first, so no chunk is queued after its size is recorded
+            if info.get('finishing') or self.upload_files.get(transfer_id) is not info:
+                continue  # finish_upload completes (or rejects) it
+            del self.upload_files[transfer_id]
+            try:
+                error = self.disk.flush(info['writer'])
+                if error is not None:
+                    raise error
+                self.disk.run(sync_and_close, info['file'])
+            except Exception as e:
+                print(f"[checkpoint] Failed for {info['filename']}: {e}")
+                log_event("server", "checkpoint_failed", f"Checkpoint failed for {info['filename']}: {e}")
+                self.discard_upload(transfer_id, info, 'server_restart')
+                continue
+            self.suspended_uploads[transfer_id] = {
+                'token': tokens.get(info['sid']), 'owner': info['owner'], 'path': info['path'],
+                'filename': info['filename'], 'recipient': info['recipient'],
+                'filesize': info['filesize'], 'received': info['received'], 'codec': info.get('codec', 'none'),
+                'last_activity': time.monotonic()}
+        return len(self.suspended_uploads)
+
+    def write_snapshot(self):
+        state = {'sessions': self.deliveries.export(),
+                 'uploads': {tid: {k: v for k, v in info.items() if k != 'last_activity'}
+                             for tid, info in self.suspended_uploads.items()},
+                 'stored_files': self.stored_files}
+        try:
+            write_snapshot(self.snapshot_path, state)
+        except Exception as e:
+            print(f"[shutdown] Failed to write snapshot: {e}")
+            log_event("server", "snapshot_failed", f"Failed to write snapshot: {e}")
+
+    def restore_snapshot(self):
+        """Pick up where the previous process left off, if it left a snapshot.
+
+        An explicit step for the entry point, not part of construction: reading
+        the snapshot deletes it, so only the process taking over should do it.
+        """
+        try:
+            state = read_snapshot(self.snapshot_path)
+        except Exception as e:
+            print(f"[restore] Failed to read snapshot: {e}")
+            log_event("server", "restore_failed", f"Failed to read snapshot: {e}")
+            return
+        if not state:
+            return
+
+        sessions = self.deliveries.restore(state.get('sessions', []))
+        for item in state.get('sessions', []):
+            if item.get('username'):
+                self.usernames.restore(item['username'], item['token'])
+        on_disk = {stored_file_id(name) for name in os.listdir(self.upload_folder)}
+        for file_id, stored in state.get('stored_files', {}).items():
+            if file_id in on_disk:
+                self.stored_files[file_id] = stored
+                self.quotas.reserve(stored['owner'], stored['size'])
+        for transfer_id, info in state.get('uploads', {}).items():
+            if not os.path.exists(info['path']):
+                continue
+            reason = self.quotas.reserve(info['owner'], info['filesize'])
+            if reason:
+                # Cannot be resumed, so the partial file goes now rather than waiting for the stored-file GC
+                try:
+                    os.remove(info['path'])
+                except OSError:
+                    pass
+                print(f"[restore] Dropped upload {info['filename']}: {reason}")
+                log_event("server", "restore_upload_dropped", f"Dropped checkpointed upload {info['filename']} ({transfer_id}) from {info['owner']}: {reason}")
+                continue
+            self.suspended_uploads[transfer_id] = dict(info, last_activity=time.monotonic())
+        print(f"[restore] {sessions} sessions, {len(self.suspended_uploads)} uploads restored")
+        log_event("server", "restore", f"Restored {sessions} sessions and {len(self.suspended_uploads)} uploads")
+
+    def resume_uploads(self, user):
+        """Reopen checkpointed uploads of a returning user and tell them where to continue."""
+        token = user.get('resume_token')
+        for transfer_id, info in list(self.suspended_uploads.items()):
+            if info['token'] != token:
+                continue
+            self.suspended_uploads.pop(transfer_id)
+            try:
+                # Rehashing the partial file reads all of it, so it runs on the disk pool
+                file, hash_algo = self.disk.run(reopen_upload, info['path'], info['received'])
+            except Exception as e:
+                print(f"[resume_upload] Failed for {info['filename']}: {e}")
+                log_event("server", "resume_upload_failed", f"Failed to resume {info['filename']}: {e}")
+                self.discard_suspended_upload(info)
+                continue
+
+            self.upload_files[transfer_id] = {"sid": user['sid'],
+                                              "owner": info['owner'],
+                                              "file": file,
+                                              "path": info['path'],
+                                              "filename": info['filename'],
+                                              "recipient": info['recipient'],
+                                              "filesize": info['filesize'],
+                                              "received": info['received'],
+                                              "codec": info.get('codec', 'none'),
+                                              "started": time.monotonic(),
+                                              "resumed_at": info['received'],
+                                              "last_activity": time.monotonic(),
+                                              "hash_compare": hash_algo,
+                                              "writer": self.disk.writer(file, hash_algo)}
+            log_event("server", "resume_upload", f"Resumed {info['filename']} ({transfer_id}) at {info['received']}")
+            self.send(user['sid'], 'upload_resume', {'transfer_id': transfer_id, 'offset': info['received']},
+                      priority=PRIORITY_CONTROL)
+
+    def discard_suspended_upload(self, info):
+        try:
+            if os.path.exists(info['path']):
+                os.remove(info['path'])
+        except OSError:
+            pass
+        self.quotas.release(info['owner'], info['filesize'])
+
+    def expire_suspended_uploads(self, now=None):
+        """Delete checkpointed uploads whose owner never came back."""
+        now = time.monotonic() if now is None else now
+        expired = [tid for tid, info in self.suspended_uploads.items()
+                   if now - info['last_activity'] > UPLOAD_IDLE_TIMEOUT]
+        for transfer_id in expired:
+            info = self.suspended_uploads.pop(transfer_id)
+            self.discard_suspended_upload(info)
+            log_event("server", "abort_upload", f"Checkpointed upload {info['filename']} ({transfer_id}) was never resumed")
+        return len(expired)
+
+    # --- Room membership ---
+    def join_room(self, name, user):
+        if not self.rooms.join(name, user):
+            return False
+        self.sio.enter_room(user['sid'], sio_room(name))
+        self.room_presence(name, user['username'], 'joined')
+        log_event("server", "join_room", f"User {user['username']} joined room {name}")
+        return True
+
+    def leave_room(self, name, sid, username):
+        if not self.rooms.leave(name, sid):
+            return False
+        self.sio.leave_room(sid, sio_room(name))
+        self.room_presence(name, username, 'left')
+        log_event("server", "leave_room", f"User {username} left room {name}")
+        return True
+
+    def leave_all_rooms(self, sid, username):
+        for name in self.rooms.leave_all(sid):
+            self.sio.leave_room(sid, sio_room(name))
+            self.room_presence(name, username, 'left')
+
+    def room_presence(self, name, username, action):
+        # The default room's presence already travels as user_joined / user_left
+        if name == DEFAULT_ROOM:
+            return
+        update = {'room': name, 'username': username, 'action': action,
+                  'members': self.rooms.usernames(name)}
+        for user in self.rooms.room_members(name):
+            self.send(user['sid'], 'room_presence', update,
+                      priority=PRIORITY_CONTROL, coalesce_key=f"room_presence:{name}")
+
+    # --- Admin namespace ---
+    def register_admin_events(self):
+        @self.sio.on('connect', namespace=ADMIN_NAMESPACE)
+        def admin_connect(sid, environ, auth=None):
+            token = auth.get('token') if isinstance(auth, dict) else None
+            if not self.admin_token or not isinstance(token, str) or \
+                    not hmac.compare_digest(token.encode(), self.admin_token.encode()):
+                print(f"[admin] Refused connection from {sid}")
+                log_event("server", "admin_refused", f"Admin connection refused for {sid}")
+                return False
+            self.admins.add(sid)
+            log_event("server", "admin_connect", f"Admin {sid} connected")
+
+        @self.sio.on('disconnect', namespace=ADMIN_NAMESPACE)
+        def admin_disconnect(sid, reason=None):
+            self.admins.discard(sid)
+
+        @self.admin_event
+        def profile_start(sid, data=None):
+            # Runs on the event loop thread, which is the one the sampler watches
+            if not self.profiler.start(self.sio.handlers['/'], exclude=UNLIMITED_EVENTS):
+                return {'status': 'error', 'reason': 'already_running'}
+            log_event("server", "profile_start", f"Profiling started by {sid}")
+            return {'status': 'ok'}
+
+        @self.admin_event
+        def profile_stop(sid, data=None):
+            if not self.profiler.stop():
+                return {'status': 'error', 'reason': 'not_running'}
+            log_event("server", "profile_stop", f"Profiling stopped by {sid}")
+            return {'status': 'ok', 'report': self.profiler.report()}
+
+        @self.admin_event
+        def profile_report(sid, data=None):
+            # Per-handler timing plus collapsed stacks for a flame graph, while running or after a stop
+            return {'status': 'ok', 'report': self.profiler.report(), 'collapsed': self.profiler.collapsed()}
+
+        @self.admin_event
+        def memory_report(sid, data=None):
+            # Bytes per session and in total, for sizing RAM per number of connections
+            limit = (data or {}).get('limit') if isinstance(data, dict) else None
+            return {'status': 'ok', 'report': self.session_memory(limit if isinstance(limit, int) else None)}
+
+        # Live views: all of it comes from in-memory state, nothing reads the log database
+        @self.admin_event
+        def overview(sid, data=None):
+            return {'status': 'ok', 'sessions': self.session_rows(), 'transfers': self.transfer_rows(),
+                    'queues': self.queue_report(), 'disk': self.disk.stats(),
+                    'event_rates': self.event_rates.rates(), 'metrics': self.metrics.snapshot()}
+
+        @self.admin_event
+        def sessions(sid, data=None):
+            return {'status': 'ok', 'sessions': self.session_rows()}
+
+        @self.admin_event
+        def transfers(sid, data=None):
+            return {'status': 'ok', **self.transfer_rows()}
+
+        @self.admin_event
+        def queues(sid, data=None):
+            return {'status': 'ok', 'queues': self.queue_report(), 'disk': self.disk.stats()}
+
+        @self.admin_event
+        def event_rates(sid, data=None):
+            return {'status': 'ok', 'rates': self.event_rates.rates(), 'metrics': self.metrics.snapshot()}
+
+        @self.admin_event
+        def top_talkers(sid, data=None):
+            data = data if isinstance(data, dict) else {}
+            by = data.get('by', 'rate')
+            if by not in TALKER_ORDER:
+                return {'status': 'error', 'reason': 'invalid_order'}
+            limit = data.get('limit') if isinstance(data.get('limit'), int) else ADMIN_LIST_LIMIT
+            rows = sorted(self.session_rows(), key=lambda row: -row[TALKER_ORDER[by]])
+            return {'status': 'ok', 'by': by, 'sessions': rows[:limit]}
+
+        # Actions
+        @self.admin_event
+        def kick(sid, data=None):
+            session = self.find_session(data)
+            if session is None:
+                return {'status': 'error', 'reason': 'unknown_session'}
+            reason = str(data.get('reason') or 'removed by an operator')[:200]
+            log_event("server", "admin_kick", f"Admin {sid} kicked {session.sid} ({session.username}): {reason}")
+            self.kick_session(session.sid, reason)
+            return {'status': 'ok', 'sid': session.sid}
+
+        @self.admin_event
+        def throttle(sid, data=None):
+            session = self.find_session(data)
+            if session is None:
+                return {'status': 'error', 'reason': 'unknown_session'}
+            try:
+                factor = float(data.get('factor', 1))
+            except (TypeError, ValueError):
+                factor = 0
+            if not 0 < factor <= 1:
+                return {'status': 'error', 'reason': 'invalid_factor'}
+            self.throttle_session(session, factor)
+            log_event("server", "admin_throttle", f"Admin {sid} set throttle {factor} on {session.sid} ({session.username})")
+            return {'status': 'ok', 'sid': session.sid, 'factor': factor}
+
+        @self.admin_event
+        def cancel_transfer(sid, data=None):
+            transfer_id, only_sid = (data.get('transfer_id', ''), data.get('sid')) if isinstance(data, dict) else ('', None)
+            # Download IDs are only unique per session; 'sid' picks one when several sessions share it
+            downloads = [progress for (owner, tid), progress in list(self.downloads.items())
+                         if tid == transfer_id and only_sid in (None, owner)]
+            if transfer_id in self.upload_files:
+                if not self.abort_upload(transfer_id, 'cancelled_by_admin'):
+                    return {'status': 'error', 'reason': 'finishing'}
+            elif len(downloads) > 1:
+                return {'status': 'error', 'reason': 'ambiguous_transfer'}
+            elif downloads:
+                downloads[0]['cancelled'] = True  # The streaming task stops at its next chunk
+            else:
+                return {'status': 'error', 'reason': 'unknown_transfer'}
+            log_event("server", "admin_cancel_transfer", f"Admin {sid} cancelled transfer {transfer_id}")
+            return {'status': 'ok'}
+
+    # --- Operator views and actions ---
+    def find_session(self, data):
+        """The Session an admin request names by 'sid' or 'username', or None."""
+        if not isinstance(data, dict):
+            return None
+        sid = data.get('sid') or next((user['sid'] for user in self.users
+                                       if data.get('username') and user['username'] == data['username']), None)
+        return self.sessions.get(sid) if sid else None
+
+    def session_rows(self):
+        now, wall = time.monotonic(), time.time()
+        uploading = {}
+        for info in self.upload_files.values():
+            uploading[info['sid']] = uploading.get(info['sid'], 0) + info['received']
+        return [{'sid': session.sid, 'username': session.username,
+                 'connected_for': round(wall - session.connected_at, 1),
+                 'events': session.events, 'event_rate': round(session.rate(now), 3),
+                 'queue_depth': session.outbound.depth if session.outbound is not None else 0,
+                 'upload_bytes': uploading.get(session.sid, 0), 'throttle': session.throttle}
+                for session in self.sessions.values()]
+
+    def transfer_rows(self):
+        """In-flight uploads and downloads with their progress and average bytes/sec."""
+        now = time.monotonic()
+        uploads = []
+        for transfer_id, info in list(self.upload_files.items()):
+            elapsed = now - info.get('started', now)
+            moved = info['received'] - info.get('resumed_at', 0)
+            uploads.append({'transfer_id': transfer_id, 'sid': info['sid'], 'owner': info['owner'],
+                            'filename': info['filename'], 'bytes': info['received'], 'filesize': info['filesize'],
+                            'rate': round(moved / elapsed) if elapsed > 0 else 0,
+                            'idle': round(now - info['last_activity'], 1)})
+        downloads = []
+        for (_, transfer_id), progress in list(self.downloads.items()):
+            elapsed = now - progress['started']
+            downloads.append({'transfer_id': transfer_id, 'sid': progress['sid'], 'file_id': progress['file_id'],
+                              'filename': progress['filename'], 'bytes': progress['offset'] + progress['sent'],
+                              'filesize': progress['filesize'],
+                              'rate': round(progress['sent'] / elapsed) if elapsed > 0 else 0})
+        return {'uploads': uploads, 'downloads': downloads}
+
+    def kick_session(self, sid, reason):
+        """Tell a client why it is being removed, end its resumable session and disconnect it."""
+        self.metrics.incr('admin_kicks')
+        self.send(sid, 'kicked', {'reason': reason}, priority=PRIORITY_CONTROL)
+        session = self.sessions.get(sid)
+        if session is not None and session.resume_token:
+            self.deliveries.close(session.resume_token)  # No resuming back in past a kick
+        self.sio.start_background_task(self.disconnect_after_drain, sid)
+
+    def disconnect_after_drain(self, sid, timeout=KICK_DRAIN):
+        deadline = time.monotonic() + timeout
+        queue = self.outbound.get(sid)
+        while queue is not None and queue.depth and time.monotonic() < deadline:
+            self.sio.sleep(0.05)
+        self.sio.disconnect(sid)
+
+    def throttle_session(self, session, factor):
+        """Scale a session's event limits and upload byte rate by factor; 1 lifts the throttle."""
+        self.limiter.throttle(session.sid, factor)
+        session.throttle = None if factor == 1 else factor
+        session.upload_bucket = TokenBucket(UPLOAD_RATE * factor, UPLOAD_BURST * factor)
+
+    def admin_event(self, handler):
+        """Register handler on ADMIN_NAMESPACE, refusing sids that did not authenticate."""
+        @functools.wraps(handler)
+        def checked(sid, *args):
+            if sid not in self.admins:
+                return {'status': 'error', 'reason': 'unauthorized'}
+            return handler(sid, *args)
+        self.sio.on(handler.__name__, namespace=ADMIN_NAMESPACE)(checked)
+        return checked
+
+    # --- Rate limiting ---
+    def apply_rate_limits(self):
+        """Put the per-event token buckets in front of every registered handler."""
+        handlers = self.sio.handlers['/']
+        for event, handler in list(handlers.items()):
+            if event not in UNLIMITED_EVENTS:
+                handlers[event] = self.rate_limited(event, handler)
+
+    def rate_limited(self, event, handler):
+        @functools.wraps(handler)
+        def limited(sid, *args):
+            self.count_event(sid, event)
+            if self.limiter.allow(sid, event):
+                return handler(sid, *args)
+            self.metrics.incr('rate_limited')
+            self.metrics.incr(f'rate_limited:{event}')
+            if self.limiter.violation(sid):
+                self.metrics.incr('flood_disconnects')
+                print(f"[ratelimit] Disconnecting {sid} for flooding {event}")
+                log_event("server", "flood_disconnect", f"Disconnected {sid} for flooding {event}")
+                self.sio.disconnect(sid)
+            return {'status': 'error', 'reason': 'rate_limited'}
+        return limited
+
+    def count_event(self, sid, event):
+        # Feeds the admin views: per-event rates and per-session totals for top talkers
+        now = time.monotonic()
+        self.event_rates.tick(event, now)
+        session = self.sessions.get(sid)
+        if session is not None:
+            session.count_event(now)
+
+    # --- Outbound delivery ---
+    def send(self, sid, event, data, priority=PRIORITY_CHAT, coalesce_key=None):
+        """Queue an event for one client. Returns False if it was dropped."""
+        queue = self.outbound.get(sid)
+        if queue is None:
+            return False
+        accepted = queue.put(event, data, priority, coalesce_key)
+        if not accepted:
+            self.metrics.incr('outbound_rejected')
+        return accepted
+
+    def session_alive(self, token):
+        return token is not None and self.deliveries.get(token) is not None
+
+    def send_preview(self, file_id, recipient, preview):
+        if file_id not in self.stored_files:
+            return  # Deleted while the preview was being generated
+        data = dict(preview, file_id=file_id)
+        if recipient == "Global":
+            sids = [user['sid'] for user in self.users]
+        else:
+            sids = [user['sid'] for user in self.users if user['username'] == recipient]
+        # Chat lane, behind the file notice: never blocks the loop like the bulk lane, and a
+        # reader who is far behind sheds or merges previews like any other chat message
+        for sid in sids:
+            self.send(sid, 'file_preview', data, coalesce_key=f"preview:{file_id}")
+        self.metrics.incr('previews_sent', len(sids))
+
+    def read_envelope(self, sender_entry, data, kind):
+        """Decrypt and decode an incoming message, or None if its seq was already seen.
+
+        Clients that still send the older {'message': AES("time|text")} form are
+        converted to an envelope stamped with the server's clock.
+        """
+        if 'envelope' in data:
+            envelope = unpack_envelope(decrypt_aes_raw(sender_entry['aes_key'], data['envelope']))
+            if envelope.kind != kind:
+                raise ValueError(f"expected envelope kind {kind}, got {envelope.kind}")
+        else:
+            plaintext = decrypt_aes(sender_entry['aes_key'], data.get('message', ''))
+            text = plaintext.split("|", 1)[-1]
+            target = data.get('room') if kind == KIND_ROOM else data.get('recipient', '')
+            envelope = Envelope(kind, 0, now_ms(), sender_entry['username'], target or '', text.encode())
+
+        # seq 0 means the client does not number its messages
+        if envelope.seq and self.deliveries.is_duplicate(sender_entry.get('resume_token'), envelope.seq):
+            self.metrics.incr('duplicate_messages')
+            return None
+        return envelope
+
+    def flush_inbox(self, user):
+        """Hand a joining user everything queued while they were offline, in a single emit."""
+        envelopes = self.inbox.drain(user['username'])
+        if not envelopes:
+            return 0
+        try:
+            payload, codec = pack_batch(envelopes, self.batch_codec)
+            data = {'batch': encrypt_aes_raw(user['aes_key'], payload), 'codec': codec, 'count': len(envelopes)}
+            if self.send(user['sid'], 'offline_messages', data):
+                log_event("server", "offline_flush", f"Delivered {len(envelopes)} queued messages to {user['username']}")
+                return len(envelopes)
+        except Exception as e:
+            print(f"Failed to deliver offline messages to {user['username']}: {e}")
+            log_event("server", "offline_flush", f"Failed to deliver offline messages to {user['username']}: {e}")
+        # Not delivered: put them back for the next join
+        for envelope in envelopes:
+            self.inbox.store(user['username'], envelope, unpack_envelope(envelope).sender)
+        return 0
+
+    def deliver(self, user, event, item):
+        """Number a chat message for user, keep it for replay and send it.
+
+        item is either a packed envelope (encrypted with the user's current key on
+        every send, so replays after a reconnect use the new key) or an already
+        opaque dict (end-to-end mode).
+        """
+        dseq = self.deliveries.record(user.get('resume_token'), event, item)
+        self.send_recorded(user, dseq, event, item)
+
+    def send_recorded(self, user, dseq, event, item):
+        if isinstance(item, bytes):
+            data = {'envelope': encrypt_aes_raw(user['aes_key'], item)}
+        else:
+            data = dict(item)
+        data['dseq'] = dseq
+        self.send(user['sid'], event, data)
+
+    def public_keys(self):
+        return {u['username']: u['public_key'] for u in self.users if u.get('public_key')}
+
+    def deliver_batch(self, sid, payload, codec, count, dseqs):
+        user = next((u for u in self.users if u['sid'] == sid), None)
+        if not user:
+            return
+        try:
+            batch = encrypt_aes_raw(user['aes_key'], payload)
+            self.send(sid, 'incoming_global_message', {'batch': batch, 'codec': codec, 'count': count, 'dseqs': dseqs})
+        except Exception as e:
+            print(f"Failed to encrypt batch for {user['username']}: {e}")
+            log_event("server", "global_msg", f"Failed to encrypt batch for {user['username']}: {e}")
+
+    def broadcast_presence(self, event, username):
+        """Tell everyone who joined or left, then send the new roster.
+
+        Only the roster coalesces: a newer one replaces a queued one for a
+        client that is behind, while every join/leave notice is delivered.
+        """
+        roster = {'usernames': [user['username'] for user in self.users]}
+        for sid in list(self.outbound):
+            self.send(sid, event, {'username': username}, priority=PRIORITY_CONTROL)
+            self.send(sid, 'current_users', roster, priority=PRIORITY_CONTROL, coalesce_key='presence')
+
+    def eio_backlog(self, sid):
+        """Packets Engine.IO has queued for this client but not yet written."""
+        try:
+            eio_sid = self.sio.manager.eio_sid_from_sid(sid, '/')
+            return self.sio.eio.sockets[eio_sid].queue.qsize()
+        except Exception:
+            return 0
+
+    def drop_slow_client(self, sid):
+        self.metrics.incr('slow_client_disconnects')
+        print(f"[outbound] Disconnecting slow client {sid}")
+        log_event("server", "slow_client", f"Disconnected {sid}: outbound queue overflowed")
+        self.sio.start_background_task(self.sio.disconnect, sid)
+
+    def queue_report(self):
+        """Per-session outbound queue statistics."""
+        return {sid: queue.stats() for sid, queue in self.outbound.items()}
+
+    # --- Background maintenance ---
+    def start_maintenance(self):
+        self.sio.start_background_task(self.maintenance_loop)
+
+    def maintenance_loop(self):
+        while True:
+            self.sio.sleep(SWEEP_INTERVAL)
+            try:
+                self.sweep_idle_uploads()
+                self.close_orphaned_sessions()
+                self.collect_stored_files()
+                self.deliveries.expire()
+                self.usernames.expire(self.session_alive)
+                self.expire_suspended_uploads()
+                self.inbox.expire()
+                self.report_queues()
+                flush_logs()  # Commit a partial log batch
+            except Exception as e:
+                print(f"[maintenance] Failed: {e}")
+                log_event("server", "maintenance_failed", f"Maintenance pass failed: {e}")
+
+    def report_queues(self):
+        # Only sessions that are currently behind, to keep the log quiet
+        for sid, stats in self.queue_report().items():
+            if stats['depth']:
+                log_event("server", "outbound_queue", f"{sid}: {stats}")
+
+    def sweep_idle_uploads(self, now=None):
+        """Abort uploads that have gone quiet, e.g. a client that vanished without disconnecting."""
+        now = time.monotonic() if now is None else now
+        idle = [transfer_id for transfer_id, info in self.upload_files.items()
+                if now - info['last_activity'] > UPLOAD_IDLE_TIMEOUT]
+        for transfer_id in idle:
+            self.abort_upload(transfer_id, 'idle_timeout')
+        return len(idle)
+
+    def collect_stored_files(self, now=None):
+        """Delete stored files past their retention age that no download is reading."""
+        now = time.time() if now is None else now
+        uploading = {info['path'] for info in self.upload_files.values()}
+        uploading.update(info['path'] for info in self.suspended_uploads.values())
+        removed = 0
+
+        for name in os.listdir(self.upload_folder):
+            path = os.path.join(self.upload_folder, name)
+            file_id = stored_file_id(name)
+            if not file_id or path in uploading or self.file_refs.get(file_id):
+                continue
+            try:
+                if now - os.path.getmtime(path) < FILE_RETENTION:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+
+            removed += 1
+            stored = self.stored_files.pop(file_id, None)
+            if stored:
+                self.quotas.release(stored['owner'], stored['size'])
+            log_event("server", "collect_stored_file", f"Deleted expired file {name}")
+        return removed
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Build a server from a validated ServerConfig; kwargs (e.g. inbox_path) pass straight through."""
+        return cls(batch_window_ms=config.batch_window_ms, batch_codec=config.batch_codec,
+                   transport_mode=config.transport_mode, compression=config.compression,
+                   upload_folder=config.upload_folder, private_key_path=config.private_key_path,
+                   chunk_size=config.chunk_size, preview_workers=config.preview_workers,
+                   ping_interval=config.ping_interval, ping_timeout=config.ping_timeout,
+                   admin_token=config.admin_token or None, disk_workers=config.disk_workers,
+                   queue_policy=config.queue_policy, max_queue=config.max_queue, max_bulk=config.max_bulk,
+                   **kwargs)
+
 # --- Entry Point ---
 if __name__ == '__main__':
-    server = ChatServer()
+    # Flags, CHATSPACE_SERVER_*/CHATSPACE_LOGGING_* variables or chatspace.ini (server/config.py)
+    try:
+        config, log_config = load_config(ServerConfig, LogConfig, argv=sys.argv[1:], prog="server.py")
+    except ConfigError as e:
+        sys.exit(str(e))
+    configure_logger(log_config.log_db_path, log_config.log_batch_size, log_config.log_flush_interval)
+    server = ChatServer.from_config(config)
+    server.restore_snapshot()  # Sessions and uploads handed over by the previous process
+    server.start_maintenance()
+    main = greenlet.getcurrent()
+
+    def stop():
+        server.shutdown()
+        main.throw(SystemExit(0))  # Breaks eventlet's accept loop
+
+    # SIGTERM / Ctrl+C drain and snapshot; the next process restores the snapshot
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: eventlet.spawn_n(stop))
     # server.app.run(port=8080, debug=True)
-    eventlet.wsgi.server(eventlet.listen(('localhost', 8080)), server.app)
\ No newline at end of file
+    eventlet.wsgi.server(eventlet.listen((config.host, config.port)), server.app,
+                         max_size=config.max_connections)
+    flush_logs()
\ No newline at end of file
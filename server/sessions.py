@@ -0,0 +1,184 @@
+import sys
+import time
+from collections import deque
+from collections.abc import MutableMapping
+
+from server.metrics import bumped, decayed
+
+# Per-connection state, one Session per Socket.IO sid.
+#
+# Everything the server keeps for a connection lives on its Session, and the
+# SessionTable is the only place Sessions are kept, so closing a session frees
+# all of it at once. The older per-sid dicts (aes_keys, outbound,
+# upload_buckets) are SessionField views over the table, so code and tests
+# that index them by sid keep working without holding state of their own.
+#
+# Sessions use __slots__: no per-instance __dict__, which matters at tens of
+# thousands of connections. They also support item access (user['sid'],
+# user.get('public_key')) because the roster in ChatServer.users used to be
+# plain dicts.
+
+MEMORY_REPORT_LIMIT = 50      # Largest sessions listed in a memory report
+CAPACITY_SESSIONS = 10000     # Connection count the report projects memory for
+
+
+class Session:
+    __slots__ = ('sid', 'username', 'aes_key', 'public_key', 'resume_token', 'outbound', 'upload_bucket',
+                 'connected_at', 'events', 'event_rate', 'rate_updated', 'throttle')
+
+    def __init__(self, sid, connected_at=None):
+        self.sid = sid
+        self.username = None          # Set by user_joined, cleared by user_left
+        self.aes_key = None           # From the key exchange or a resumed session
+        self.public_key = None        # End-to-end mode public key (PEM)
+        self.resume_token = None      # Delivery session this connection is attached to
+        self.outbound = None          # OutboundQueue
+        self.upload_bucket = None     # TokenBucket limiting upload_chunk bytes
+        self.connected_at = time.time() if connected_at is None else connected_at
+        self.events = 0               # Events received, allowed or not
+        self.event_rate = 0.0         # Decaying events/sec as of rate_updated
+        self.rate_updated = 0.0
+        self.throttle = None          # Factor applied to this session's rate limits by an admin
+
+    def count_event(self, now):
+        self.events += 1
+        self.event_rate = bumped(self.event_rate, self.rate_updated, now)
+        self.rate_updated = now
+
+    def rate(self, now):
+        return decayed(self.event_rate, self.rate_updated, now)
+
+    # Item access, for code written against the old user dicts
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"Session({self.sid!r}, username={self.username!r})"
+
+
+class SessionTable:
+    def __init__(self, clock=time.time):
+        self.sessions = {}  # sid -> Session
+        self.clock = clock
+        self.opened = 0
+        self.closed = 0
+
+    def open(self, sid):
+        """The session for sid, created if it does not exist yet."""
+        session = self.sessions.get(sid)
+        if session is None:
+            session = self.sessions[sid] = Session(sid, self.clock())
+            self.opened += 1
+        return session
+
+    def get(self, sid):
+        return self.sessions.get(sid)
+
+    def close(self, sid):
+        """Forget sid; returns its Session (or None) for the caller to release what it holds."""
+        session = self.sessions.pop(sid, None)
+        if session is not None:
+            self.closed += 1
+        return session
+
+    def orphans(self, connected):
+        """Sids with a session that connected(sid) says are gone, i.e. missed by every cleanup path."""
+        return [sid for sid in self.sessions if not connected(sid)]
+
+    def __contains__(self, sid):
+        return sid in self.sessions
+
+    def __iter__(self):
+        return iter(list(self.sessions))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def values(self):
+        return list(self.sessions.values())
+
+
+class SessionField(MutableMapping):
+    """A sid -> value dict backed by one attribute of each Session."""
+
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    def __getitem__(self, sid):
+        session = self.table.get(sid)
+        value = getattr(session, self.name) if session is not None else None
+        if value is None:
+            raise KeyError(sid)
+        return value
+
+    def __setitem__(self, sid, value):
+        setattr(self.table.open(sid), self.name, value)
+
+    def __delitem__(self, sid):
+        session = self.table.get(sid)
+        if session is None or getattr(session, self.name) is None:
+            raise KeyError(sid)
+        setattr(session, self.name, None)
+
+    def __iter__(self):
+        return iter([sid for sid, session in list(self.table.sessions.items())
+                     if getattr(session, self.name) is not None])
+
+    def __len__(self):
+        return sum(1 for session in self.table.sessions.values() if getattr(session, self.name) is not None)
+
+
+# --- Memory accounting ---
+def deep_size(obj, seen=None):
+    """Bytes held by obj and what it owns.
+
+    Follows containers and the attributes of this package's own classes;
+    code, hubs and other library objects are counted shallowly, and shared
+    objects only once per seen set.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or callable(obj):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in list(obj.items()))
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(deep_size(item, seen) for item in list(obj))
+    if not type(obj).__module__.startswith('server.'):
+        return size
+    for name in getattr(type(obj), '__slots__', ()):
+        size += deep_size(getattr(obj, name, None), seen)
+    if hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+def memory_report(parts, limit=MEMORY_REPORT_LIMIT, capacity=CAPACITY_SESSIONS):
+    """Summarise {sid: {part: bytes}} into totals, a per-session mean, a projection and the largest sessions."""
+    totals = {}
+    per_session = []
+    for sid, sizes in parts.items():
+        for part, size in sizes.items():
+            totals[part] = totals.get(part, 0) + size
+        per_session.append((sum(sizes.values()), sid, sizes))
+    per_session.sort(key=lambda item: -item[0])
+    total = sum(totals.values())
+    mean = total / len(parts) if parts else 0
+    return {'sessions': len(parts), 'total_bytes': total, 'parts': totals,
+            'mean_bytes': round(mean), 'projected_sessions': capacity, 'projected_bytes': round(mean * capacity),
+            'largest': [{'sid': sid, 'bytes': size, 'parts': sizes} for size, sid, sizes in per_session[:limit]]}
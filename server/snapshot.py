@@ -0,0 +1,64 @@
+import base64
+import json
+import os
+import time
+
+from server.delivery import REPLAY_TTL
+
+# Session state handed from a stopping server process to its replacement:
+# delivery sessions (with their AES keys, so clients can resume without a new
+# RSA handshake), checkpointed uploads and the stored file index. The file
+# holds key material, so it is written owner-only and deleted once read.
+
+SNAPSHOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "session_snapshot.json"))
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MAX_AGE = REPLAY_TTL   # Older snapshots are useless: every session has expired
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {"__bytes__"}:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def write_snapshot(path, state):
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "created": time.time(), "state": _encode(state)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path, max_age=SNAPSHOT_MAX_AGE, now=None):
+    """Load and delete a snapshot. Returns the state, or None if missing, stale or unreadable."""
+    if not os.path.exists(path):
+        return None
+    now = time.time() if now is None else now
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = None
+    finally:
+        # One-shot: a crash loop must not keep replaying the same state
+        os.remove(path)
+
+    if not data or data.get("version") != SNAPSHOT_VERSION or now - data.get("created", 0) > max_age:
+        return None
+    return _decode(data["state"])
@@ -0,0 +1,39 @@
+import os
+import re
+
+# Helpers for naming transfers and the files they produce. Every upload gets a
+# client-generated transfer ID, and the stored file is prefixed with it so two
+# uploads of "photo.png" never write to the same path.
+
+TRANSFER_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+# Lifecycle
+SWEEP_INTERVAL = 30                     # Seconds between maintenance passes
+UPLOAD_IDLE_TIMEOUT = 120               # Abort uploads that sent nothing for this long
+FILE_RETENTION = 24 * 60 * 60           # Delete stored files older than this once unreferenced
+
+# Download flow control: clients that send a window acknowledge what they have on disk
+MAX_DOWNLOAD_WINDOW = 256               # Chunks a client may ask to have unacknowledged
+DOWNLOAD_ACK_TIMEOUT = 30               # Abort a windowed download whose client stops acknowledging
+ACK_POLL = 0.01                         # Seconds between checks while the window is full
+
+
+def valid_transfer_id(transfer_id):
+    return isinstance(transfer_id, str) and bool(TRANSFER_ID_RE.fullmatch(transfer_id))
+
+
+def safe_filename(filename):
+    # Strip any directory parts a client may have sent
+    return os.path.basename((filename or "").replace("\\", "/")).strip()
+
+
+def stored_path(folder, file_id, filename):
+    return os.path.join(folder, f"{file_id}_{safe_filename(filename)}")
+
+
+def stored_file_id(name):
+    """Return the file ID prefix of a stored file name, or None for foreign files."""
+    file_id, sep, _ = name.partition("_")
+    if sep and valid_transfer_id(file_id):
+        return file_id
+    return None
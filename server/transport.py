@@ -0,0 +1,61 @@
+# Engine.IO transport settings shared by server and client.
+#
+# By default a Socket.IO connection starts on HTTP long-polling and upgrades
+# to a WebSocket, which costs several extra round trips per connect and keeps
+# clients that never manage to upgrade on the much more expensive polling path.
+# Both ends here speak WebSocket, so the default mode skips polling entirely.
+#
+# permessage-deflate is off by default: chat payloads are AES ciphertext and
+# file chunks are already compressed, so deflating frames only costs CPU.
+# The Python client (websocket-client) never offers it anyway; the switch
+# matters for browser clients.
+
+TRANSPORT_MODES = {
+    "websocket": ["websocket"],             # Direct WebSocket, no handshake over HTTP
+    "upgrade": ["polling", "websocket"],    # Socket.IO default, for proxies that break WebSockets
+    "polling": ["polling"],                 # Long-polling only
+}
+TRANSPORT_MODE = "websocket"
+
+PING_INTERVAL = 10          # Seconds between server pings (Engine.IO default 25)
+PING_TIMEOUT = 10           # Seconds to wait for the pong (default 20): a dead peer is noticed in ~20s, not ~45s
+CHUNK_SIZE = 49152          # Raw bytes per upload chunk, as sent by the client
+POLLING_BUFFER_SIZE = 1000000   # A polling POST can carry several queued packets at once
+PERMESSAGE_DEFLATE = False
+
+
+def max_buffer_size(chunk_size=CHUNK_SIZE):
+    """Largest inbound packet worth accepting: one base64 upload chunk plus event framing, rounded up."""
+    needed = (chunk_size + 2) // 3 * 4 + 16 * 1024
+    return -(-needed // 65536) * 65536
+
+
+def transports(mode=TRANSPORT_MODE):
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f"unknown transport mode {mode!r}, expected one of {sorted(TRANSPORT_MODES)}")
+    return list(TRANSPORT_MODES[mode])
+
+
+def server_options(mode=TRANSPORT_MODE, ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT,
+                   max_http_buffer_size=None, compression=PERMESSAGE_DEFLATE, chunk_size=CHUNK_SIZE):
+    """Keyword arguments for socketio.Server."""
+    return {'transports': transports(mode),
+            'ping_interval': ping_interval,
+            'ping_timeout': ping_timeout,
+            'max_http_buffer_size': max_http_buffer_size or (max_buffer_size(chunk_size) if mode == "websocket"
+                                                             else POLLING_BUFFER_SIZE),
+            'http_compression': compression}  # Polling responses; frames are handled by without_deflate
+
+
+def without_deflate(app):
+    """WSGI middleware that hides permessage-deflate offers, so WebSocket frames go uncompressed."""
+    def wrapped(environ, start_response):
+        offer = environ.get('HTTP_SEC_WEBSOCKET_EXTENSIONS')
+        if offer and 'permessage-deflate' in offer:
+            others = [ext for ext in offer.split(',') if not ext.strip().startswith('permessage-deflate')]
+            if others:
+                environ['HTTP_SEC_WEBSOCKET_EXTENSIONS'] = ','.join(others)
+            else:
+                del environ['HTTP_SEC_WEBSOCKET_EXTENSIONS']
+        return app(environ, start_response)
+    return wrapped
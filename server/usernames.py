@@ -0,0 +1,85 @@
+import re
+
+# Server-side username index. A name is claimed before joining, so the check
+# is a dict lookup instead of shipping the roster to every client, and two
+# clients racing for the same name cannot both get it: the handler runs to
+# completion before the next event is processed.
+#
+# A user who drops off keeps their name while their delivery session can
+# still be resumed; the resume token is what lets them take it back.
+
+USERNAME_RE = re.compile(r"[A-Za-z0-9]{1,15}")
+
+
+def valid_username(name):
+    return isinstance(name, str) and bool(USERNAME_RE.fullmatch(name))
+
+
+class UsernameRegistry:
+    def __init__(self):
+        self.owners = {}   # username -> {'sid': sid or None while disconnected, 'token': resume token}
+        self.names = {}    # sid -> username it holds
+
+    def claim(self, name, sid, token=None, token_alive=lambda token: False):
+        """Reserve name for sid. Returns None on success, or why the name cannot be had."""
+        if not valid_username(name):
+            return 'invalid_username'
+        owner = self.owners.get(name)
+        if owner is not None and owner['sid'] != sid:
+            resuming = token is not None and token == owner['token']
+            abandoned = owner['sid'] is None and not token_alive(owner['token'])
+            if not (resuming or abandoned):
+                return 'username_taken'
+            if owner['sid'] is not None:
+                self.names.pop(owner['sid'], None)  # Old connection has not timed out yet
+
+        if self.names.get(sid) != name:
+            self.release(sid)  # One name per connection
+        self.owners[name] = {'sid': sid, 'token': token or (owner or {}).get('token')}
+        self.names[sid] = name
+        return None
+
+    def bind(self, sid, token):
+        """Attach the delivery session token once sid has joined."""
+        owner = self.owners.get(self.names.get(sid))
+        if owner is not None:
+            owner['token'] = token
+
+    def holder(self, name):
+        owner = self.owners.get(name)
+        return owner['sid'] if owner else None
+
+    def release(self, sid):
+        """Give up sid's name for good (left on purpose, or never joined)."""
+        name = self.names.pop(sid, None)
+        owner = self.owners.get(name)
+        if owner is not None and owner['sid'] == sid:
+            del self.owners[name]
+        return name
+
+    def detach(self, sid):
+        """sid disconnected: keep its name for the resume token, if it has one."""
+        name = self.names.pop(sid, None)
+        owner = self.owners.get(name)
+        if owner is None or owner['sid'] != sid:
+            return
+        if owner['token']:
+            owner['sid'] = None
+        else:
+            del self.owners[name]
+
+    def restore(self, name, token):
+        """Reserve name for a session restored from a restart snapshot."""
+        if valid_username(name) and name not in self.owners:
+            self.owners[name] = {'sid': None, 'token': token}
+
+    def expire(self, token_alive):
+        """Free names whose owner is gone and can no longer resume."""
+        expired = [name for name, owner in self.owners.items()
+                   if owner['sid'] is None and not token_alive(owner['token'])]
+        for name in expired:
+            del self.owners[name]
+        return len(expired)
+
+    def __contains__(self, name):
+        return name in self.owners
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from logs import db_logger
+
+@pytest.fixture(autouse=True, scope="session")
+def scratch_log_db(tmp_path_factory):
+    """Log to a throwaway database, so test runs never write to logs/chat_logs.db"""
+    saved = db_logger.DB_PATH
+    db_logger.configure(db_path=str(tmp_path_factory.mktemp("logs") / "chat_logs.db"))
+    yield
+    db_logger.configure(db_path=saved)
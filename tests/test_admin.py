@@ -0,0 +1,173 @@
+import pytest
+import sys
+import os
+import base64
+import eventlet
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.metrics import RateMeter
+from server.ratelimit import EventLimiter
+
+TOKEN = "s3cret-admin-token"
+
+class TestCounters:
+    def test_rate_meter(self):
+        """Decaying rates settle on the real rate and fade once events stop"""
+        meter = RateMeter(window=10)
+        for i in range(200):
+            meter.tick('global_message', now=i * 0.5)  # 2 events/sec
+        assert meter.rates(now=99.5)['global_message'] == pytest.approx(2, rel=0.05)
+        assert meter.rates(now=109.5)['global_message'] == pytest.approx(2 / 2.718, rel=0.05)
+        print("✅ Rate meter test passed")
+
+    def test_limiter_throttle(self):
+        now = [0.0]
+        limiter = EventLimiter({'global_message': (5, 20)}, clock=lambda: now[0])
+        assert limiter.allow('sid1', 'global_message')
+        limiter.throttle('sid1', 0.1)  # Applies to the bucket sid1 already has
+        assert limiter.limit('sid1', 'global_message') == (0.5, 2)
+        assert limiter.allow('sid1', 'global_message')
+        assert limiter.allow('sid1', 'global_message')
+        assert not limiter.allow('sid1', 'global_message')
+        assert limiter.allow('sid2', 'global_message')  # Other sessions keep their limits
+        limiter.throttle('sid1', 1)
+        assert limiter.limit('sid1', 'global_message') == (5, 20) and 'sid1' not in limiter.factors
+        assert limiter.limit('sid1', 'publish_key') == (20, 50)
+        limiter.throttle('sid1', 0.001)
+        assert limiter.limit('sid1', 'global_message')[1] == 1  # Never below one event
+        print("✅ Limiter throttle test passed")
+
+class TestAdminAPI:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+            server = ChatServer(inbox_path=":memory:", admin_token=TOKEN)
+            server.quotas = UploadQuotas(str(tmp_path), min_free_disk=0)
+            server.send = Mock(return_value=True)
+            server.sio.handlers['/admin']['connect']('adm1', {}, {'token': TOKEN})
+            yield server
+            server.disk.shutdown()
+
+    def join(self, server, username):
+        sid = server.sio.manager.connect(f'eio-{username}', '/')
+        server.sio.handlers['/']['connect'](sid, {})
+        server.aes_keys[sid] = b'k' * 32
+        assert server.sio.handlers['/']['user_joined'](sid, {'username': username})['status'] == 'ok'
+        return sid
+
+    def admin(self, server, name, data=None):
+        return server.sio.handlers['/admin'][name]('adm1', data)
+
+    def test_needs_admin(self, chat_server):
+        for name in ('overview', 'sessions', 'transfers', 'queues', 'event_rates', 'top_talkers',
+                     'kick', 'throttle', 'cancel_transfer'):
+            assert chat_server.sio.handlers['/admin'][name]('intruder', {}) == {'status': 'error', 'reason': 'unauthorized'}
+        print("✅ Admin API authorization test passed")
+
+    def test_sessions_and_top_talkers(self, chat_server):
+        alice, bob = self.join(chat_server, 'alice'), self.join(chat_server, 'bob')
+        handlers = chat_server.sio.handlers['/']
+        for _ in range(5):
+            handlers['list_rooms'](bob)
+        handlers['list_rooms'](alice)
+
+        rows = {row['username']: row for row in self.admin(chat_server, 'sessions')['sessions']}
+        assert rows['bob']['events'] == 6 and rows['alice']['events'] == 2  # user_joined counts too
+        assert rows['bob']['event_rate'] > rows['alice']['event_rate'] > 0
+
+        reply = self.admin(chat_server, 'top_talkers', {'by': 'events', 'limit': 1})
+        assert [row['sid'] for row in reply['sessions']] == [bob]
+        assert self.admin(chat_server, 'top_talkers', {'by': 'volume'})['reason'] == 'invalid_order'
+
+        rates = self.admin(chat_server, 'event_rates')['rates']
+        assert rates['list_rooms'] > rates['user_joined'] > 0
+        overview = self.admin(chat_server, 'overview')
+        assert overview['status'] == 'ok' and len(overview['sessions']) == 2 and set(overview['queues']) == {alice, bob}
+        print("✅ Sessions and top talkers test passed")
+
+    def test_transfers_and_cancel_upload(self, chat_server):
+        alice = self.join(chat_server, 'alice')
+        handlers = chat_server.sio.handlers['/']
+        transfer_id = 'a' * 32
+        handlers['start_upload'](alice, {'transfer_id': transfer_id, 'filename': 'x.bin', 'filesize': 100})
+        handlers['upload_chunk'](alice, {'transfer_id': transfer_id, 'chunk_data': base64.b64encode(b'a' * 40).decode()})
+
+        upload = self.admin(chat_server, 'transfers')['uploads'][0]
+        assert upload['transfer_id'] == transfer_id and upload['bytes'] == 40 and upload['owner'] == 'alice'
+        top = self.admin(chat_server, 'top_talkers', {'by': 'upload_bytes'})['sessions'][0]
+        assert top['sid'] == alice and top['upload_bytes'] == 40
+
+        assert self.admin(chat_server, 'cancel_transfer', {'transfer_id': transfer_id}) == {'status': 'ok'}
+        assert transfer_id not in chat_server.upload_files
+        aborted = next(call.args[2] for call in chat_server.send.call_args_list if call.args[1] == 'upload_aborted')
+        assert aborted['reason'] == 'cancelled_by_admin'
+        assert self.admin(chat_server, 'cancel_transfer', {'transfer_id': transfer_id})['reason'] == 'unknown_transfer'
+        print("✅ Upload cancel test passed")
+
+    def test_cancel_download(self, chat_server):
+        from server.transfers import stored_path
+        alice = self.join(chat_server, 'alice')
+        file_id, transfer_id = 'b' * 32, 'c' * 32
+        with open(stored_path(chat_server.upload_folder, file_id, 'x.bin'), 'wb') as f:
+            f.write(b'x' * 100)
+        chat_server.sio.handlers['/']['download_request'](alice, {'file_id': file_id, 'filename': 'x.bin',
+                                                                  'transfer_id': transfer_id})
+        download = self.admin(chat_server, 'transfers')['downloads'][0]
+        assert download['transfer_id'] == transfer_id and download['filesize'] == 100
+
+        assert self.admin(chat_server, 'cancel_transfer', {'transfer_id': transfer_id}) == {'status': 'ok'}
+        eventlet.sleep(0.05)  # Let the streaming task notice
+        events = [call.args[1] for call in chat_server.send.call_args_list if call.args[0] == alice]
+        assert 'download_aborted' in events and 'incoming_file_chunk' not in events
+        assert chat_server.downloads == {} and chat_server.file_refs == {}
+        print("✅ Download cancel test passed")
+
+    def test_cancel_shared_download_id(self, chat_server):
+        """Download IDs are per session, so a shared one needs the sid to pick a download"""
+        from server.transfers import stored_path
+        alice, bob = self.join(chat_server, 'alice'), self.join(chat_server, 'bob')
+        file_id, transfer_id = 'b' * 32, 'c' * 32
+        with open(stored_path(chat_server.upload_folder, file_id, 'x.bin'), 'wb') as f:
+            f.write(b'x' * 100)
+        for sid in (alice, bob):
+            chat_server.sio.handlers['/']['download_request'](sid, {'file_id': file_id, 'filename': 'x.bin',
+                                                                    'transfer_id': transfer_id})
+        assert self.admin(chat_server, 'cancel_transfer', {'transfer_id': transfer_id})['reason'] == 'ambiguous_transfer'
+        assert self.admin(chat_server, 'cancel_transfer', {'transfer_id': transfer_id, 'sid': bob}) == {'status': 'ok'}
+        assert chat_server.downloads[(bob, transfer_id)]['cancelled']
+        assert not chat_server.downloads[(alice, transfer_id)]['cancelled']
+        print("✅ Shared download ID cancel test passed")
+
+    def test_kick(self, chat_server):
+        alice = self.join(chat_server, 'alice')
+        token = chat_server.sessions.get(alice).resume_token
+        chat_server.sio.disconnect = Mock()
+        assert self.admin(chat_server, 'kick', {'username': 'alice', 'reason': 'spam'}) == {'status': 'ok', 'sid': alice}
+        assert chat_server.send.call_args_list[-1].args[1:3] == ('kicked', {'reason': 'spam'})
+        assert chat_server.deliveries.get(token) is None  # Cannot resume back in
+        eventlet.sleep(0.05)
+        chat_server.sio.disconnect.assert_called_once_with(alice)
+        assert self.admin(chat_server, 'kick', {'sid': 'nobody'})['reason'] == 'unknown_session'
+        print("✅ Kick test passed")
+
+    def test_throttle(self, chat_server):
+        from server.quotas import UPLOAD_RATE
+        alice = self.join(chat_server, 'alice')
+        assert self.admin(chat_server, 'throttle', {'sid': alice, 'factor': 0.5})['factor'] == 0.5
+        session = chat_server.sessions.get(alice)
+        assert session.throttle == 0.5 and chat_server.limiter.factors[alice] == 0.5
+        assert chat_server.upload_buckets[alice].rate == UPLOAD_RATE * 0.5
+        assert self.admin(chat_server, 'sessions')['sessions'][0]['throttle'] == 0.5
+
+        for factor in (0, 2, 'fast'):
+            assert self.admin(chat_server, 'throttle', {'sid': alice, 'factor': factor})['reason'] == 'invalid_factor'
+        self.admin(chat_server, 'throttle', {'sid': alice, 'factor': 1})
+        assert session.throttle is None and alice not in chat_server.limiter.factors
+        print("✅ Throttle test passed")
@@ -0,0 +1,65 @@
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.batching import MessageBatcher, pack_batch, unpack_batch
+from server.encryption import generate_aes_key, encrypt_aes_raw, decrypt_aes_raw
+from server.envelope import pack_envelope, unpack_envelope, KIND_ROOM
+
+class TestBatching:
+    def test_pack_roundtrip(self):
+        """Batches survive compression in both directions"""
+        entries = [pack_envelope(KIND_ROOM, i, 1700000000000 + i, 'alice', 'Global', f'message {i}') for i in range(50)]
+        payload, codec = pack_batch(entries, 'zlib')
+        assert codec == 'zlib'
+        assert unpack_batch(payload, codec) == entries
+
+        tiny, codec = pack_batch(entries[:1], 'zlib')
+        assert codec == 'none'
+        print("✅ Batch pack test passed")
+
+    def test_one_delivery_per_window(self):
+        """Messages inside one window go out as a single delivery"""
+        delivered = []
+        timers = []
+        batcher = MessageBatcher(lambda sid, payload, codec, count, tags: delivered.append((sid, count)),
+                                 spawn=lambda fn, sid: timers.append((fn, sid)), sleep=lambda s: None,
+                                 window_ms=10)
+        for i in range(5):
+            batcher.add('sid1', pack_envelope(KIND_ROOM, i, 1700000000000, 'a', 'Global', str(i)))
+        assert len(timers) == 1
+
+        fn, sid = timers[0]
+        fn(sid)
+        assert delivered == [('sid1', 5)]
+        print("✅ Batch window test passed")
+
+    def test_server_batches_room_messages(self):
+        """With batching on, room messages reach the recipient as one encrypted batch"""
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(batch_window_ms=10, inbox_path=":memory:")
+            server.send = Mock(return_value=True)
+            server.sio.start_background_task = Mock()
+            server.batcher.spawn = Mock()
+
+            sid = server.sio.manager.connect('eio1', '/')
+            key = generate_aes_key()
+            server.aes_keys[sid] = key
+            server.sio.handlers['/']['user_joined'](sid, {'username': 'alice'})
+            for i in range(3):
+                envelope = pack_envelope(KIND_ROOM, i + 1, 1700000000000, 'alice', 'Global', f'hi {i}')
+                server.sio.handlers['/']['global_message'](sid, {'envelope': encrypt_aes_raw(key, envelope)})
+
+            server.send.reset_mock()
+            server.batcher.flush(sid)
+
+            event, data = server.send.call_args.args[1:3]
+            assert event == 'incoming_global_message' and data['count'] == 3
+            entries = unpack_batch(decrypt_aes_raw(key, data['batch']), data['codec'])
+            assert [unpack_envelope(entry).payload for entry in entries] == [f'hi {i}'.encode() for i in range(3)]
+            print("✅ Server batching test passed")
@@ -0,0 +1,136 @@
+import pytest
+import sys
+import os
+import base64
+import hashlib
+import zlib
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.compression import (sample_saving, upload_codecs, negotiate, compress_chunk,
+                                decompress_bounded, MIN_SAVING, zstandard)
+
+TEXT = b"".join(b"%06d the quick brown fox jumps over the lazy dog\n" % i for i in range(20000))
+
+class TestCompressionNegotiation:
+    def test_sampling(self, tmp_path):
+        """Text-like files are worth compressing, random and already-compressed ones are not"""
+        text = tmp_path / "track.wav"
+        text.write_bytes(TEXT)
+        noise = tmp_path / "noise.wav"
+        noise.write_bytes(os.urandom(len(TEXT)))
+        photo = tmp_path / "photo.jpg"
+        photo.write_bytes(TEXT)  # Skipped by extension without sampling
+
+        assert sample_saving(str(text)) > 0.5
+        assert sample_saving(str(noise)) < MIN_SAVING
+        assert upload_codecs(str(text))[-1] == 'zlib'
+        assert upload_codecs(str(noise)) == []
+        assert upload_codecs(str(photo)) == []
+        print("✅ Compressibility sampling test passed")
+
+    def test_negotiate(self):
+        assert negotiate(['zstd', 'zlib']) == ('zstd' if zstandard else 'zlib')
+        assert negotiate(['lz4']) == 'none'
+        assert negotiate(None) == 'none'
+        print("✅ Codec negotiation test passed")
+
+    def test_chunk_roundtrip_and_fallback(self):
+        chunk = TEXT[:49152]
+        payload, compressed = compress_chunk(chunk, 'zlib')
+        assert compressed and len(payload) < len(chunk)
+        assert decompress_bounded(payload, 'zlib', len(chunk)) == chunk
+
+        noise = os.urandom(4096)
+        assert compress_chunk(noise, 'zlib') == (noise, False)
+        print("✅ Chunk compression test passed")
+
+    def test_bounded_decompression(self):
+        """A small chunk cannot expand past what is left of the upload"""
+        bomb = zlib.compress(b"\0" * 10_000_000)
+        with pytest.raises(ValueError):
+            decompress_bounded(bomb, 'zlib', 49152)
+        with pytest.raises(ValueError):
+            decompress_bounded(zlib.compress(b"x"), 'zlib', 0)  # Zero is a limit, not "unbounded"
+        assert decompress_bounded(zlib.compress(b""), 'zlib', 0) == b""
+        assert decompress_bounded(zlib.compress(b"x" * 10), 'zlib', 10) == b"x" * 10
+        print("✅ Bounded decompression test passed")
+
+class TestCompressedUpload:
+    @pytest.fixture
+    def server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.quotas = UploadQuotas(str(tmp_path), min_free_disk=0)
+            server.send = Mock(return_value=True)
+            server.users = [{'sid': 'a', 'username': 'alice'}]
+            yield server
+
+    def test_compressed_chunks_verify_against_original_hash(self, server):
+        handlers = server.sio.handlers['/']
+        data = TEXT[:200_000]
+        transfer_id = 'd' * 32
+        reply = handlers['start_upload']('a', {'transfer_id': transfer_id, 'filename': 'log.wav',
+                                               'filesize': len(data), 'codecs': ['zlib']})
+        assert reply == {'status': 'ok', 'max_chunk': server.chunk_size, 'codec': 'zlib'}
+
+        wire = 0
+        for pos in range(0, len(data), 49152):
+            payload, compressed = compress_chunk(data[pos:pos + 49152], 'zlib')
+            wire += len(payload)
+            handlers['upload_chunk']('a', {'transfer_id': transfer_id, 'compressed': compressed,
+                                           'chunk_data': base64.b64encode(payload).decode()})
+        path = server.upload_files[transfer_id]['path']
+        handlers['finish_upload']('a', {'transfer_id': transfer_id, 'hash_file': hashlib.sha256(data).hexdigest()})
+
+        assert transfer_id in server.stored_files
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        assert wire < len(data) / 4
+        assert server.metrics.get('upload_bytes_saved') == len(data) - wire
+        print("✅ Compressed upload test passed")
+
+    def test_expanding_chunk_aborts(self, server):
+        handlers = server.sio.handlers['/']
+        transfer_id = 'e' * 32
+        handlers['start_upload']('a', {'transfer_id': transfer_id, 'filename': 'x.wav',
+                                       'filesize': 1000, 'codecs': ['zlib']})
+        handlers['upload_chunk']('a', {'transfer_id': transfer_id, 'compressed': True,
+                                       'chunk_data': base64.b64encode(zlib.compress(b"\0" * 100_000)).decode()})
+        assert transfer_id not in server.upload_files
+        aborted = next(call.args[2] for call in server.send.call_args_list if call.args[1] == 'upload_aborted')
+        assert aborted['reason'] == 'size_exceeded'
+        print("✅ Expanding chunk test passed")
+
+    def test_zero_byte_upload_rejects_compressed_chunk(self, server):
+        """A declared 0-byte upload leaves no room for a compressed chunk"""
+        handlers = server.sio.handlers['/']
+        transfer_id = 'f' * 32
+        handlers['start_upload']('a', {'transfer_id': transfer_id, 'filename': 'empty.wav',
+                                       'filesize': 0, 'codecs': ['zlib']})
+        handlers['upload_chunk']('a', {'transfer_id': transfer_id, 'compressed': True,
+                                       'chunk_data': base64.b64encode(zlib.compress(b"\0" * 100_000)).decode()})
+        assert transfer_id not in server.upload_files
+        aborted = next(call.args[2] for call in server.send.call_args_list if call.args[1] == 'upload_aborted')
+        assert aborted['reason'] == 'size_exceeded'
+        print("✅ Zero-byte upload test passed")
+
+    def test_chunk_after_declared_size_aborts(self, server):
+        handlers = server.sio.handlers['/']
+        transfer_id = 'c' * 32
+        handlers['start_upload']('a', {'transfer_id': transfer_id, 'filename': 'x.wav',
+                                       'filesize': 1000, 'codecs': ['zlib']})
+        for _ in range(2):
+            payload, _ = compress_chunk(TEXT[:1000], 'zlib')
+            handlers['upload_chunk']('a', {'transfer_id': transfer_id, 'compressed': True,
+                                           'chunk_data': base64.b64encode(payload).decode()})
+        assert transfer_id not in server.upload_files
+        aborted = next(call.args[2] for call in server.send.call_args_list if call.args[1] == 'upload_aborted')
+        assert aborted['reason'] == 'size_exceeded'
+        print("✅ Chunk past declared size test passed")
@@ -0,0 +1,129 @@
+import pytest
+import sys
+import os
+import sqlite3
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+
+from server.config import ServerConfig, LogConfig, load_config, ConfigError
+from server.transport import CHUNK_SIZE, max_buffer_size
+from config import ClientConfig
+import logs.db_logger as db_logger
+
+KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'server', 'private_key.pem'))
+
+class TestConfigLoading:
+    @pytest.fixture
+    def ini(self, tmp_path):
+        path = tmp_path / "chatspace.ini"
+        path.write_text(f"[server]\nport = 9000\nprivate_key_path = {KEY_PATH}\ncompression = yes\n"
+                        f"upload_folder = {tmp_path / 'uploads'}\n")
+        return str(path)
+
+    def test_defaults_match_constants(self):
+        config = ServerConfig()
+        assert (config.host, config.port, config.chunk_size) == ("localhost", 8080, CHUNK_SIZE)
+        assert config.transport_mode == "websocket" and config.compression is False
+        print("✅ Config defaults test passed")
+
+    def test_precedence(self, ini):
+        """File < environment < command line"""
+        config = load_config(ServerConfig, argv=[], env={}, path=ini)
+        assert config.port == 9000 and config.compression is True
+        config = load_config(ServerConfig, argv=[], env={'CHATSPACE_SERVER_PORT': '9001'}, path=ini)
+        assert config.port == 9001
+        config = load_config(ServerConfig, argv=['--port', '9002', '--no-compression'],
+                             env={'CHATSPACE_SERVER_PORT': '9001'}, path=ini)
+        assert config.port == 9002 and config.compression is False
+        print("✅ Config precedence test passed")
+
+    def test_file_from_environment(self, ini):
+        config = load_config(ServerConfig, argv=[], env={'CHATSPACE_CONFIG': ini})
+        assert config.port == 9000
+        print("✅ Config file from environment test passed")
+
+    def test_several_sections(self, ini):
+        server, logging = load_config(ServerConfig, LogConfig, argv=['--log-batch-size', '50'], env={}, path=ini)
+        assert server.port == 9000 and logging.log_batch_size == 50
+        print("✅ Multiple sections test passed")
+
+    def test_all_errors_reported_together(self, tmp_path):
+        with pytest.raises(ConfigError) as error:
+            load_config(ServerConfig, argv=['--port', '70000', '--transport-mode', 'pigeon',
+                                            '--chunk-size', '10', '--private-key-path', str(tmp_path / 'none.pem'),
+                                            '--queue-policy', 'block', '--max-queue', '0'],
+                        env={}, path=None)
+        message = str(error.value)
+        for name in ("port", "transport_mode", "chunk_size", "private_key_path", "queue_policy", "max_queue"):
+            assert f"server.{name}" in message
+        print("✅ Config validation test passed")
+
+    def test_bad_types_and_unknown_keys(self, tmp_path):
+        with pytest.raises(ConfigError, match="expected int"):
+            load_config(ServerConfig, argv=[], env={'CHATSPACE_SERVER_PORT': 'eighty'}, path=None)
+        with pytest.raises(ConfigError, match="expected bool"):
+            load_config(ServerConfig, argv=[], env={'CHATSPACE_SERVER_COMPRESSION': 'maybe'}, path=None)
+        path = tmp_path / "typo.ini"
+        path.write_text("[server]\nprot = 9000\n")
+        with pytest.raises(ConfigError, match="unknown setting 'prot'"):
+            load_config(ServerConfig, argv=[], env={}, path=str(path))
+        with pytest.raises(ConfigError, match="could not be read"):
+            load_config(ServerConfig, argv=[], env={}, path=str(tmp_path / "missing.ini"))
+        print("✅ Config type errors test passed")
+
+    def test_zstd_needs_zstandard(self):
+        with patch('server.config.zstandard', None):
+            with pytest.raises(ConfigError, match="needs the zstandard package"):
+                load_config(ServerConfig, argv=['--batch-codec', 'zstd'], env={}, path=None)
+        print("✅ Missing zstandard test passed")
+
+    def test_client_section(self, tmp_path):
+        key = tmp_path / "public_key.pem"
+        key.write_text("key")
+        config = load_config(ClientConfig, argv=['--e2e', '--transport=polling', '--public-key-path', str(key)],
+                             env={'CHATSPACE_CLIENT_BANDWIDTH': '0'}, path=None)
+        assert config.e2e is True and config.transport_mode == "polling" and config.bandwidth == 0
+        with pytest.raises(ConfigError, match="server_url"):
+            load_config(ClientConfig, argv=['--server-url', 'localhost:8080', '--public-key-path', str(key)],
+                        env={}, path=None)
+        print("✅ Client config test passed")
+
+class TestConfigConsumers:
+    def test_server_from_config(self, tmp_path):
+        config = ServerConfig(upload_folder=str(tmp_path / "uploads"), chunk_size=16384, preview_workers=1,
+                              ping_interval=5, queue_policy='disconnect', max_queue=32, max_bulk=4)
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer.from_config(config, inbox_path=":memory:")
+        assert os.path.isdir(config.upload_folder)
+        assert server.upload_folder == config.upload_folder and server.chunk_size == 16384
+        assert server.previews.workers == 1
+        assert server.sio.eio.max_http_buffer_size == max_buffer_size(16384)
+        assert server.sio.eio.ping_interval == 5
+        server.sio.handlers['/']['connect']('sid0', {})
+        queue = server.outbound['sid0']
+        assert (queue.policy, queue.max_queue, queue.max_bulk) == ('disconnect', 32, 4)
+        print("✅ Server from config test passed")
+
+    def test_log_batching(self, tmp_path):
+        path = str(tmp_path / "logs.db")
+        old = (db_logger.DB_PATH, db_logger.LOG_BATCH_SIZE, db_logger.LOG_FLUSH_INTERVAL)
+        try:
+            db_logger.configure(path, batch_size=3, flush_interval=3600)
+            count = lambda: sqlite3.connect(path).execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+            db_logger.log_event("server", "test", "one")
+            db_logger.log_event("server", "test", "two")
+            assert count() == 0  # Still in the open batch
+            db_logger.log_event("server", "test", "three")
+            assert count() == 3
+            db_logger.log_event("server", "test", "four")
+            db_logger.flush_logs()
+            assert count() == 4
+        finally:
+            db_logger.configure(*old)
+        assert db_logger.DB_PATH == old[0]
+        print("✅ Log batching test passed")
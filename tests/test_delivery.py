@@ -0,0 +1,117 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.delivery import DeliveryTracker
+from server.encryption import generate_aes_key, encrypt_aes_raw, decrypt_aes_raw
+from server.envelope import pack_envelope, unpack_envelope, KIND_PRIVATE
+from client.reliable import OutgoingMessages
+
+class TestDeliveryTracker:
+    def test_replay_since(self):
+        """Only messages after the client's last dseq are replayed"""
+        tracker = DeliveryTracker(size=3)
+        session, resumed = tracker.open()
+        assert not resumed
+        for i in range(5):
+            tracker.record(session.token, 'incoming_private_message', str(i).encode())
+        assert [entry[0] for entry in tracker.since(session.token, 3)] == [4, 5]
+        assert [entry[0] for entry in tracker.since(session.token, 0)] == [3, 4, 5]  # Buffer is bounded
+        print("✅ Replay buffer test passed")
+
+    def test_resume_and_expire(self):
+        """A detached session can be resumed until its TTL runs out"""
+        tracker = DeliveryTracker(ttl=10)
+        session, _ = tracker.open()
+        tracker.detach(session.token, now=100)
+        assert tracker.open(session.token) == (session, True)
+
+        tracker.detach(session.token, now=100)
+        assert tracker.expire(now=111) == 1
+        assert tracker.open(session.token)[1] is False
+        print("✅ Session resume test passed")
+
+class TestOutgoingMessages:
+    def test_retransmit_and_give_up(self):
+        outgoing = OutgoingMessages(timeout=5, max_attempts=2)
+        outgoing.add(1, 'global_message', b'a', now=0)
+        outgoing.add(2, 'global_message', b'b', now=0)
+        assert outgoing.ack(2)['data'] == b'b'
+
+        resend, expired = outgoing.due(now=6)
+        assert [seq for seq, _ in resend] == [1] and not expired
+        resend, expired = outgoing.due(now=12)
+        assert not resend and [seq for seq, _ in expired] == [1]
+        assert len(outgoing) == 0
+        print("✅ Retransmit test passed")
+
+class TestAtLeastOnce:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.send = Mock(return_value=True)
+            for i, name in enumerate(['alice', 'bob']):
+                self.join(server, f'eio{i}', name)
+            yield server
+
+    def join(self, server, eio_sid, username, resume=None):
+        sid = server.sio.manager.connect(eio_sid, '/')
+        server.aes_keys[sid] = generate_aes_key()
+        data = {'username': username}
+        if resume:
+            data['resume'] = resume
+        return sid, server.sio.handlers['/']['user_joined'](sid, data)
+
+    def user(self, server, username):
+        return next(u for u in server.users if u['username'] == username)
+
+    def whisper(self, server, seq, text, recipient='bob'):
+        alice = self.user(server, 'alice')
+        envelope = pack_envelope(KIND_PRIVATE, seq, 0, 'alice', recipient, text)
+        return server.sio.handlers['/']['private_message'](alice['sid'], {'envelope': encrypt_aes_raw(alice['aes_key'], envelope)})
+
+    def test_acks(self, chat_server):
+        """Senders learn whether a private message was delivered"""
+        assert self.whisper(chat_server, 1, 'hi') == {'status': 'ok'}
+        assert self.whisper(chat_server, 1, 'hi') == {'status': 'duplicate'}
+        assert self.whisper(chat_server, 2, 'hi', recipient='') == {'status': 'error', 'reason': 'recipient_not_found'}
+        assert self.whisper(chat_server, 3, 'hi', recipient='nobody') == {'status': 'error', 'reason': 'recipient_not_found'}
+        chat_server.inbox.remember('carol')  # Joined before, offline now
+        assert self.whisper(chat_server, 4, 'hi', recipient='carol') == {'status': 'queued'}
+        print("✅ Delivery ack test passed")
+
+    def test_reconnect_replays_missed(self, chat_server):
+        """Messages sent while bob was away are replayed, encrypted with his new key"""
+        self.whisper(chat_server, 1, 'seen')
+        bob = self.user(chat_server, 'bob')
+        token = bob['resume_token']
+        chat_server.sio.handlers['/']['disconnect'](bob['sid'])
+        assert self.whisper(chat_server, 2, 'missed') == {'status': 'queued'}  # Goes to the offline inbox
+
+        # Delivered to the old connection but never acknowledged by the client
+        chat_server.send.reset_mock()
+        sid, reply = self.join(chat_server, 'eio9', 'bob', resume={'token': token, 'dseq': 0})
+        assert reply['resumed'] and reply['resume_token'] == token and reply['replayed'] == 1
+        assert reply['offline'] == 1
+
+        new_key = self.user(chat_server, 'bob')['aes_key']
+        data = next(call.args[2] for call in chat_server.send.call_args_list if call.args[1] == 'incoming_private_message')
+        assert data['dseq'] == 1
+        assert unpack_envelope(decrypt_aes_raw(new_key, data['envelope'])).payload == b'seen'
+        print("✅ Replay on reconnect test passed")
+
+    def test_retransmit_after_reconnect_is_deduped(self, chat_server):
+        """A sender resending after its own reconnect does not deliver twice"""
+        self.whisper(chat_server, 1, 'once')
+        alice = self.user(chat_server, 'alice')
+        chat_server.sio.handlers['/']['disconnect'](alice['sid'])
+        self.join(chat_server, 'eio9', 'alice', resume={'token': alice['resume_token'], 'dseq': 0})
+        assert self.whisper(chat_server, 1, 'once') == {'status': 'duplicate'}
+        print("✅ Cross-connection dedupe test passed")
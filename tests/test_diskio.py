@@ -0,0 +1,222 @@
+import pytest
+import sys
+import os
+import base64
+import hashlib
+import threading
+import time
+import eventlet
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.diskio import DiskIO, reopen_upload
+
+class SlowFile:
+    """A file whose writes take a while and can be held back, like a busy disk."""
+    def __init__(self, delay=0.001):
+        self.delay = delay
+        self.data = bytearray()
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fail = False
+
+    def write(self, chunk):
+        self.gate.wait()
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError("disk full")
+        self.data += chunk
+
+class TestDiskIO:
+    @pytest.fixture
+    def disk(self):
+        disk = DiskIO(eventlet.sleep, workers=4, max_pending=1024)
+        yield disk
+        disk.shutdown()
+
+    def test_chunks_written_in_order(self, disk):
+        """Several writers share the pool, but each file gets its chunks in queue order"""
+        files = [SlowFile(delay=0.0002) for _ in range(3)]
+        hashers = [hashlib.sha256() for _ in files]
+        writers = [disk.writer(f, h) for f, h in zip(files, hashers)]
+        expected = [bytearray() for _ in files]
+        for i in range(50):
+            for n, writer in enumerate(writers):
+                chunk = bytes([i]) * 10
+                expected[n] += chunk
+                while not disk.write(writer, chunk):  # Buffer full: let the pool catch up
+                    eventlet.sleep(0.001)
+        for n, writer in enumerate(writers):
+            assert disk.flush(writer) is None
+            assert files[n].data == expected[n]
+            assert hashers[n].hexdigest() == hashlib.sha256(expected[n]).hexdigest()
+        print("✅ Ordered write test passed")
+
+    def test_write_does_not_wait_for_disk(self, disk):
+        f = SlowFile()
+        f.gate.clear()  # The disk is stuck
+        writer = disk.writer(f, hashlib.sha256())
+        start = time.monotonic()
+        assert disk.write(writer, b'a' * 100)
+        assert time.monotonic() - start < 0.5
+        assert not writer.idle
+        f.gate.set()
+        disk.flush(writer)
+        assert f.data == b'a' * 100
+        print("✅ Non-blocking write test passed")
+
+    def test_buffer_is_bounded(self, disk):
+        f = SlowFile()
+        f.gate.clear()
+        writer = disk.writer(f, hashlib.sha256())
+        assert disk.write(writer, b'a' * 512)   # Taken by the drain job, still counted as pending
+        assert disk.write(writer, b'b' * 512)
+        assert not disk.write(writer, b'c')     # Over max_pending
+        assert disk.stats()['rejected'] == 1
+        f.gate.set()
+        disk.flush(writer)
+        assert disk.write(writer, b'c')
+        print("✅ Bounded buffer test passed")
+
+    def test_write_error_stops_writer(self, disk):
+        f = SlowFile()
+        f.fail = True
+        writer = disk.writer(f, hashlib.sha256())
+        disk.write(writer, b'a')
+        assert isinstance(disk.flush(writer), OSError)
+        assert not disk.write(writer, b'b')
+        print("✅ Write error test passed")
+
+    def test_discard_drops_pending(self, disk):
+        f = SlowFile()
+        f.gate.clear()
+        writer = disk.writer(f, hashlib.sha256())
+        disk.write(writer, b'a')
+        disk.write(writer, b'b')
+        writer.discard()
+        f.gate.set()
+        disk.flush(writer)
+        assert bytes(f.data) in (b'', b'a')  # Only the chunk already being written lands
+        print("✅ Discard test passed")
+
+    def test_discard_keeps_inflight_count(self, disk):
+        """The chunk a drain is writing stays counted until the drain finishes it"""
+        f = SlowFile()
+        f.gate.clear()
+        writer = disk.writer(f, hashlib.sha256())
+        disk.write(writer, b'a' * 10)
+        while writer.pending:  # Wait for the drain to take it
+            eventlet.sleep(0.001)
+        disk.write(writer, b'b' * 20)
+        writer.discard()
+        counted = writer.pending_bytes
+        f.gate.set()
+        disk.flush(writer)
+        assert counted == 10 and writer.pending_bytes == 0 and bytes(f.data) == b'a' * 10
+        print("✅ Discard in-flight count test passed")
+
+    def test_reopen_truncates_and_rehashes(self, disk, tmp_path):
+        path = tmp_path / "partial.bin"
+        path.write_bytes(b'x' * 100)
+        file, hasher = disk.run(reopen_upload, str(path), 40)
+        file.write(b'y')
+        file.close()
+        assert path.read_bytes() == b'x' * 40 + b'y'
+        assert hasher.hexdigest() == hashlib.sha256(b'x' * 40).hexdigest()
+        with pytest.raises(FileNotFoundError):
+            disk.run(reopen_upload, str(tmp_path / "missing"), 0)
+        print("✅ Reopen test passed")
+
+class TestUploadWrites:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+            server = ChatServer(inbox_path=":memory:")
+            server.quotas = UploadQuotas(str(tmp_path), min_free_disk=0)
+            server.users = [{'sid': 'sid1', 'username': 'alice', 'aes_key': b'k'}]
+            server.send = Mock(return_value=True)
+            yield server
+            server.disk.shutdown()
+
+    def upload(self, server, transfer_id, size):
+        handlers = server.sio.handlers['/']
+        reply = handlers['start_upload']('sid1', {'transfer_id': transfer_id, 'filename': 'x.bin', 'filesize': size})
+        assert reply == {'status': 'ok', 'max_chunk': server.chunk_size}
+        return handlers
+
+    def chunk(self, handlers, transfer_id, data):
+        handlers['upload_chunk']('sid1', {'transfer_id': transfer_id, 'chunk_data': base64.b64encode(data).decode()})
+
+    def test_finish_waits_for_queued_writes(self, chat_server):
+        """The hash is only compared once every chunk is on disk"""
+        payload = os.urandom(200000)
+        transfer_id = 'a' * 32
+        handlers = self.upload(chat_server, transfer_id, len(payload))
+        for offset in range(0, len(payload), 49152):
+            self.chunk(handlers, transfer_id, payload[offset:offset + 49152])
+        path = chat_server.upload_files[transfer_id]['path']
+        handlers['finish_upload']('sid1', {'transfer_id': transfer_id, 'hash_file': hashlib.sha256(payload).hexdigest()})
+        assert transfer_id in chat_server.stored_files
+        assert open(path, 'rb').read() == payload
+        assert chat_server.disk.stats()['bytes'] == len(payload)
+        print("✅ Finish after queued writes test passed")
+
+    def test_write_failure_aborts(self, chat_server):
+        transfer_id = 'b' * 32
+        handlers = self.upload(chat_server, transfer_id, 100)
+        info = chat_server.upload_files[transfer_id]
+        info['writer'].error = OSError("disk full")
+        self.chunk(handlers, transfer_id, b'a' * 10)
+        assert transfer_id not in chat_server.upload_files
+        assert info['file'].closed and not os.path.exists(info['path'])
+        aborted = next(call.args[2] for call in chat_server.send.call_args_list if call.args[1] == 'upload_aborted')
+        assert aborted['reason'] == 'server_error'
+        print("✅ Write failure abort test passed")
+
+    def test_full_buffer_aborts(self, chat_server):
+        transfer_id = 'c' * 32
+        handlers = self.upload(chat_server, transfer_id, 100)
+        chat_server.upload_files[transfer_id]['writer'].max_pending = 5
+        self.chunk(handlers, transfer_id, b'a' * 10)
+        aborted = next(call.args[2] for call in chat_server.send.call_args_list if call.args[1] == 'upload_aborted')
+        assert aborted['reason'] == 'disk_busy'
+        assert chat_server.quotas.total == 0
+        print("✅ Disk busy abort test passed")
+
+    def test_finish_claims_upload(self, chat_server):
+        """Once finish_upload starts, aborts, checkpoints and a second finish leave the upload alone"""
+        payload = os.urandom(100)
+        transfer_id = 'd' * 32
+        handlers = self.upload(chat_server, transfer_id, len(payload))
+        self.chunk(handlers, transfer_id, payload)
+        finish = {'transfer_id': transfer_id, 'hash_file': hashlib.sha256(payload).hexdigest()}
+        flush = chat_server.disk.flush
+        flushes = []
+
+        def interleaved_flush(writer):
+            # Everything that can run on the loop while finish_upload waits for the disk
+            flushes.append(writer)
+            if len(flushes) > 1:
+                return flush(writer)
+            handlers['finish_upload']('sid1', finish)
+            assert not chat_server.abort_upload(transfer_id, 'idle_timeout')
+            handlers['cancel_upload']('sid1', {'transfer_id': transfer_id})
+            self.chunk(handlers, transfer_id, b'x')
+            assert chat_server.checkpoint_uploads() == 0
+            return flush(writer)
+
+        with patch.object(chat_server.disk, 'flush', interleaved_flush):
+            path = chat_server.upload_files[transfer_id]['path']
+            handlers['finish_upload']('sid1', finish)
+        assert len(flushes) == 1
+        assert transfer_id in chat_server.stored_files and transfer_id not in chat_server.upload_files
+        assert open(path, 'rb').read() == payload
+        assert chat_server.quotas.total == len(payload) and chat_server.suspended_uploads == {}
+        assert not any(call.args[1] == 'upload_aborted' for call in chat_server.send.call_args_list)
+        print("✅ Finish claim test passed")
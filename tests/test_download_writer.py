@@ -0,0 +1,216 @@
+import pytest
+import sys
+import os
+import hashlib
+import threading
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client.download_writer import DownloadWriter, read_resume_offset, part_path, sidecar_path
+
+CHUNK = 1024
+
+def chunks_of(data):
+    return [(i, data[i:i + CHUNK]) for i in range(0, len(data), CHUNK)]
+
+def run_writer(writer):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('ok', writer.run()))
+    thread.start()
+    return thread, result
+
+class TestDownloadWriter:
+    @pytest.fixture
+    def payload(self):
+        return os.urandom(CHUNK * 10 + 123)
+
+    def test_out_of_order_chunks_verify(self, tmp_path, payload):
+        """Chunks arriving out of order still hash and land correctly"""
+        save_path = str(tmp_path / "file.png")
+        writer = DownloadWriter("file.png", save_path)
+        thread, result = run_writer(writer)
+
+        chunks = chunks_of(payload)
+        chunks[1], chunks[2] = chunks[2], chunks[1]
+        for offset, data in chunks:
+            writer.put_chunk(offset, data, len(payload))
+        writer.finish(hashlib.sha256(payload).hexdigest(), len(payload))
+        thread.join(timeout=5)
+
+        assert result['ok'] is True
+        assert open(save_path, 'rb').read() == payload
+        assert not os.path.exists(part_path(save_path))
+        assert not os.path.exists(sidecar_path(save_path))
+        print("✅ Out-of-order download test passed")
+
+    def test_finish_before_last_chunk(self, tmp_path, payload):
+        """finish_download racing ahead of the last chunk is tolerated"""
+        save_path = str(tmp_path / "file.png")
+        writer = DownloadWriter("file.png", save_path)
+        thread, result = run_writer(writer)
+
+        chunks = chunks_of(payload)
+        for offset, data in chunks[:-1]:
+            writer.put_chunk(offset, data, len(payload))
+        writer.finish(hashlib.sha256(payload).hexdigest(), len(payload))
+        writer.put_chunk(*chunks[-1], len(payload))
+        thread.join(timeout=5)
+
+        assert result['ok'] is True
+        print("✅ Late chunk test passed")
+
+    def test_hash_mismatch_removes_partial(self, tmp_path, payload):
+        """A bad hash leaves neither the target nor the partial file behind"""
+        save_path = str(tmp_path / "file.png")
+        writer = DownloadWriter("file.png", save_path)
+        thread, result = run_writer(writer)
+
+        for offset, data in chunks_of(payload):
+            writer.put_chunk(offset, data, len(payload))
+        writer.finish("0" * 64, len(payload))
+        thread.join(timeout=5)
+
+        assert result['ok'] is False
+        assert not os.path.exists(save_path)
+        assert not os.path.exists(part_path(save_path))
+        print("✅ Hash mismatch test passed")
+
+    def test_resume_from_sidecar(self, tmp_path, payload):
+        """An aborted download resumes from the sidecar offset"""
+        save_path = str(tmp_path / "file.png")
+        chunks = chunks_of(payload)
+
+        writer = DownloadWriter("file.png", save_path, file_id="f" * 32)
+        thread, _ = run_writer(writer)
+        for offset, data in chunks[:4]:
+            writer.put_chunk(offset, data, len(payload))
+        writer.abort()
+        thread.join(timeout=5)
+
+        offset = read_resume_offset(save_path, "f" * 32)
+        assert offset == 4 * CHUNK
+
+        writer = DownloadWriter("file.png", save_path, offset, file_id="f" * 32)
+        thread, result = run_writer(writer)
+        for chunk_offset, data in chunks[4:]:
+            writer.put_chunk(chunk_offset, data, len(payload))
+        writer.finish(hashlib.sha256(payload).hexdigest(), len(payload))
+        thread.join(timeout=5)
+
+        assert result['ok'] is True
+        assert open(save_path, 'rb').read() == payload
+        print("✅ Resume download test passed")
+
+    def test_resume_keyed_on_file_id(self, tmp_path, payload):
+        """A partial download of another file with the same name is not resumed from"""
+        save_path = str(tmp_path / "file.png")
+        writer = DownloadWriter("file.png", save_path, file_id="a" * 32)
+        thread, _ = run_writer(writer)
+        for offset, data in chunks_of(payload)[:4]:
+            writer.put_chunk(offset, data, len(payload))
+        writer.abort()
+        thread.join(timeout=5)
+
+        assert read_resume_offset(save_path, "a" * 32) == 4 * CHUNK
+        assert read_resume_offset(save_path, "b" * 32) == 0
+        assert read_resume_offset(save_path, None) == 0
+        print("✅ Resume keyed on file ID test passed")
+
+    def test_progress_reports(self, tmp_path, payload):
+        """Bytes on disk are reported back, at least once the writer has caught up"""
+        save_path = str(tmp_path / "file.png")
+        reports = []
+        writer = DownloadWriter("file.png", save_path, on_progress=reports.append)
+        thread, result = run_writer(writer)
+
+        chunks = chunks_of(payload)
+        chunks[0], chunks[1] = chunks[1], chunks[0]
+        for offset, data in chunks:
+            writer.put_chunk(offset, data, len(payload))
+        writer.finish(hashlib.sha256(payload).hexdigest(), len(payload))
+        thread.join(timeout=5)
+
+        assert result['ok'] is True
+        assert reports and reports == sorted(set(reports))  # Only forward, never a repeat
+        assert all(report % CHUNK == 0 or report == len(payload) for report in reports)  # Contiguous prefix only
+        print("✅ Progress report test passed")
+
+    def test_idle_timeout_gives_up(self, tmp_path, payload):
+        """A download that stops hearing from the server ends instead of holding its slot"""
+        save_path = str(tmp_path / "file.png")
+        writer = DownloadWriter("file.png", save_path, file_id='f' * 32, idle_timeout=0.1)
+        thread, result = run_writer(writer)
+        writer.put_chunk(0, payload[:CHUNK], len(payload))
+        thread.join(timeout=5)
+
+        assert not thread.is_alive() and result['ok'] is False
+        assert read_resume_offset(save_path, 'f' * 32) == CHUNK  # Kept for a later resume
+        print("✅ Idle timeout test passed")
+
+class TestClientDownload:
+    @pytest.fixture
+    def client(self, tmp_path):
+        from unittest.mock import Mock, MagicMock, patch
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+        from gui import ChatClientGUI
+        from transfer_manager import TransferManager
+
+        client = ChatClientGUI.__new__(ChatClientGUI)  # No window: Tk calls run inline on stand-ins
+        client.Window = Mock()
+        client.Window.after.side_effect = lambda ms, fn, *args: fn(*args)
+        client.chat_box = Mock()
+        client.transfers = TransferManager(bandwidth=None)
+        client.download_files, client.download_bars = {}, {}
+        client.sio = Mock()
+        with patch('gui.Progressbar', side_effect=lambda *args, **kwargs: MagicMock()), \
+             patch('gui.messagebox') as messagebox, \
+             patch('gui.filedialog.asksaveasfilename', return_value=str(tmp_path / "file.png")):
+            messagebox.askyesno.return_value = True
+            client.messagebox = messagebox
+            yield client
+
+    def wait_idle(self, client):
+        for _ in range(500):
+            if not client.transfers.transfers:
+                return
+            threading.Event().wait(0.01)
+        raise AssertionError("download still holds its slot")
+
+    def test_rejected_request_frees_slot(self, client):
+        client.sio.emit.side_effect = lambda event, data, callback=None: \
+            callback({'status': 'rejected', 'reason': 'not_found'}) if event == 'download_request' else None
+        client.ask_download('b' * 32, 'file.png', 100)
+        self.wait_idle(client)
+        assert client.download_files == {} and client.download_bars == {}
+        assert client.messagebox.showerror.called
+        print("✅ Rejected download test passed")
+
+    def test_progress_follows_writer(self, client):
+        payload = os.urandom(CHUNK * 40)
+        requests = []
+        client.sio.emit.side_effect = lambda event, data, callback=None: \
+            requests.append((data, callback)) if event == 'download_request' else None
+        client.ask_download('b' * 32, 'file.png', len(payload))
+        for _ in range(500):
+            if requests:
+                break
+            threading.Event().wait(0.01)
+        data, callback = requests[0]
+        transfer_id = data['transfer_id']
+        bar = client.download_bars[transfer_id]
+        transfer = client.transfers.get(transfer_id)
+        assert transfer.total_bytes == len(payload)
+        callback({'status': 'ok', 'filesize': len(payload)})
+
+        writer = client.download_files[transfer_id]['writer']
+        for offset, chunk in chunks_of(payload):
+            writer.put_chunk(offset, chunk, len(payload))
+        writer.finish(hashlib.sha256(payload).hexdigest(), len(payload))
+        self.wait_idle(client)
+
+        values = [call.args[1] for call in bar.__setitem__.call_args_list if call.args[0] == 'value']
+        assert values and values == sorted(values) and values[-1] == 100
+        assert transfer.done_bytes == len(payload)
+        assert not client.messagebox.showerror.called
+        print("✅ Download progress test passed")
@@ -0,0 +1,88 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.encryption import (generate_aes_key, generate_rsa_private_key, public_key_pem,
+                               load_rsa_public_key_pem, seal_for, open_sealed)
+from server.envelope import pack_envelope, unpack_envelope, KIND_ROOM, KIND_PRIVATE
+
+@pytest.fixture(scope="module")
+def keypairs():
+    return {name: generate_rsa_private_key() for name in ['alice', 'bob', 'carol']}
+
+class TestSealing:
+    def test_each_recipient_can_open(self, keypairs):
+        """One ciphertext, a wrapped key per recipient"""
+        public = {name: load_rsa_public_key_pem(public_key_pem(key)) for name, key in keypairs.items()}
+        ciphertext, wrapped = seal_for(public, b'secret')
+        assert set(wrapped) == set(keypairs)
+        for name, key in keypairs.items():
+            assert open_sealed(key, ciphertext, wrapped[name]) == b'secret'
+        with pytest.raises(Exception):
+            open_sealed(keypairs['bob'], ciphertext, wrapped['alice'])
+        print("✅ Sealing test passed")
+
+class TestE2ERouting:
+    @pytest.fixture
+    def chat_server(self, keypairs):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            server.send = Mock(return_value=True)
+            handlers = server.sio.handlers['/']
+            for i, name in enumerate(keypairs):
+                sid = server.sio.manager.connect(f'eio{i}', '/')
+                server.aes_keys[sid] = generate_aes_key()
+                handlers['user_joined'](sid, {'username': name})
+                handlers['publish_key'](sid, {'public_key': public_key_pem(keypairs[name])})
+            yield server
+
+    def sid_of(self, server, username):
+        return next(u['sid'] for u in server.users if u['username'] == username)
+
+    def test_publish_key(self, chat_server):
+        """Publishing returns every known key and rejects garbage"""
+        handlers = chat_server.sio.handlers['/']
+        reply = handlers['publish_key'](self.sid_of(chat_server, 'alice'), {'public_key': chat_server.users[0]['public_key']})
+        assert reply['status'] == 'ok' and set(reply['keys']) == {'alice', 'bob', 'carol'}
+        assert handlers['publish_key'](self.sid_of(chat_server, 'bob'), {'public_key': 'nope'})['reason'] == 'invalid_key'
+        print("✅ Publish key test passed")
+
+    def test_private_message_is_opaque(self, chat_server, keypairs):
+        """The server forwards the sealed message without any decryption"""
+        public = {'bob': load_rsa_public_key_pem(public_key_pem(keypairs['bob']))}
+        ciphertext, wrapped = seal_for(public, pack_envelope(KIND_PRIVATE, 1, 0, 'alice', 'bob', 'hi bob'))
+
+        chat_server.send.reset_mock()
+        with patch('server.server.decrypt_aes_raw') as decrypt, patch('server.server.encrypt_aes_raw') as encrypt:
+            reply = chat_server.sio.handlers['/']['e2e_message'](self.sid_of(chat_server, 'alice'),
+                {'seq': 1, 'recipient': 'bob', 'ciphertext': ciphertext, 'keys': wrapped})
+            assert not decrypt.called and not encrypt.called
+        assert reply == {'status': 'ok', 'delivered': 1}
+
+        sid, event, data = chat_server.send.call_args.args[:3]
+        assert sid == self.sid_of(chat_server, 'bob') and event == 'incoming_e2e_message'
+        assert data['sender'] == 'alice' and data['ciphertext'] is ciphertext
+        assert unpack_envelope(open_sealed(keypairs['bob'], data['ciphertext'], data['key'])).payload == b'hi bob'
+        print("✅ Opaque private message test passed")
+
+    def test_room_message_goes_to_keyed_members(self, chat_server, keypairs):
+        """Room messages reach members the sender sealed for, once per seq"""
+        handlers = chat_server.sio.handlers['/']
+        alice, bob = self.sid_of(chat_server, 'alice'), self.sid_of(chat_server, 'bob')
+        handlers['join_room'](alice, {'room': 'dev'})
+        handlers['join_room'](bob, {'room': 'dev'})
+        public = {name: load_rsa_public_key_pem(public_key_pem(keypairs[name])) for name in ['alice', 'bob', 'carol']}
+        ciphertext, wrapped = seal_for(public, pack_envelope(KIND_ROOM, 5, 0, 'alice', 'dev', 'hi'))
+        message = {'seq': 5, 'room': 'dev', 'ciphertext': ciphertext, 'keys': wrapped}
+
+        chat_server.send.reset_mock()
+        assert handlers['e2e_message'](alice, message)['delivered'] == 2  # carol is not in the room
+        assert handlers['e2e_message'](alice, message)['status'] == 'duplicate'  # retransmit
+        assert sorted(call.args[0] for call in chat_server.send.call_args_list) == sorted([alice, bob])
+        print("✅ E2E room routing test passed")
@@ -0,0 +1,92 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.envelope import (pack_envelope, unpack_envelope, restamp, SeqTracker, EnvelopeError,
+                             KIND_ROOM, KIND_PRIVATE, HEADER)
+from server.encryption import generate_aes_key, encrypt_aes, encrypt_aes_raw, decrypt_aes_raw
+
+class TestEnvelope:
+    def test_roundtrip(self):
+        """Envelopes survive packing with unicode names and payloads"""
+        packed = pack_envelope(KIND_PRIVATE, 7, 1700000000123, 'álice', 'bob', 'héllo 👋')
+        envelope = unpack_envelope(packed)
+        assert envelope.kind == KIND_PRIVATE and envelope.seq == 7 and envelope.timestamp == 1700000000123
+        assert (envelope.sender, envelope.target) == ('álice', 'bob')
+        assert envelope.payload.decode() == 'héllo 👋'
+        assert len(packed) == HEADER.size + 2 + len('álice'.encode()) + 3 + len('héllo 👋'.encode())
+        print("✅ Envelope roundtrip test passed")
+
+    def test_rejects_malformed(self):
+        packed = pack_envelope(KIND_ROOM, 1, 0, 'alice', 'Global', 'hi')
+        with pytest.raises(EnvelopeError):
+            unpack_envelope(packed[:HEADER.size + 3])
+        with pytest.raises(EnvelopeError):
+            unpack_envelope(b'\x09' + packed[1:])
+        print("✅ Malformed envelope test passed")
+
+    def test_restamp_overwrites_sender(self):
+        envelope = unpack_envelope(pack_envelope(KIND_ROOM, 1, 0, 'mallory', 'Global', 'hi'))
+        assert unpack_envelope(restamp(envelope, 'alice')).sender == 'alice'
+        print("✅ Restamp test passed")
+
+    def test_seq_tracker(self):
+        """Repeats and out-of-window sequence numbers count as seen"""
+        tracker = SeqTracker(window=4)
+        assert not tracker.seen(1)
+        assert not tracker.seen(3)
+        assert tracker.seen(1)
+        assert not tracker.seen(2)
+        assert not tracker.seen(10)
+        assert tracker.seen(5)
+        print("✅ Sequence tracker test passed")
+
+class TestEnvelopeRouting:
+    @pytest.fixture
+    def chat_server(self):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            server.send = Mock(return_value=True)
+            for i, name in enumerate(['alice', 'bob']):
+                sid = server.sio.manager.connect(f'eio{i}', '/')
+                server.aes_keys[sid] = generate_aes_key()
+                server.sio.handlers['/']['user_joined'](sid, {'username': name})
+            yield server
+
+    def private(self, server, seq, sender='alice'):
+        alice = server.users[0]
+        envelope = pack_envelope(KIND_PRIVATE, seq, 1700000000000, sender, 'bob', 'psst')
+        server.sio.handlers['/']['private_message'](alice['sid'], {'envelope': encrypt_aes_raw(alice['aes_key'], envelope)})
+
+    def test_sender_is_authenticated(self, chat_server):
+        """A spoofed sender name is replaced by the sender's username"""
+        self.private(chat_server, 1, sender='mallory')
+        sid, event, data = chat_server.send.call_args.args[:3]
+        bob = chat_server.users[1]
+        assert sid == bob['sid'] and event == 'incoming_private_message'
+        assert unpack_envelope(decrypt_aes_raw(bob['aes_key'], data['envelope'])).sender == 'alice'
+        print("✅ Authenticated sender test passed")
+
+    def test_duplicate_seq_dropped(self, chat_server):
+        """A retransmitted envelope is delivered once"""
+        self.private(chat_server, 1)
+        self.private(chat_server, 1)
+        assert chat_server.send.call_count == 1
+        assert chat_server.metrics.get('duplicate_messages') == 1
+        print("✅ Duplicate envelope test passed")
+
+    def test_legacy_message_accepted(self, chat_server):
+        """Older clients sending {'message': AES('time|text')} still get through"""
+        alice = chat_server.users[0]
+        legacy = {'recipient': 'bob', 'message': encrypt_aes(alice['aes_key'], '12:00:00|old client')}
+        chat_server.sio.handlers['/']['private_message'](alice['sid'], legacy)
+        data = chat_server.send.call_args.args[2]
+        envelope = unpack_envelope(decrypt_aes_raw(chat_server.users[1]['aes_key'], data['envelope']))
+        assert envelope.payload == b'old client' and envelope.sender == 'alice'
+        print("✅ Legacy message test passed")
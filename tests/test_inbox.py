@@ -0,0 +1,151 @@
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.inbox import OfflineInbox
+from server.batching import unpack_batch
+from server.encryption import generate_aes_key, encrypt_aes_raw, decrypt_aes_raw
+from server.envelope import pack_envelope, unpack_envelope, KIND_PRIVATE
+
+class TestOfflineInbox:
+    def test_bounded_and_drained_once(self, tmp_path):
+        """An inbox holds at most max_messages and empties on drain"""
+        inbox = OfflineInbox(str(tmp_path / "inbox.db"), max_messages=2)
+        assert inbox.store('bob', b'1') and inbox.store('bob', b'2')
+        assert not inbox.store('bob', b'3')
+        assert inbox.drain('bob') == [b'1', b'2']
+        assert inbox.drain('bob') == []
+        print("✅ Inbox bound test passed")
+
+    def test_ttl(self, tmp_path):
+        inbox = OfflineInbox(str(tmp_path / "inbox.db"), ttl=10)
+        inbox.store('bob', b'old', now=100)
+        inbox.store('bob', b'new', now=105)
+        assert inbox.expire(now=112) == 1
+        assert inbox.drain('bob', now=112) == [b'new']
+        print("✅ Inbox TTL test passed")
+
+    def test_durable(self, tmp_path):
+        """Queued messages survive a restart"""
+        path = str(tmp_path / "inbox.db")
+        inbox = OfflineInbox(path)
+        inbox.store('bob', b'persisted')
+        inbox.close()
+        assert OfflineInbox(path).drain('bob') == [b'persisted']
+        print("✅ Inbox durability test passed")
+
+    def test_sender_cap(self, tmp_path):
+        """One sender cannot fill the inbox by spreading messages over many recipients"""
+        inbox = OfflineInbox(str(tmp_path / "inbox.db"), max_per_sender=3)
+        assert all(inbox.store(name, b'x', 'mallory') for name in ('a', 'b', 'c'))
+        assert not inbox.store('d', b'x', 'mallory')
+        assert inbox.store('d', b'x', 'alice')
+        print("✅ Inbox sender cap test passed")
+
+    def test_known_names(self, tmp_path):
+        """Names are known once they join, across restarts, until the TTL runs out"""
+        path = str(tmp_path / "inbox.db")
+        inbox = OfflineInbox(path, ttl=10)
+        assert not inbox.knows('bob', now=100)
+        inbox.remember('bob', now=100)
+        inbox.close()
+        inbox = OfflineInbox(path, ttl=10)
+        assert inbox.knows('bob', now=105) and not inbox.knows('carol', now=105)
+        inbox.expire(now=111)
+        assert not inbox.knows('bob', now=111)
+        print("✅ Inbox known names test passed")
+
+    def test_upgrades_old_schema(self, tmp_path):
+        """An inbox written before senders were recorded still opens and drains"""
+        import sqlite3
+        path = str(tmp_path / "inbox.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE inbox (id INTEGER PRIMARY KEY AUTOINCREMENT, recipient TEXT NOT NULL, "
+                     "created REAL NOT NULL, envelope BLOB NOT NULL)")
+        conn.execute("INSERT INTO inbox (recipient, created, envelope) VALUES ('bob', ?, ?)", (1e12, b'old'))
+        conn.commit()
+        conn.close()
+        inbox = OfflineInbox(path, ttl=10)
+        assert inbox.store('bob', b'new', 'alice', now=1e12)
+        assert inbox.drain('bob', now=1e12) == [b'old', b'new']
+        print("✅ Inbox schema upgrade test passed")
+
+    def test_no_file_until_used(self, tmp_path):
+        path = tmp_path / "inbox.db"
+        assert OfflineInbox(str(path)).drain('bob') == []
+        assert not path.exists()
+        print("✅ Lazy inbox test passed")
+
+class TestOfflineDelivery:
+    def test_queued_then_flushed_in_one_emit(self, tmp_path):
+        """Messages for an offline user arrive as one batch on user_joined"""
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.send = Mock(return_value=True)
+            handlers = server.sio.handlers['/']
+
+            bob = server.sio.manager.connect('eio0', '/')
+            server.aes_keys[bob] = generate_aes_key()
+            handlers['user_joined'](bob, {'username': 'bob'})
+            handlers['user_left'](bob, {'username': 'bob'})
+
+            alice = server.sio.manager.connect('eio1', '/')
+            key = server.aes_keys[alice] = generate_aes_key()
+            handlers['user_joined'](alice, {'username': 'alice'})
+            for i in range(3):
+                envelope = pack_envelope(KIND_PRIVATE, i + 1, 0, 'alice', 'bob', f'msg {i}')
+                reply = handlers['private_message'](alice, {'envelope': encrypt_aes_raw(key, envelope)})
+                assert reply == {'status': 'queued'}
+
+            server.send.reset_mock()
+            bob = server.sio.manager.connect('eio2', '/')
+            bob_key = server.aes_keys[bob] = generate_aes_key()
+            assert handlers['user_joined'](bob, {'username': 'bob'})['offline'] == 3
+
+            emits = [call.args for call in server.send.call_args_list if call.args[1] == 'offline_messages']
+            assert len(emits) == 1 and emits[0][0] == bob
+            data = emits[0][2]
+            entries = unpack_batch(decrypt_aes_raw(bob_key, data['batch']), data['codec'])
+            assert [unpack_envelope(e).payload for e in entries] == [b'msg 0', b'msg 1', b'msg 2']
+            assert server.inbox.drain('bob') == []
+            print("✅ Offline flush test passed")
+
+    def test_unknown_recipient_not_queued(self, tmp_path):
+        """A private message to a name that never joined is refused, not parked for whoever claims it"""
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.send = Mock(return_value=True)
+            handlers = server.sio.handlers['/']
+
+            alice = server.sio.manager.connect('eio1', '/')
+            key = server.aes_keys[alice] = generate_aes_key()
+            handlers['user_joined'](alice, {'username': 'alice'})
+            envelope = pack_envelope(KIND_PRIVATE, 1, 0, 'alice', 'nobody', 'hello')
+            reply = handlers['private_message'](alice, {'envelope': encrypt_aes_raw(key, envelope)})
+            assert reply == {'status': 'error', 'reason': 'recipient_not_found'}
+            assert server.inbox.drain('nobody') == []
+            print("✅ Unknown recipient test passed")
+
+    def test_flush_without_zstandard(self, tmp_path):
+        """A zstd batch codec falls back to zlib at startup, so the flush never tries zstd"""
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), patch('server.compression.zstandard', None):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"), batch_codec='zstd')
+            assert server.batch_codec == 'zlib'
+            server.send = Mock(return_value=True)
+            text = 'hi ' * 200  # Long enough to be compressed
+            server.inbox.store('carol', pack_envelope(KIND_PRIVATE, 1, 0, 'alice', 'carol', text), 'alice')
+            key = generate_aes_key()
+            assert server.flush_inbox({'sid': 'sid0', 'username': 'carol', 'aes_key': key}) == 1
+            data = server.send.call_args.args[2]
+            assert data['codec'] == 'zlib'
+            assert unpack_envelope(unpack_batch(decrypt_aes_raw(key, data['batch']), 'zlib')[0]).payload == text.encode()
+            print("✅ Flush without zstandard test passed")
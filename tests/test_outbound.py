@@ -0,0 +1,124 @@
+import pytest
+import sys
+import os
+import threading
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.outbound import (OutboundQueue, PRIORITY_CONTROL, PRIORITY_CHAT, PRIORITY_BULK,
+                             POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+
+def make_queue(policy, max_queue=4, max_bulk=2, on_overflow=None):
+    sent = []
+    queue = OutboundQueue('sid1', send=lambda event, data: sent.append((event, data)),
+                          create_event=threading.Event, sleep=lambda s: None,
+                          on_overflow=on_overflow, policy=policy,
+                          max_queue=max_queue, max_bulk=max_bulk)
+    return queue, sent
+
+class TestOutboundQueue:
+    def test_priority_order(self):
+        """Control beats chat, and chat beats file chunks"""
+        queue, sent = make_queue(POLICY_DROP_OLDEST)
+        queue.put('incoming_file_chunk', 1, PRIORITY_BULK)
+        queue.put('incoming_global_message', 2, PRIORITY_CHAT)
+        queue.put('user_joined', 3, PRIORITY_CONTROL)
+        queue.drain_once()
+
+        assert [event for event, _ in sent] == ['user_joined', 'incoming_global_message', 'incoming_file_chunk']
+        print("✅ Outbound priority test passed")
+
+    def test_drop_oldest(self):
+        """A full queue sheds its oldest message"""
+        queue, sent = make_queue(POLICY_DROP_OLDEST)
+        for i in range(6):
+            queue.put('msg', i)
+        queue.drain_once()
+
+        assert [data for _, data in sent] == [2, 3, 4, 5]
+        assert queue.stats()['dropped'] == 2
+        print("✅ Drop oldest test passed")
+
+    def test_coalesce_presence(self):
+        """Once behind, a newer roster replaces the queued one"""
+        queue, sent = make_queue(POLICY_COALESCE)
+        queue.put('msg', 'a')
+        queue.put('current_users', ['x'], PRIORITY_CONTROL, coalesce_key='presence')
+        queue.put('current_users', ['x', 'y'], PRIORITY_CONTROL, coalesce_key='presence')
+        queue.drain_once()
+
+        assert sent == [('current_users', ['x', 'y']), ('msg', 'a')]
+        assert queue.stats()['coalesced'] == 1
+        print("✅ Presence coalescing test passed")
+
+    def test_disconnect_policy(self):
+        """Overflow under the disconnect policy closes the queue and reports the sid"""
+        dropped = []
+        queue, _ = make_queue(POLICY_DISCONNECT, on_overflow=dropped.append)
+        for i in range(4):
+            assert queue.put('msg', i)
+        assert not queue.put('msg', 4)
+
+        assert dropped == ['sid1']
+        assert queue.closed
+        print("✅ Disconnect policy test passed")
+
+    def test_bulk_producer_waits_for_room(self):
+        """File chunk producers block instead of growing the queue"""
+        queue, sent = make_queue(POLICY_DROP_OLDEST, max_bulk=2)
+        queue.put('chunk', 0, PRIORITY_BULK)
+        queue.put('chunk', 1, PRIORITY_BULK)
+
+        producer = threading.Thread(target=queue.put, args=('chunk', 2, PRIORITY_BULK))
+        producer.start()
+        producer.join(timeout=0.2)
+        assert producer.is_alive()
+        assert queue.stats()['bulk_depth'] == 2
+
+        queue.pop()
+        producer.join(timeout=2)
+        assert not producer.is_alive()
+        assert queue.stats()['bulk_depth'] == 2
+        print("✅ Bulk backpressure test passed")
+
+class TestPresence:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        from unittest.mock import Mock, patch
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            yield server
+            server.disk.shutdown()
+
+    def join(self, server, username):
+        sid = server.sio.manager.connect(f'eio-{username}', '/')
+        server.sio.handlers['/']['connect'](sid, {})
+        server.aes_keys[sid] = b'k' * 32
+        server.sio.handlers['/']['user_joined'](sid, {'username': username})
+        return sid
+
+    def test_slow_client_gets_every_notice(self, chat_server):
+        """A client that is behind still sees every join and leave; only the roster is merged"""
+        slow = self.join(chat_server, 'slow')
+        queue = chat_server.outbound[slow]
+        sent = []
+        queue.send = lambda event, data: sent.append((event, data))
+        queue.drain_once()
+        sent.clear()
+        for i in range(queue.max_queue // 2):
+            queue.put('msg', i)  # Far enough behind that coalescing kicks in
+
+        alice = self.join(chat_server, 'alice')
+        chat_server.sio.handlers['/']['user_left'](alice, {'username': 'alice'})
+        self.join(chat_server, 'bob')
+        queue.drain_once()
+
+        notices = [(event, data['username']) for event, data in sent if event in ('user_joined', 'user_left')]
+        assert notices == [('user_joined', 'alice'), ('user_left', 'alice'), ('user_joined', 'bob')]
+        rosters = [data['usernames'] for event, data in sent if event == 'current_users']
+        assert rosters == [['slow', 'bob']] and queue.stats()['coalesced'] == 2
+        print("✅ Presence notice delivery test passed")
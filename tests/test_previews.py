@@ -0,0 +1,201 @@
+import sys
+import os
+import base64
+import hashlib
+import struct
+import zlib
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from server.previews import PreviewPipeline, PreviewCache, probe_media, media_kind, image_size, pillow
+from server.outbound import PRIORITY_CHAT, PRIORITY_BULK
+
+
+def make_png(width, height):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + b"\x80\x40\x20" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def make_jpeg_header(width, height):
+    # SOI, an APP0 segment to skip, then SOF0 with the dimensions
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    sof0 = b"\xff\xc0" + struct.pack(">HBHH", 11, 8, height, width) + b"\x01\x01\x11\x00"
+    return b"\xff\xd8" + app0 + sof0 + b"\xff\xd9"
+
+
+class InlineExecutor:
+    """Runs jobs on submit, or holds them until release() when deferred."""
+    def __init__(self, defer=False):
+        self.defer = defer
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        if not self.defer:
+            self.release()
+        return future
+
+    def release(self):
+        for future, fn, args in self.jobs:
+            future.set_result(fn(*args))
+        self.jobs = []
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class TestMediaProbe:
+    def test_header_dimensions(self, tmp_path):
+        png = tmp_path / "a.png"
+        png.write_bytes(make_png(40, 30))
+        jpg = tmp_path / "b.jpg"
+        jpg.write_bytes(make_jpeg_header(1920, 1080))
+        assert image_size(str(png)) == (40, 30)
+        assert image_size(str(jpg)) == (1920, 1080)
+        print("✅ Header dimensions test passed")
+
+    def test_probe_image(self, tmp_path):
+        path = tmp_path / "a.png"
+        path.write_bytes(make_png(400, 200))
+        preview = probe_media(str(path), media_kind(str(path)))
+        assert preview['kind'] == 'image'
+        assert (preview['width'], preview['height']) == (400, 200)
+        assert preview['size'] == os.path.getsize(path)
+        if pillow() is not None:
+            assert preview['thumbnail'].startswith(b"\x89PNG")
+        print("✅ Image probe test passed")
+
+    def test_undecodable_file_keeps_size(self, tmp_path):
+        path = tmp_path / "broken.jpg"
+        path.write_bytes(b"not an image")
+        preview = probe_media(str(path), 'image')
+        assert preview['size'] == 12 and preview['thumbnail'] is None
+        print("✅ Undecodable file test passed")
+
+    def test_wav_duration_without_ffprobe(self, tmp_path):
+        import wave
+        path = tmp_path / "beep.wav"
+        with wave.open(str(path), "wb") as audio:
+            audio.setnchannels(1), audio.setsampwidth(2), audio.setframerate(8000)
+            audio.writeframes(b"\0\0" * 16000)
+        with patch('server.previews.shutil.which', return_value=None):
+            preview = probe_media(str(path), media_kind(str(path)))
+        assert preview['kind'] == 'audio' and preview['duration'] == 2.0
+        print("✅ WAV duration test passed")
+
+class TestPreviewPipeline:
+    def test_cache_by_content_hash(self, tmp_path):
+        """The same content is decoded once, whichever file it arrives in"""
+        path = tmp_path / "a.png"
+        path.write_bytes(make_png(8, 8))
+        executor = InlineExecutor()
+        pipeline = PreviewPipeline(spawn=Mock(), sleep=Mock(), executor=executor)
+        seen = []
+        pipeline.request('h1', str(path), 'image', seen.append)
+        pipeline.request('h1', str(path), 'image', seen.append)
+        assert len(seen) == 2 and seen[0] is seen[1]
+        assert pipeline.stats()['generated'] == 1
+        assert pipeline.stats()['cache_hits'] == 1
+        print("✅ Preview cache test passed")
+
+    def test_concurrent_requests_share_a_job(self, tmp_path):
+        path = tmp_path / "a.png"
+        path.write_bytes(make_png(8, 8))
+        executor = InlineExecutor(defer=True)
+        waits = []
+        pipeline = PreviewPipeline(spawn=lambda fn, *args: waits.append((fn, args)), sleep=Mock(), executor=executor)
+        seen = []
+        pipeline.request('h1', str(path), 'image', seen.append)
+        pipeline.request('h1', str(path), 'image', seen.append)
+        assert len(executor.jobs) == 1 and len(waits) == 1 and seen == []
+
+        executor.release()
+        fn, args = waits[0]
+        fn(*args)
+        assert len(seen) == 2
+        print("✅ Shared job test passed")
+
+    def test_worker_failure_logged(self, tmp_path):
+        """A worker that dies is counted and logged, and the waiting callbacks are dropped"""
+        class BrokenExecutor(InlineExecutor):
+            def submit(self, fn, *args):
+                future = Future()
+                future.set_exception(ModuleNotFoundError("No module named 'server.previews'"))
+                return future
+
+        pipeline = PreviewPipeline(spawn=Mock(), sleep=Mock(), executor=BrokenExecutor())
+        seen = []
+        with patch('server.previews.log_event') as log:
+            pipeline.request('h1', str(tmp_path / "a.png"), 'image', seen.append)
+        assert seen == [] and pipeline.stats()['failed'] == 1 and pipeline.waiting == {}
+        assert log.call_args.args[1] == 'preview_failed' and 'server.previews' in log.call_args.args[2]
+        print("✅ Preview worker failure test passed")
+
+    def test_lru_eviction(self):
+        cache = PreviewCache(size=2)
+        cache.put('a', {}), cache.put('b', {})
+        cache.get('a')
+        cache.put('c', {})
+        assert list(cache.entries) == ['a', 'c']
+        print("✅ Preview LRU test passed")
+
+    def test_process_pool(self, tmp_path):
+        """Real worker processes return the same preview"""
+        import time
+        path = tmp_path / "a.png"
+        path.write_bytes(make_png(16, 12))
+        pipeline = PreviewPipeline(spawn=lambda fn, *args: fn(*args), sleep=time.sleep, workers=1)
+        seen = []
+        # Spawned workers import server.previews by name using the parent's sys.path. If another test
+        # module put server/ itself on it, 'server' resolves to server/server.py ahead of the
+        # namespace package, so the workers get a path without it
+        worker_path = [p for p in sys.path if os.path.abspath(p or os.curdir) != os.path.join(ROOT, 'server')]
+        try:
+            with patch.object(sys, 'path', worker_path):
+                pipeline.request('h1', str(path), 'image', seen.append)
+        finally:
+            pipeline.shutdown()
+        assert pipeline.stats()['failed'] == 0
+        assert (seen[0]['width'], seen[0]['height']) == (16, 12)
+        print("✅ Process pool test passed")
+
+class TestServerPreviews:
+    def test_preview_follows_file_notice(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.quotas = UploadQuotas(str(tmp_path), min_free_disk=0)
+            server.previews = PreviewPipeline(Mock(), Mock(), executor=InlineExecutor())
+            server.send = Mock(return_value=True)
+            server.users = [{'sid': 'a', 'username': 'alice'}, {'sid': 'b', 'username': 'bob'}]
+
+            handlers = server.sio.handlers['/']
+            png = make_png(64, 48)
+            transfer_id = 'c' * 32
+            assert handlers['start_upload']('a', {'transfer_id': transfer_id, 'filename': 'cat.png',
+                                                  'filesize': len(png)})['status'] == 'ok'
+            handlers['upload_chunk']('a', {'transfer_id': transfer_id, 'chunk_data': base64.b64encode(png).decode()})
+            handlers['finish_upload']('a', {'transfer_id': transfer_id, 'sender': 'alice',
+                                            'hash_file': hashlib.sha256(png).hexdigest()})
+
+            events = [(call.args[0], call.args[1]) for call in server.send.call_args_list]
+            assert events.index(('b', 'incoming_global_file')) < events.index(('b', 'file_preview'))
+            preview = next(call.args[2] for call in server.send.call_args_list if call.args[1] == 'file_preview')
+            assert preview['file_id'] == transfer_id
+            notice = next(call.args[2] for call in server.send.call_args_list if call.args[1] == 'incoming_global_file')
+            assert notice['filesize'] == len(png)  # Sizes the recipient's download progress bar
+            sent = next(call for call in server.send.call_args_list if call.args[1] == 'file_preview')
+            assert sent.kwargs.get('priority', PRIORITY_CHAT) != PRIORITY_BULK  # Must not block the loop
+            assert (preview['width'], preview['height']) == (64, 48)
+            print("✅ Server preview test passed")
@@ -0,0 +1,154 @@
+import pytest
+import sys
+import os
+import time
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.profiler import HandlerProfiler, BACKGROUND
+
+TOKEN = "s3cret-admin-token"
+
+class TestHandlerProfiler:
+    def test_wraps_and_restores(self):
+        """Handlers are only wrapped while profiling, so an idle profiler costs nothing"""
+        def ping(sid):
+            return 'pong'
+        def connect(sid, environ):
+            return True
+        handlers = {'ping': ping, 'connect': connect}
+        profiler = HandlerProfiler(interval=0.001)
+        assert profiler.start(handlers, exclude=('connect',))
+        assert handlers['ping'] is not ping and handlers['connect'] is connect
+        assert not profiler.start(handlers)  # Already running
+        for _ in range(3):
+            assert handlers['ping']('sid1') == 'pong'
+        assert profiler.stop()
+        assert handlers['ping'] is ping
+        assert not profiler.stop()
+
+        report = profiler.report()
+        assert report['handlers']['ping']['calls'] == 3
+        assert 'connect' not in report['handlers']
+        assert not report['enabled'] and report['duration'] >= 0
+        print("✅ Handler wrapping test passed")
+
+    def test_errors_are_timed_too(self):
+        def broken(sid):
+            raise RuntimeError("boom")
+        handlers = {'broken': broken}
+        profiler = HandlerProfiler()
+        profiler.start(handlers)
+        with pytest.raises(RuntimeError):
+            handlers['broken']('sid1')
+        profiler.stop()
+        assert profiler.report()['handlers']['broken']['calls'] == 1
+        assert profiler.active == {}
+        print("✅ Failing handler timing test passed")
+
+    def test_collapsed_stacks(self):
+        """Samples are rooted at the running event and folded into "a;b;c count" lines"""
+        profiler = HandlerProfiler()
+        def inner():
+            profiler.record(sys._getframe(), 'send_message')
+            profiler.record(sys._getframe(), 'send_message')
+            profiler.record(sys._getframe())
+        inner()
+        lines = profiler.collapsed().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        assert stack.startswith('send_message;') and count == '2'
+        assert stack.split(';')[-1].startswith('inner (test_profiler.py:')
+        assert lines[1].startswith(BACKGROUND + ';')
+        assert profiler.report()['samples'] == 3
+        print("✅ Collapsed stack test passed")
+
+    def test_distinct_stacks_bounded(self):
+        profiler = HandlerProfiler(max_stacks=1)
+        profiler.record(sys._getframe(), 'a')
+        profiler.record(sys._getframe(), 'b')
+        assert len(profiler.stacks) == 2 and 'b;(truncated)' in profiler.stacks
+        print("✅ Stack limit test passed")
+
+    def test_sampler_sees_loop_thread(self):
+        handlers = {'spin': lambda sid: time.sleep(0.05)}
+        profiler = HandlerProfiler(interval=0.001)
+        profiler.start(handlers)
+        handlers['spin']('sid1')
+        profiler.stop()
+        assert any(line.startswith('spin;') for line in profiler.collapsed().splitlines())
+        print("✅ Sampler test passed")
+
+    def test_interleaved_handlers(self):
+        """Two handlers on separate greenlets, each yielding to the other, keep their own event"""
+        import greenlet
+        seen = []
+        def handler(sid):
+            seen.append((sid, profiler.event_of(sys._getframe())))
+            main.switch()  # Yield, as a handler waiting on I/O would
+            seen.append((sid, profiler.event_of(sys._getframe())))
+        handlers = {'slow': handler, 'fast': handler}
+        profiler = HandlerProfiler(interval=1)
+        profiler.start(handlers)
+        main = greenlet.getcurrent()
+        first = greenlet.greenlet(lambda: handlers['slow']('sid1'))
+        second = greenlet.greenlet(lambda: handlers['fast']('sid2'))
+        for runner in (first, second, first, second):  # slow starts first and also finishes first
+            runner.switch()
+        profiler.stop()
+        assert seen == [('sid1', 'slow'), ('sid2', 'fast'), ('sid1', 'slow'), ('sid2', 'fast')]
+        assert profiler.active == {} and profiler.event_of(sys._getframe()) is None
+        print("✅ Interleaved handlers test passed")
+
+class TestAdminProfiling:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:", admin_token=TOKEN)
+            yield server
+            server.profiler.stop()
+
+    def admin(self, server, name):
+        return server.sio.handlers['/admin'][name]
+
+    def test_admin_needs_token(self, chat_server):
+        connect = self.admin(chat_server, 'connect')
+        assert connect('adm1', {}, {'token': 'wrong'}) is False
+        assert connect('adm1', {}, None) is False
+        assert self.admin(chat_server, 'profile_start')('adm1') == {'status': 'error', 'reason': 'unauthorized'}
+        assert connect('adm1', {}, {'token': TOKEN}) is not False
+        assert 'adm1' in chat_server.admins
+        self.admin(chat_server, 'disconnect')('adm1', 'client disconnect')
+        assert 'adm1' not in chat_server.admins
+        print("✅ Admin authentication test passed")
+
+    def test_no_token_disables_admin(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+        assert server.sio.handlers['/admin']['connect']('adm1', {}, {'token': ''}) is False
+        print("✅ Admin disabled test passed")
+
+    def test_profile_round_trip(self, chat_server):
+        self.admin(chat_server, 'connect')('adm1', {}, {'token': TOKEN})
+        original = chat_server.sio.handlers['/']['list_rooms']
+        assert self.admin(chat_server, 'profile_start')('adm1') == {'status': 'ok'}
+        assert self.admin(chat_server, 'profile_start')('adm1')['reason'] == 'already_running'
+        assert chat_server.sio.handlers['/']['connect'].__name__ == 'connect'  # Lifecycle handlers untouched
+
+        chat_server.outbound['sid1'] = Mock(depth=0)
+        chat_server.sio.handlers['/']['list_rooms']('sid1')
+        reply = self.admin(chat_server, 'profile_stop')('adm1')
+        assert reply['status'] == 'ok' and reply['report']['handlers']['list_rooms']['calls'] == 1
+        assert chat_server.sio.handlers['/']['list_rooms'] is original
+
+        reply = self.admin(chat_server, 'profile_report')('adm1')
+        assert reply['status'] == 'ok' and isinstance(reply['collapsed'], str)
+        assert self.admin(chat_server, 'profile_stop')('adm1')['reason'] == 'not_running'
+        print("✅ Admin profiling test passed")
@@ -0,0 +1,145 @@
+import pytest
+import sys
+import os
+import base64
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.quotas import UploadQuotas
+from server.ratelimit import TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucket:
+    def test_consume_and_refill(self):
+        """Tokens run out and refill at the configured rate"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=10, clock=clock)
+        assert bucket.consume(10)
+        assert not bucket.consume(1)
+        clock.now = 0.5
+        assert bucket.consume(5)
+        print("✅ Token bucket test passed")
+
+    def test_reserve_returns_wait(self):
+        """Reserving beyond the balance returns a wait, or None past max_wait"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=100, capacity=100, clock=clock)
+        assert bucket.reserve(100, max_wait=1) == 0
+        assert bucket.reserve(50, max_wait=1) == pytest.approx(0.5)
+        assert bucket.reserve(500, max_wait=1) is None
+        print("✅ Token bucket reserve test passed")
+
+class TestUploadQuotas:
+    def test_limits(self, tmp_path):
+        """File, user and global limits are all enforced"""
+        quotas = UploadQuotas(str(tmp_path), max_file_size=100, user_quota=150,
+                              global_quota=200, min_free_disk=0)
+        assert quotas.reserve("alice", 101) == "file_too_large"
+        assert quotas.reserve("alice", 100) is None
+        assert quotas.reserve("alice", 100) == "user_quota_exceeded"
+        assert quotas.reserve("bob", 100) is None
+        assert quotas.reserve("carol", 1) == "server_quota_exceeded"
+        quotas.release("bob", 100)
+        assert quotas.reserve("carol", 1) is None
+        print("✅ Upload quota test passed")
+
+class TestUploadEnforcement:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            server.quotas = UploadQuotas(str(tmp_path), max_file_size=1000, min_free_disk=0)
+            server.users = [{'sid': 'sid1', 'username': 'alice', 'aes_key': b'k'}]
+            yield server
+
+    def handler(self, server, name):
+        return server.sio.handlers['/'][name]
+
+    def test_oversize_upload_rejected(self, chat_server):
+        """Declared sizes above the limit are refused at start_upload"""
+        reply = self.handler(chat_server, 'start_upload')('sid1', {
+            'transfer_id': 'a' * 32, 'filename': 'x.png', 'filesize': 5000})
+        assert reply == {'status': 'rejected', 'reason': 'file_too_large'}
+        assert chat_server.upload_files == {}
+        print("✅ Oversize upload test passed")
+
+    def test_chunks_beyond_declared_size_abort(self, chat_server, tmp_path):
+        """Sending more than declared aborts and cleans up the upload"""
+        transfer_id = 'b' * 32
+        reply = self.handler(chat_server, 'start_upload')('sid1', {
+            'transfer_id': transfer_id, 'filename': 'x.png', 'filesize': 10})
+        assert reply == {'status': 'ok', 'max_chunk': chat_server.chunk_size}
+        path = chat_server.upload_files[transfer_id]['path']
+
+        chunk = base64.b64encode(b'0123456789ab').decode()
+        self.handler(chat_server, 'upload_chunk')('sid1', {'transfer_id': transfer_id, 'chunk_data': chunk})
+
+        assert transfer_id not in chat_server.upload_files
+        assert not os.path.exists(path)
+        assert chat_server.quotas.total == 0
+        print("✅ Declared size enforcement test passed")
+
+class TestClientCancel:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            server.quotas = UploadQuotas(str(tmp_path), min_free_disk=0)
+            server.users = [{'sid': 'sid1', 'username': 'alice', 'aes_key': b'k'}]
+            server.send = Mock(return_value=True)
+            yield server
+            server.disk.shutdown()
+
+    def test_cancel_reaches_server(self, chat_server, tmp_path):
+        """A cancelled upload is deleted on the server right away, not at the idle sweep"""
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+        from gui import ChatClientGUI
+        from config import ClientConfig
+        from transfer_manager import TransferManager, Transfer
+
+        handlers = chat_server.sio.handlers['/']
+        transfer_id = 'c' * 32
+        emitted = []
+
+        class Loopback:
+            """The client's socket, wired straight to the server's handlers"""
+            def call(self, event, data):
+                return handlers[event]('sid1', data)
+
+            def emit(self, event, data, **kwargs):
+                emitted.append(event)
+                handlers[event]('sid1', data)
+                if event == 'upload_chunk':
+                    client.transfers.cancel(transfer_id)  # The user cancels after the first chunk
+
+        client = ChatClientGUI.__new__(ChatClientGUI)  # No window: only the upload path runs
+        client.sio, client.username = Loopback(), 'alice'
+        client.config = ClientConfig(chunk_size=100)
+        client.restart_generation = 0
+        client.transfers = TransferManager(bandwidth=None)
+        client.transfers.transfers[transfer_id] = Transfer(transfer_id, 'upload', 'x.png', 400)
+        path = tmp_path / "x.png"
+        path.write_bytes(os.urandom(400))
+
+        with patch('gui.messagebox.showerror') as showerror:
+            client.send_file_w_progressbar(str(path), 'Global', transfer_id)
+        assert not showerror.called
+        assert emitted == ['upload_chunk', 'cancel_upload']
+        assert chat_server.upload_files == {} and chat_server.quotas.total == 0
+        assert [name for name in os.listdir(tmp_path) if name.startswith(transfer_id)] == []
+        assert client.transfers.get(transfer_id) is None
+        print("✅ Client cancel test passed")
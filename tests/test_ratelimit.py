@@ -0,0 +1,86 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.ratelimit import EventLimiter
+from server.encryption import generate_aes_key, encrypt_aes_raw
+from server.envelope import pack_envelope, KIND_ROOM
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestEventLimiter:
+    def test_per_sid_per_event(self):
+        """Each sid and event has its own bucket"""
+        clock = FakeClock()
+        limiter = EventLimiter({'global_message': (1, 2)}, clock=clock)
+        assert limiter.allow('a', 'global_message') and limiter.allow('a', 'global_message')
+        assert not limiter.allow('a', 'global_message')
+        assert limiter.allow('b', 'global_message')
+        assert limiter.allow('a', 'list_rooms')
+        clock.now = 1.0
+        assert limiter.allow('a', 'global_message')
+        print("✅ Event limiter test passed")
+
+    def test_flood_threshold(self):
+        clock = FakeClock()
+        limiter = EventLimiter(disconnect_after=3, window=10, clock=clock)
+        assert not limiter.violation('a') and not limiter.violation('a')
+        clock.now = 11
+        assert not limiter.violation('a')  # Older rejections fell out of the window
+        assert not limiter.violation('a')
+        assert limiter.violation('a')
+        print("✅ Flood threshold test passed")
+
+class TestFloodProtection:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.limiter.clock = clock = FakeClock()
+            server.limiter.disconnect_after = 200
+            server.send = Mock(return_value=True)
+            server.sio.disconnect = Mock()
+            for i, name in enumerate(['mallory', 'alice', 'bob']):
+                sid = server.sio.manager.connect(f'eio{i}', '/')
+                server.aes_keys[sid] = generate_aes_key()
+                server.sio.handlers['/']['user_joined'](sid, {'username': name})
+            yield server, clock
+
+    def post(self, server, username, seq):
+        user = next(u for u in server.users if u['username'] == username)
+        envelope = pack_envelope(KIND_ROOM, seq, 0, username, 'Global', 'x')
+        return server.sio.handlers['/']['global_message'](user['sid'], {'envelope': encrypt_aes_raw(user['aes_key'], envelope)})
+
+    def test_flood_does_not_starve_others(self, chat_server):
+        """A client flooding global_message is capped while other users keep full throughput"""
+        server, clock = chat_server
+        flood_ok = alice_ok = 0
+        seq = 0
+        # 10 simulated seconds: mallory sends 1000 msg/s, alice a normal 2 msg/s
+        for tick in range(1000):
+            clock.now = tick / 100.0
+            for _ in range(10):
+                seq += 1
+                flood_ok += self.post(server, 'mallory', seq)['status'] == 'ok'
+            if tick % 50 == 0:
+                alice_ok += self.post(server, 'alice', tick + 1)['status'] == 'ok'
+
+        assert alice_ok == 20                     # Every one of alice's messages went through
+        assert flood_ok <= 20 + 5 * 10 + 1        # Burst plus refill, out of 10,000 attempts
+        # Fan-out work (one send per room member) is bounded by what got through
+        fanout = sum(1 for call in server.send.call_args_list if call.args[1] == 'incoming_global_message')
+        assert fanout == 3 * (flood_ok + alice_ok)
+        assert server.metrics.get('rate_limited:global_message') == 10000 - flood_ok
+        assert server.sio.disconnect.called and server.metrics.get('flood_disconnects') >= 1
+        print("✅ Flood protection test passed")
@@ -0,0 +1,101 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.rooms import RoomRegistry, DEFAULT_ROOM, valid_room_name
+from server.encryption import generate_aes_key, encrypt_aes_raw, decrypt_aes_raw
+from server.envelope import pack_envelope, unpack_envelope, KIND_ROOM
+
+class TestRoomRegistry:
+    def test_join_leave(self):
+        """Members are tracked per room and empty rooms disappear"""
+        rooms = RoomRegistry()
+        alice = {'sid': 'sid1', 'username': 'alice'}
+        assert rooms.join('dev', alice)
+        assert not rooms.join('dev', alice)
+        assert rooms.usernames('dev') == ['alice']
+
+        assert rooms.leave_all('sid1') == ['dev']
+        assert 'dev' not in rooms.members
+        assert DEFAULT_ROOM in rooms.members
+        print("✅ Room membership test passed")
+
+    def test_history_is_bounded(self):
+        """Room history keeps only the most recent messages"""
+        rooms = RoomRegistry(history_size=2)
+        rooms.join('dev', {'sid': 'sid1', 'username': 'alice'})
+        for i in range(3):
+            rooms.record('dev', str(i).encode())
+        assert rooms.recent('dev') == [b'1', b'2']
+        print("✅ Room history test passed")
+
+    def test_room_names(self):
+        assert valid_room_name('dev-team_1')
+        assert not valid_room_name('room:x')
+        assert not valid_room_name('')
+        assert not valid_room_name('dev\n')
+        print("✅ Room name test passed")
+
+class TestRoomRouting:
+    @pytest.fixture
+    def chat_server(self):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            server.send = Mock(return_value=True)
+            for i, name in enumerate(['alice', 'bob', 'carol']):
+                sid = server.sio.manager.connect(f'eio{i}', '/')
+                server.aes_keys[sid] = generate_aes_key()
+                server.sio.handlers['/']['user_joined'](sid, {'username': name})
+            yield server
+
+    def post(self, server, sid, text, seq=1, room='dev'):
+        key = next(u['aes_key'] for u in server.users if u['sid'] == sid)
+        envelope = pack_envelope(KIND_ROOM, seq, 1700000000000, 'alice', room, text)
+        server.sio.handlers['/']['global_message'](sid, {'envelope': encrypt_aes_raw(key, envelope)})
+
+    def sid_of(self, server, username):
+        return next(u['sid'] for u in server.users if u['username'] == username)
+
+    def test_room_message_reaches_only_members(self, chat_server):
+        """A room broadcast is fanned out to room members only"""
+        handlers = chat_server.sio.handlers['/']
+        alice, bob = self.sid_of(chat_server, 'alice'), self.sid_of(chat_server, 'bob')
+        assert handlers['join_room'](alice, {'room': 'dev'})['status'] == 'ok'
+        assert handlers['join_room'](bob, {'room': 'dev'})['members'] == ['alice', 'bob']
+
+        chat_server.send.reset_mock()
+        self.post(chat_server, alice, 'hi')
+
+        sent = [call.args for call in chat_server.send.call_args_list if call.args[1] == 'incoming_global_message']
+        assert sorted(args[0] for args in sent) == sorted([alice, bob])
+        bob_key = chat_server.users[1]['aes_key']
+        envelope = unpack_envelope(decrypt_aes_raw(bob_key, next(a[2] for a in sent if a[0] == bob)['envelope']))
+        assert envelope.target == 'dev' and envelope.payload == b'hi'
+        print("✅ Room fan-out test passed")
+
+    def test_joiner_receives_history(self, chat_server):
+        """Joining a room replays its history encrypted for the newcomer"""
+        handlers = chat_server.sio.handlers['/']
+        alice, carol = self.sid_of(chat_server, 'alice'), self.sid_of(chat_server, 'carol')
+        handlers['join_room'](alice, {'room': 'dev'})
+        self.post(chat_server, alice, 'earlier')
+
+        chat_server.send.reset_mock()
+        handlers['join_room'](carol, {'room': 'dev'})
+        history = next(call.args[2] for call in chat_server.send.call_args_list if call.args[1] == 'room_history')
+        carol_key = chat_server.users[2]['aes_key']
+        assert unpack_envelope(decrypt_aes_raw(carol_key, history['messages'][0])).payload == b'earlier'
+        print("✅ Room history replay test passed")
+
+    def test_non_member_cannot_post(self, chat_server):
+        alice = self.sid_of(chat_server, 'alice')
+        chat_server.send.reset_mock()
+        self.post(chat_server, alice, 'hi')
+        assert not chat_server.send.called
+        print("✅ Non-member post test passed")
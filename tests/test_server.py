@@ -46,6 +46,168 @@ class TestChatServer:
         assert user['username'] == 'user1'
         print("✅ User lookup test passed")
 
+class TestUploadLifecycle:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+            server = ChatServer()
+            server.quotas = UploadQuotas(str(tmp_path), min_free_disk=0)
+            server.users = [{'sid': 'sid1', 'username': 'alice', 'aes_key': b'k'}]
+            yield server
+
+    def start(self, server, transfer_id):
+        reply = server.sio.handlers['/']['start_upload']('sid1', {
+            'transfer_id': transfer_id, 'filename': 'x.png', 'filesize': 100})
+        assert reply == {'status': 'ok', 'max_chunk': server.chunk_size}
+        return server.upload_files[transfer_id]
+
+    def test_disconnect_reaps_uploads(self, chat_server):
+        """A disconnect closes and deletes the sid's partial uploads"""
+        info = self.start(chat_server, 'a' * 32)
+        chat_server.sio.handlers['/']['disconnect']('sid1')
+
+        assert chat_server.upload_files == {}
+        assert info['file'].closed
+        assert not os.path.exists(info['path'])
+        assert chat_server.quotas.total == 0
+        print("✅ Disconnect cleanup test passed")
+
+    def test_idle_uploads_expire(self, chat_server):
+        """The sweeper aborts uploads that stopped sending"""
+        from server.transfers import UPLOAD_IDLE_TIMEOUT
+        info = self.start(chat_server, 'b' * 32)
+        assert chat_server.sweep_idle_uploads(now=info['last_activity'] + 1) == 0
+        assert chat_server.sweep_idle_uploads(now=info['last_activity'] + UPLOAD_IDLE_TIMEOUT + 1) == 1
+        assert chat_server.upload_files == {}
+        print("✅ Idle upload sweep test passed")
+
+    def test_expired_files_collected_unless_referenced(self, chat_server, tmp_path):
+        """Old stored files are deleted unless a download holds a reference"""
+        from server.transfers import FILE_RETENTION
+        old_id, pinned_id = 'c' * 32, 'd' * 32
+        for file_id in (old_id, pinned_id):
+            (tmp_path / f"{file_id}_x.png").write_bytes(b"data")
+        (tmp_path / "notes.txt").write_bytes(b"keep")
+        chat_server.file_refs[pinned_id] = 1
+
+        import time
+        removed = chat_server.collect_stored_files(now=time.time() + FILE_RETENTION + 1)
+
+        assert removed == 1
+        assert not (tmp_path / f"{old_id}_x.png").exists()
+        assert (tmp_path / f"{pinned_id}_x.png").exists()
+        assert (tmp_path / "notes.txt").exists()
+        print("✅ Stored file GC test passed")
+
+class TestDownloadWindow:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            server.chunk_size = 10
+            server.send = Mock(return_value=True)
+            yield server
+            server.disk.shutdown()
+
+    def request(self, server, window, transfer_id='c' * 32, eio_sid='eio1', offset=0):
+        from server.transfers import stored_path
+        sid = server.sio.manager.connect(eio_sid, '/')
+        server.sio.handlers['/']['connect'](sid, {})
+        with open(stored_path(server.upload_folder, 'b' * 32, 'x.bin'), 'wb') as f:
+            f.write(b'x' * 100)
+        server.sio.handlers['/']['download_request'](sid, {'file_id': 'b' * 32, 'filename': 'x.bin',
+                                                            'transfer_id': transfer_id, 'window': window,
+                                                            'offset': offset})
+        return sid
+
+    def sent(self, server, event):
+        return [call.args[2] for call in server.send.call_args_list if call.args[1] == event]
+
+    def test_window_waits_for_acks(self, chat_server):
+        """No more than the window is in flight until the client acknowledges it"""
+        import eventlet
+        sid = self.request(chat_server, 2)
+        eventlet.sleep(0.05)
+        assert [chunk['offset'] for chunk in self.sent(chat_server, 'incoming_file_chunk')] == [0, 10]
+
+        chat_server.sio.handlers['/']['download_ack'](sid, {'transfer_id': 'c' * 32, 'offset': 20})
+        eventlet.sleep(0.05)
+        assert len(self.sent(chat_server, 'incoming_file_chunk')) == 4
+
+        chat_server.sio.handlers['/']['download_ack'](sid, {'transfer_id': 'c' * 32, 'offset': 100})
+        eventlet.sleep(0.05)
+        assert len(self.sent(chat_server, 'incoming_file_chunk')) == 10
+        assert self.sent(chat_server, 'finish_download') and chat_server.downloads == {}
+        print("✅ Download window test passed")
+
+    def test_stalled_client_aborts(self, chat_server):
+        import eventlet
+        with patch('server.server.DOWNLOAD_ACK_TIMEOUT', 0.05):
+            self.request(chat_server, 1)
+            eventlet.sleep(0.2)
+        assert len(self.sent(chat_server, 'incoming_file_chunk')) == 1
+        assert self.sent(chat_server, 'download_aborted')[0]['reason'] == 'stalled'
+        assert chat_server.downloads == {} and chat_server.file_refs == {}
+        print("✅ Stalled download test passed")
+
+    def test_no_window_streams_everything(self, chat_server):
+        """Clients that do not send a window are not held back"""
+        import eventlet
+        self.request(chat_server, None)
+        eventlet.sleep(0.05)
+        assert len(self.sent(chat_server, 'incoming_file_chunk')) == 10
+        print("✅ Unwindowed download test passed")
+
+    def test_bad_offset_starts_from_zero(self, chat_server):
+        import eventlet
+        for offset in ('abc', None, -5, 2.5):
+            chat_server.send.reset_mock()
+            self.request(chat_server, None, offset=offset)
+            eventlet.sleep(0.05)
+            assert [chunk['offset'] for chunk in self.sent(chat_server, 'incoming_file_chunk')][0] == 0
+        print("✅ Bad download offset test passed")
+
+    def test_invalid_transfer_id_pins_nothing(self, chat_server):
+        for transfer_id in ('', '../x', None, 'C' * 32):
+            self.request(chat_server, 2, transfer_id=transfer_id)
+        assert chat_server.downloads == {} and chat_server.file_refs == {}
+        assert not self.sent(chat_server, 'incoming_file_chunk')
+        print("✅ Invalid download transfer ID test passed")
+
+    def test_request_is_acknowledged(self, chat_server):
+        """Every download_request gets a reply, so a refused client does not wait for chunks"""
+        sid = self.request(chat_server, 2)
+        request = chat_server.sio.handlers['/']['download_request']
+        base = {'file_id': 'b' * 32, 'filename': 'x.bin', 'transfer_id': 'd' * 32}
+        assert request(sid, base) == {'status': 'ok', 'filesize': 100}
+        assert request(sid, base)['reason'] == 'invalid_transfer_id'  # Already running
+        assert request(sid, dict(base, file_id='nope'))['reason'] == 'invalid_file'
+        assert request(sid, dict(base, file_id='e' * 32, transfer_id='f' * 32))['reason'] == 'not_found'
+        print("✅ Download request reply test passed")
+
+    def test_transfer_ids_are_per_session(self, chat_server):
+        """Two clients may pick the same transfer ID; each ack only moves its own download"""
+        import eventlet
+        alice = self.request(chat_server, 1, eio_sid='eio1')
+        bob = self.request(chat_server, 1, eio_sid='eio2')
+        eventlet.sleep(0.05)
+        assert set(chat_server.downloads) == {(alice, 'c' * 32), (bob, 'c' * 32)}
+        assert chat_server.file_refs == {'b' * 32: 2}
+
+        chat_server.sio.handlers['/']['download_ack'](bob, {'transfer_id': 'c' * 32, 'offset': 100})
+        eventlet.sleep(0.05)
+        chunks = [call.args[0] for call in chat_server.send.call_args_list if call.args[1] == 'incoming_file_chunk']
+        assert chunks.count(bob) == 10 and chunks.count(alice) == 1
+        assert list(chat_server.downloads) == [(alice, 'c' * 32)]
+        print("✅ Per-session download ID test passed")
+
 # Simple standalone test
 def test_simple_math():
     """Simple test to verify pytest is working"""
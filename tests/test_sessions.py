@@ -0,0 +1,132 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.sessions import Session, SessionTable, SessionField, deep_size, memory_report
+
+TOKEN = "s3cret-admin-token"
+
+class TestSession:
+    def test_slots_and_item_access(self):
+        """Sessions have no __dict__, but still read like the old user dicts"""
+        session = Session('sid1')
+        assert not hasattr(session, '__dict__')
+        session['username'] = 'alice'
+        assert session['sid'] == 'sid1' and session.username == 'alice'
+        assert session.get('public_key') is None and session.get('public_key', 'none') == 'none'
+        with pytest.raises(KeyError):
+            session['nickname']
+        with pytest.raises(AttributeError):
+            session.nickname = 'x'
+        print("✅ Session slots test passed")
+
+    def test_field_views(self):
+        table = SessionTable()
+        keys = SessionField(table, 'aes_key')
+        keys['sid1'] = b'k'
+        assert 'sid1' in table and keys['sid1'] == b'k'
+        assert 'sid2' not in keys and keys.get('sid2') is None
+        table.open('sid2')
+        assert list(keys) == ['sid1'] and len(keys) == 1
+        assert keys.pop('sid1') == b'k' and 'sid1' not in keys
+        assert 'sid1' in table  # Only the field is cleared; the session is closed by its owner
+        assert table.close('sid1').sid == 'sid1' and table.close('sid1') is None
+        assert (table.opened, table.closed) == (2, 1)
+        print("✅ Session field view test passed")
+
+    def test_orphans(self):
+        table = SessionTable()
+        table.open('live')
+        table.open('gone')
+        assert table.orphans(lambda sid: sid == 'live') == ['gone']
+        print("✅ Orphan detection test passed")
+
+    def test_deep_size(self):
+        session = Session('sid1')
+        base = deep_size(session)
+        session.aes_key = b'k' * 1000
+        assert deep_size(session) >= base + 1000
+        session.outbound = Mock()  # Callables (and mocks) are shared code, not session memory
+        assert deep_size(session) >= base + 1000
+        shared = b'x' * 5000
+        seen = set()
+        assert deep_size([shared], seen) > 5000 and deep_size([shared], seen) < 5000
+        print("✅ Deep size test passed")
+
+    def test_report(self):
+        report = memory_report({'a': {'session': 100, 'uploads': 900}, 'b': {'session': 100, 'uploads': 0}}, limit=1)
+        assert report['total_bytes'] == 1100 and report['mean_bytes'] == 550
+        assert report['projected_bytes'] == 550 * report['projected_sessions']
+        assert report['parts'] == {'session': 200, 'uploads': 900}
+        assert [item['sid'] for item in report['largest']] == ['a']
+        assert memory_report({})['mean_bytes'] == 0
+        print("✅ Memory report test passed")
+
+class TestServerSessions:
+    @pytest.fixture
+    def chat_server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(tmp_path)):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:", admin_token=TOKEN)
+            yield server
+            server.disk.shutdown()
+
+    def connect(self, server, eio_sid):
+        sid = server.sio.manager.connect(eio_sid, '/')
+        server.sio.handlers['/']['connect'](sid, {})
+        return sid
+
+    def test_key_without_join_is_freed(self, chat_server):
+        """A client that exchanges a key and leaves without joining leaves nothing behind"""
+        sid = self.connect(chat_server, 'eio1')
+        chat_server.aes_keys[sid] = b'k' * 32
+        chat_server.sio.handlers['/']['disconnect'](sid)
+        assert len(chat_server.sessions) == 0 and sid not in chat_server.aes_keys and sid not in chat_server.outbound
+        print("✅ Unjoined key cleanup test passed")
+
+    def test_join_leave_disconnect(self, chat_server):
+        handlers = chat_server.sio.handlers['/']
+        sid = self.connect(chat_server, 'eio1')
+        chat_server.aes_keys[sid] = b'k' * 32
+        assert handlers['user_joined'](sid, {'username': 'alice'})['status'] == 'ok'
+        session = chat_server.sessions.get(sid)
+        assert chat_server.users == [session] and session.aes_key == b'k' * 32 and session.resume_token
+
+        handlers['user_left'](sid, {'username': 'alice'})
+        assert chat_server.users == [] and session.aes_key is None and session.username is None
+        assert sid in chat_server.outbound  # Still connected
+
+        handlers['disconnect'](sid)
+        assert len(chat_server.sessions) == 0 and session.outbound.closed
+        print("✅ Session lifecycle test passed")
+
+    def test_orphans_swept(self, chat_server):
+        chat_server.aes_keys['ghost'] = b'k'  # Never connected, e.g. left behind by a racing handler
+        sid = self.connect(chat_server, 'eio1')
+        assert chat_server.close_orphaned_sessions() == 1
+        assert list(chat_server.sessions) == [sid]
+        print("✅ Orphan sweep test passed")
+
+    def test_memory_report_admin(self, chat_server):
+        admin = chat_server.sio.handlers['/admin']
+        assert admin['memory_report']('adm1')['reason'] == 'unauthorized'
+        admin['connect']('adm1', {}, {'token': TOKEN})
+
+        handlers = chat_server.sio.handlers['/']
+        for i in range(3):
+            sid = self.connect(chat_server, f'eio{i}')
+            chat_server.aes_keys[sid] = b'k' * 32
+            handlers['user_joined'](sid, {'username': f'user{i}'})
+
+        reply = admin['memory_report']('adm1', {'limit': 2})
+        report = reply['report']
+        assert reply['status'] == 'ok' and report['sessions'] == 3 and report['joined'] == 3
+        assert report['mean_bytes'] > 0 and len(report['largest']) == 2
+        assert set(report['parts']) == {'session', 'uploads', 'rate_limits', 'replay'}
+        print("✅ Admin memory report test passed")
@@ -0,0 +1,187 @@
+import pytest
+import sys
+import os
+import base64
+import hashlib
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.snapshot import write_snapshot, read_snapshot
+from server.encryption import generate_aes_key, encrypt_aes_raw
+
+class TestSnapshot:
+    def test_roundtrip_is_one_shot(self, tmp_path):
+        """Bytes survive the JSON snapshot, which is deleted once read"""
+        path = str(tmp_path / "snap.json")
+        state = {'sessions': [{'aes_key': b'\x00\xff', 'entries': [[1, 'e', {'key': b'k'}]]}]}
+        write_snapshot(path, state)
+        assert oct(os.stat(path).st_mode & 0o777) == '0o600'
+        assert read_snapshot(path) == state
+        assert not os.path.exists(path)
+        print("✅ Snapshot roundtrip test passed")
+
+    def test_stale_snapshot_ignored(self, tmp_path):
+        path = str(tmp_path / "snap.json")
+        write_snapshot(path, {'sessions': []})
+        assert read_snapshot(path, max_age=10, now=os.path.getmtime(path) + 60) is None
+        print("✅ Stale snapshot test passed")
+
+class TestRestartHandoff:
+    @pytest.fixture
+    def env(self, tmp_path):
+        uploads = tmp_path / "uploads"
+        uploads.mkdir()
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.flush_logs'), \
+             patch('server.server.UPLOAD_FOLDER', str(uploads)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+
+            def make_server():
+                server = ChatServer(inbox_path=str(tmp_path / "inbox.db"), snapshot_path=str(tmp_path / "snap.json"))
+                server.quotas = UploadQuotas(str(uploads), min_free_disk=0)
+                server.send = Mock(return_value=True)
+                return server
+            yield make_server
+
+    def join(self, server, key, resume=None):
+        sid = server.sio.manager.connect('eio1', '/')
+        server.aes_keys[sid] = key
+        server.outbound[sid] = Mock(depth=0)
+        data = {'username': 'alice'}
+        if resume:
+            data['resume'] = resume
+        return sid, server.sio.handlers['/']['user_joined'](sid, data)
+
+    def chunk(self, server, sid, transfer_id, data):
+        server.sio.handlers['/']['upload_chunk'](sid, {'transfer_id': transfer_id,
+                                                       'chunk_data': base64.b64encode(data).decode()})
+
+    def test_upload_survives_restart(self, env):
+        """A restarted server restores the session key and resumes a checkpointed upload"""
+        payload = os.urandom(100)
+        transfer_id = 'e' * 32
+        key = generate_aes_key()
+
+        old = env()
+        sid, joined = self.join(old, key)
+        handlers = old.sio.handlers['/']
+        assert handlers['start_upload'](sid, {'transfer_id': transfer_id, 'filename': 'x.bin', 'filesize': 100})['status'] == 'ok'
+        self.chunk(old, sid, transfer_id, payload[:40])
+
+        assert old.shutdown(drain_timeout=0) == 1
+        assert any(call.args[1] == 'server_restarting' for call in old.send.call_args_list)
+        assert old.upload_files == {}
+        assert handlers['connect']('late', {}) is False
+        assert handlers['start_upload'](sid, {'transfer_id': 'f' * 32, 'filename': 'y', 'filesize': 1})['reason'] == 'server_shutting_down'
+
+        new = env()
+        new.restore_snapshot()
+        token = joined['resume_token']
+        handlers = new.sio.handlers['/']
+        sid = new.sio.manager.connect('eio2', '/')
+        assert handlers['resume_session'](sid, {'token': token, 'proof': b'0' * 32})['reason'] == 'bad_proof'
+        assert handlers['resume_session'](sid, {'token': token, 'proof': encrypt_aes_raw(key, token.encode())}) == {'status': 'ok'}
+        assert new.aes_keys[sid] == key  # No RSA handshake needed
+
+        reply = handlers['user_joined'](sid, {'username': 'alice', 'resume': {'token': token, 'dseq': 0}})
+        assert reply['resumed']
+        resume = next(call.args[2] for call in new.send.call_args_list if call.args[1] == 'upload_resume')
+        assert resume == {'transfer_id': transfer_id, 'offset': 40}
+
+        self.chunk(new, sid, transfer_id, payload[40:])
+        handlers['finish_upload'](sid, {'transfer_id': transfer_id, 'hash_file': hashlib.sha256(payload).hexdigest()})
+        assert transfer_id in new.stored_files
+        print("✅ Restart handoff test passed")
+
+    def test_construction_leaves_snapshot(self, env, tmp_path):
+        """Only an explicit restore reads (and so deletes) the snapshot"""
+        old = env()
+        self.join(old, generate_aes_key())
+        old.shutdown(drain_timeout=0)
+        assert os.path.exists(tmp_path / "snap.json")
+
+        new = env()
+        assert os.path.exists(tmp_path / "snap.json") and len(new.deliveries.sessions) == 0
+        new.restore_snapshot()
+        assert not os.path.exists(tmp_path / "snap.json") and len(new.deliveries.sessions) == 1
+        print("✅ Explicit restore test passed")
+
+    def test_unreservable_upload_deleted(self, env, tmp_path):
+        """A checkpointed upload that no longer fits the quotas is deleted on restore, not left for the GC"""
+        from server.quotas import UploadQuotas
+        old = env()
+        sid, _ = self.join(old, generate_aes_key())
+        old.sio.handlers['/']['start_upload'](sid, {'transfer_id': 'e' * 32, 'filename': 'x.bin', 'filesize': 100})
+        path = old.upload_files['e' * 32]['path']
+        self.chunk(old, sid, 'e' * 32, b'x' * 40)
+        old.shutdown(drain_timeout=0)
+        assert os.path.exists(path)
+
+        new = env()
+        new.quotas = UploadQuotas(str(tmp_path / "uploads"), max_file_size=50, min_free_disk=0)
+        new.restore_snapshot()
+        assert new.suspended_uploads == {} and new.quotas.total == 0
+        assert not os.path.exists(path)
+        print("✅ Unreservable upload cleanup test passed")
+
+    def test_client_resumes_after_rejoin(self, env):
+        """The client's upload waits for upload_resume even when the rejoin completes first"""
+        import threading
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+        from gui import ChatClientGUI
+        from config import ClientConfig
+        from transfer_manager import TransferManager, Transfer
+        from server.transfers import stored_path
+
+        payload = os.urandom(100)
+        transfer_id = 'e' * 32
+        key = generate_aes_key()
+        old = env()
+        sid, joined = self.join(old, key)
+        current = {'server': old, 'sid': sid, 'chunks': 0}
+
+        def restart():
+            client.restart_generation += 1  # server_restarting
+            old.shutdown(drain_timeout=0)
+            new = env()
+            new.restore_snapshot()
+            new_sid, _ = self.join(new, key, resume={'token': joined['resume_token'], 'dseq': 0})
+            current.update(server=new, sid=new_sid)
+            # The rejoin has finished before the upload thread looks; upload_resume is what it waits for
+            offset = next(call.args[2]['offset'] for call in new.send.call_args_list if call.args[1] == 'upload_resume')
+            client.upload_resumes[transfer_id] = {'event': threading.Event(), 'offset': offset}
+            client.upload_resumes[transfer_id]['event'].set()
+
+        class Loopback:
+            def call(self, event, data):
+                return current['server'].sio.handlers['/'][event](current['sid'], data)
+
+            def emit(self, event, data, **kwargs):
+                current['server'].sio.handlers['/'][event](current['sid'], data)
+                if event == 'upload_chunk':
+                    current['chunks'] += 1
+                    if current['chunks'] == 2:
+                        restart()
+
+        client = ChatClientGUI.__new__(ChatClientGUI)  # No window: only the upload path runs
+        client.sio, client.username = Loopback(), 'alice'
+        client.config = ClientConfig(chunk_size=20, upload_resume_wait=1)
+        client.restart_generation = 0
+        client.upload_resumes = {}
+        client.transfers = TransferManager(bandwidth=None)
+        client.transfers.transfers[transfer_id] = Transfer(transfer_id, 'upload', 'x.bin', len(payload))
+        path = os.path.join(os.path.dirname(old.upload_folder), "x.bin")
+        with open(path, 'wb') as f:
+            f.write(payload)
+
+        with patch('gui.messagebox.showerror') as showerror, patch('gui.time.sleep'):
+            client.send_file_w_progressbar(path, 'Global', transfer_id)
+        assert not showerror.called
+        assert transfer_id in current['server'].stored_files
+        with open(stored_path(old.upload_folder, transfer_id, 'x.bin'), 'rb') as f:
+            assert f.read() == payload
+        print("✅ Client resume after rejoin test passed")
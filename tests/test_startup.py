@@ -0,0 +1,54 @@
+import sys
+import os
+import subprocess
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client.backoff import backoff_delay, CONNECT_BACKOFF_BASE, CONNECT_BACKOFF_MAX
+
+class TestBackoff:
+    def test_exponential_with_cap(self):
+        """The upper bound doubles per attempt until it reaches the cap"""
+        bounds = [backoff_delay(attempt, rand=lambda: 1.0) for attempt in range(10)]
+        assert bounds[:3] == [CONNECT_BACKOFF_BASE, CONNECT_BACKOFF_BASE * 2, CONNECT_BACKOFF_BASE * 4]
+        assert bounds[-1] == CONNECT_BACKOFF_MAX
+        assert backoff_delay(100, rand=lambda: 1.0) == CONNECT_BACKOFF_MAX
+        print("✅ Backoff cap test passed")
+
+    def test_full_jitter(self):
+        delays = {backoff_delay(4) for _ in range(50)}
+        assert len(delays) > 1
+        assert all(0 <= delay <= CONNECT_BACKOFF_BASE * 16 for delay in delays)
+        print("✅ Backoff jitter test passed")
+
+class TestConnectionStatus:
+    def test_status_handed_to_tk_thread(self):
+        """The connect thread only schedules the update; the Tk thread applies it"""
+        from unittest.mock import Mock
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+        from gui import ChatClientGUI
+        client = ChatClientGUI.__new__(ChatClientGUI)  # No window: Window is a stand-in
+        client.Window = Mock()
+        client.signal_connection("retrying", 2.5)
+        client.Window.event_generate.assert_not_called()
+        client.Window.after.assert_called_once_with(0, client.on_connection_status, "retrying", 2.5)
+
+        client.status_label = Mock()
+        client.on_connection_status("retrying", 2.5)
+        assert client.connection_status == "retrying"
+        assert client.status_label.config.call_args.kwargs['text'] == "Server unreachable, retrying in 3s..."
+        print("✅ Connection status handoff test passed")
+
+class TestLazyLogger:
+    def test_import_does_not_open_database(self, tmp_path):
+        """Importing the logger creates nothing; the first event does"""
+        path = tmp_path / "logs.db"
+        code = ("import sys, os; sys.path.insert(0, os.getcwd()); import logs.db_logger as l; "
+                f"l.DB_PATH = {str(path)!r}; print(l.conn is None); l.flush_logs(); "
+                "print(os.path.exists(l.DB_PATH)); l.log_event('client', 'test', 'hello'); "
+                "print(os.path.exists(l.DB_PATH)); l.close_logger()")
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        assert out.stdout.split() == ['True', 'False', 'True']
+        print("✅ Lazy logger test passed")
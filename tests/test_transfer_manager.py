@@ -0,0 +1,78 @@
+import sys
+import os
+import threading
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from client.transfer_manager import TransferManager
+from server.transfers import valid_transfer_id, safe_filename, stored_path
+
+class TestTransferManager:
+    def test_same_filename_gets_distinct_ids(self):
+        """Two transfers of the same file never share an ID"""
+        manager = TransferManager(bandwidth=None)
+        done = threading.Event()
+        first = manager.submit('upload', 'photo.png', 10, lambda t: None)
+        second = manager.submit('upload', 'photo.png', 10, lambda t: done.set())
+        done.wait(timeout=2)
+
+        assert first != second
+        assert valid_transfer_id(first) and valid_transfer_id(second)
+        print("✅ Distinct transfer ID test passed")
+
+    def test_concurrency_limit(self):
+        """No more than max_concurrent transfers run at once"""
+        manager = TransferManager(max_concurrent=2, bandwidth=None)
+        release = threading.Event()
+        lock = threading.Lock()
+        running = {'now': 0, 'peak': 0}
+        finished = threading.Semaphore(0)
+
+        def run(transfer):
+            with lock:
+                running['now'] += 1
+                running['peak'] = max(running['peak'], running['now'])
+            release.wait(timeout=2)
+            with lock:
+                running['now'] -= 1
+            finished.release()
+
+        for i in range(5):
+            manager.submit('upload', f'file{i}.png', 10, run)
+        release.set()
+        for _ in range(5):
+            assert finished.acquire(timeout=2)
+
+        assert running['peak'] == 2
+        print("✅ Concurrency limit test passed")
+
+    def test_bandwidth_is_shared(self):
+        """Active transfers split the bandwidth by weight"""
+        manager = TransferManager(bandwidth=300)
+        heavy = manager.submit('upload', 'a.png', 10, lambda t: None, weight=2)
+        light = manager.submit('upload', 'b.png', 10, lambda t: None)
+        manager.active = {heavy, light}
+
+        assert manager.share(manager.get(heavy)) == 200
+        assert manager.share(manager.get(light)) == 100
+        print("✅ Bandwidth share test passed")
+
+    def test_progress_callback(self):
+        """Progress callbacks see the running byte count"""
+        manager = TransferManager(bandwidth=None)
+        seen = []
+        transfer_id = manager.submit('upload', 'a.png', 100, lambda t: None, on_progress=lambda t: seen.append(t.percent))
+        manager.progress(transfer_id, 50)
+        manager.progress(transfer_id, 50)
+
+        assert seen == [50, 100]
+        print("✅ Progress callback test passed")
+
+def test_stored_path_is_confined():
+    """Client filenames cannot escape the upload folder"""
+    assert safe_filename("../../etc/passwd") == "passwd"
+    assert stored_path("upload_files", "a" * 32, "..\\x.png") == os.path.join("upload_files", "a" * 32 + "_x.png")
+    assert not valid_transfer_id("../x")
+    assert not valid_transfer_id("a" * 32 + "\n")  # $ alone would allow a trailing newline
+    print("✅ Stored path test passed")
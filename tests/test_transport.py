@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+import base64
+import json
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.transport import server_options, transports, max_buffer_size, without_deflate, CHUNK_SIZE
+
+class TestTransportSettings:
+    def test_modes(self):
+        assert transports("websocket") == ["websocket"]
+        assert transports("upgrade") == ["polling", "websocket"]
+        with pytest.raises(ValueError):
+            transports("carrier-pigeon")
+        print("✅ Transport modes test passed")
+
+    def test_buffer_fits_one_upload_chunk(self):
+        """The inbound packet limit is sized for an upload chunk, not the 1 MB default"""
+        packet = '42' + json.dumps(['upload_chunk', {'transfer_id': 'a' * 32, 'compressed': False,
+                                                      'chunk_data': base64.b64encode(os.urandom(CHUNK_SIZE)).decode()}])
+        assert len(packet) < max_buffer_size() < 1000000
+        assert server_options("websocket")['max_http_buffer_size'] == max_buffer_size()
+        assert server_options("polling")['max_http_buffer_size'] >= 1000000  # Polling batches packets
+        print("✅ Buffer size test passed")
+
+    def test_deflate_offer_hidden(self):
+        seen = {}
+        app = without_deflate(lambda environ, start_response: seen.update(environ))
+        app({'HTTP_SEC_WEBSOCKET_EXTENSIONS': 'permessage-deflate; client_max_window_bits'}, None)
+        assert 'HTTP_SEC_WEBSOCKET_EXTENSIONS' not in seen
+        app({'HTTP_SEC_WEBSOCKET_EXTENSIONS': 'permessage-deflate, x-other'}, None)
+        assert seen['HTTP_SEC_WEBSOCKET_EXTENSIONS'].strip() == 'x-other'
+        print("✅ Deflate offer test passed")
+
+    def test_server_is_websocket_only_by_default(self):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=":memory:")
+            assert server.sio.eio.transports == ["websocket"]
+            assert server.sio.eio.ping_interval == 10
+            upgrade = ChatServer(inbox_path=":memory:", transport_mode="upgrade")
+            assert upgrade.sio.eio.transports == ["polling", "websocket"]
+        print("✅ Server transport test passed")
+
+class TestUploadChunkLimit:
+    def test_client_clamps_to_server_chunk_size(self, tmp_path):
+        """A client configured for bigger chunks than the server's limit sends the server's size"""
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+        from gui import ChatClientGUI
+        from config import ClientConfig
+        from transfer_manager import TransferManager, Transfer
+
+        uploads = tmp_path / "uploads"
+        uploads.mkdir()
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'), \
+             patch('server.server.UPLOAD_FOLDER', str(uploads)):
+            from server.server import ChatServer
+            from server.quotas import UploadQuotas
+            server = ChatServer(inbox_path=":memory:", chunk_size=4096)
+            server.quotas = UploadQuotas(str(uploads), min_free_disk=0)
+            server.users = [{'sid': 'sid1', 'username': 'alice', 'aes_key': b'k'}]
+            server.send = Mock(return_value=True)
+            handlers = server.sio.handlers['/']
+            sizes = []
+
+            class Loopback:
+                def call(self, event, data):
+                    return handlers[event]('sid1', data)
+
+                def emit(self, event, data, **kwargs):
+                    if event == 'upload_chunk':
+                        sizes.append(len(base64.b64decode(data['chunk_data'])))
+                    handlers[event]('sid1', data)
+
+            client = ChatClientGUI.__new__(ChatClientGUI)  # No window: only the upload path runs
+            client.sio, client.username = Loopback(), 'alice'
+            client.config = ClientConfig(chunk_size=65536)
+            client.restart_generation = 0
+            client.transfers = TransferManager(bandwidth=None)
+            transfer_id = 'a' * 32
+            client.transfers.transfers[transfer_id] = Transfer(transfer_id, 'upload', 'x.png', 10000)
+            payload = os.urandom(10000)
+            path = tmp_path / "x.png"
+            path.write_bytes(payload)
+
+            with patch('gui.messagebox.showerror') as showerror, patch('gui.time.sleep'):
+                client.send_file_w_progressbar(str(path), 'Global', transfer_id)
+            server.disk.shutdown()
+        assert not showerror.called
+        assert sizes == [4096, 4096, 1808]
+        assert transfer_id in server.stored_files
+        print("✅ Upload chunk clamp test passed")
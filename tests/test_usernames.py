@@ -0,0 +1,97 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.usernames import UsernameRegistry, valid_username
+
+class TestUsernameRegistry:
+    def test_claim_is_exclusive(self):
+        registry = UsernameRegistry()
+        assert registry.claim('alice', 's1') is None
+        assert registry.claim('alice', 's1') is None  # Claiming again is harmless
+        assert registry.claim('alice', 's2') == 'username_taken'
+        assert registry.claim('bad name', 's2') == 'invalid_username'
+        print("✅ Exclusive claim test passed")
+
+    def test_one_name_per_connection(self):
+        registry = UsernameRegistry()
+        registry.claim('alice', 's1')
+        registry.claim('alicia', 's1')
+        assert 'alice' not in registry and registry.holder('alicia') == 's1'
+        print("✅ One name per connection test passed")
+
+    def test_detached_name_kept_for_resume_token(self):
+        registry = UsernameRegistry()
+        registry.claim('alice', 's1')
+        registry.bind('s1', 'tok')
+        registry.detach('s1')
+        alive = {'tok'}
+        assert registry.claim('alice', 's2', token_alive=alive.__contains__) == 'username_taken'
+        assert registry.claim('alice', 's3', 'tok', alive.__contains__) is None
+
+        registry.detach('s3')
+        alive.clear()
+        assert registry.expire(alive.__contains__) == 1
+        assert registry.claim('alice', 's2') is None
+        print("✅ Resume reservation test passed")
+
+    def test_unjoined_claim_freed_on_disconnect(self):
+        registry = UsernameRegistry()
+        registry.claim('alice', 's1')
+        registry.detach('s1')
+        assert registry.claim('alice', 's2') is None
+        print("✅ Unjoined claim test passed")
+
+    def test_validation_matches_client_rules(self):
+        assert valid_username('Bob42')
+        assert not valid_username('') and not valid_username('a' * 16) and not valid_username('a_b')
+        assert not valid_username('Bob42\n')
+        print("✅ Username validation test passed")
+
+class TestServerUsernames:
+    @pytest.fixture
+    def server(self, tmp_path):
+        with patch('server.encryption.load_rsa_private_key', return_value=Mock()), \
+             patch('server.server.log_event'):
+            from server.server import ChatServer
+            server = ChatServer(inbox_path=str(tmp_path / "inbox.db"))
+            server.send = Mock(return_value=True)
+            server.broadcast = Mock()
+            yield server
+
+    def connect(self, server):
+        sid = server.sio.manager.connect(os.urandom(4).hex(), '/')
+        server.aes_keys[sid] = b'k' * 32
+        return sid
+
+    def test_race_for_same_name(self, server):
+        """Only the first of two clients claiming a name gets it, without any roster on the wire"""
+        handlers = server.sio.handlers['/']
+        a, b = self.connect(server), self.connect(server)
+        assert handlers['claim_username'](a, {'username': 'alice'}) == {'status': 'ok'}
+        assert handlers['claim_username'](b, {'username': 'alice'}) == {'status': 'rejected', 'reason': 'username_taken'}
+        # Skipping the claim does not help either
+        assert handlers['user_joined'](b, {'username': 'alice'})['reason'] == 'username_taken'
+        assert b in server.aes_keys  # Can still join under another name
+        assert handlers['user_joined'](a, {'username': 'alice'})['status'] == 'ok'
+        print("✅ Username race test passed")
+
+    def test_name_survives_reconnect_and_frees_on_leave(self, server):
+        handlers = server.sio.handlers['/']
+        a = self.connect(server)
+        handlers['claim_username'](a, {'username': 'alice'})
+        token = handlers['user_joined'](a, {'username': 'alice'})['resume_token']
+        handlers['disconnect'](a)
+
+        b = self.connect(server)
+        assert handlers['claim_username'](b, {'username': 'alice'})['reason'] == 'username_taken'
+        a2 = self.connect(server)
+        assert handlers['user_joined'](a2, {'username': 'alice', 'resume': {'token': token, 'dseq': 0}})['resumed']
+
+        handlers['user_left'](a2, {'username': 'alice'})
+        assert handlers['claim_username'](b, {'username': 'alice'}) == {'status': 'ok'}
+        print("✅ Username reconnect test passed")